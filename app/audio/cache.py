@@ -0,0 +1,155 @@
+import contextlib, hashlib, json, os, pathlib, shutil, tempfile, threading, time, unicodedata
+from app.utils.cache import asset_digest
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+def normalize_text(text):
+    """NFC + collapsed whitespace, so re-flowed script lines still hit the same entry."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+class TTSCache:
+    """
+    Shared on-disk cache of synthesized WAVs, safe to use from several jobs/processes at once.
+
+    Entries are keyed by engine, voice (model / history-prompt file hash), normalized text and
+    sample rate. Hits refresh the entry's mtime, and once the directory exceeds `max_bytes`
+    the least recently used entries are evicted. The size is tracked as a running total (one
+    directory scan per instance, then per store), so the directory is only rescanned when the
+    total crosses the budget; that rescan also picks up entries other processes wrote. Hit/miss/eviction counters are kept per
+    instance and accumulated in `stats.json` next to the entries.
+    """
+
+    def __init__(self, root, max_bytes=2 * 1024**3):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()       # counters
+        self._disk_lock = threading.Lock()  # threads of this process; the flock covers other processes
+        self._bytes = None                  # running size estimate; None until the first scan
+
+    def key(self, text, engine, voice=None, sample_rate=None):
+        payload = json.dumps({"engine": engine.lower(), "voice": voice, "voice_file": asset_digest(voice),
+                              "text": normalize_text(text), "sample_rate": sample_rate}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry(self, key):
+        return self.root / key[:2] / f"{key}.wav"
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Cross-process lock for eviction and stats updates."""
+        with self._disk_lock, open(self.root / ".lock", "a+b") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def fetch(self, key, out_wav):
+        """Copy the cached WAV to out_wav. Returns False on a miss."""
+        entry = self._entry(key)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(out_wav)), exist_ok=True)
+            shutil.copyfile(entry, out_wav)
+        except FileNotFoundError:  # absent, or evicted between lookup and copy
+            self._count("misses")
+            return False
+        now = time.time()
+        with contextlib.suppress(OSError):
+            os.utime(entry, (now, now))
+        self._count("hits")
+        return True
+
+    def _scan(self):
+        entries = []
+        for p in self.root.glob("*/*.wav"):
+            with contextlib.suppress(FileNotFoundError):
+                st = p.stat()
+                entries.append((st.st_mtime, st.st_size, p))
+        return entries
+
+    def store(self, key, wav_path):
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        if self._bytes is None:
+            with self._locked():
+                self._bytes = sum(size for _, size, _ in self._scan())
+        try:
+            replaced = entry.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, suffix=".part")
+        os.close(fd)
+        try:
+            shutil.copyfile(wav_path, tmp)
+            os.replace(tmp, entry)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._count("stores")
+        with self._lock:
+            self._bytes += os.path.getsize(wav_path) - replaced
+            over = self._bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        with self._locked():
+            entries = self._scan()
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    p.unlink()
+                    evicted += 1
+                total -= size
+            with self._lock:
+                self._bytes = total
+        if evicted:
+            self._count("evictions", evicted)
+        return evicted
+
+    def flush_stats(self):
+        """Add this instance's counters to the shared stats.json and reset them. Returns the totals."""
+        with self._locked():
+            path = self.root / "stats.json"
+            totals = {}
+            if path.exists():
+                with contextlib.suppress(ValueError):
+                    totals = json.loads(path.read_text(encoding="utf-8"))
+            with self._lock:
+                for name, n in self.stats.items():
+                    totals[name] = totals.get(name, 0) + n
+                    self.stats[name] = 0
+            totals["bytes"] = sum(p.stat().st_size for p in self.root.glob("*/*.wav"))
+            path.write_text(json.dumps(totals, indent=2), encoding="utf-8")
+        return totals
+
+
+def default_tts_cache():
+    """TTS cache configured via AI_SHORTS_TTS_CACHE (directory) and AI_SHORTS_TTS_CACHE_MB (budget), else None."""
+    root = os.getenv("AI_SHORTS_TTS_CACHE")
+    if not root:
+        return None
+    return TTSCache(root, max_bytes=float(os.getenv("AI_SHORTS_TTS_CACHE_MB", "2048")) * 1024**2)
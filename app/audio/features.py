@@ -0,0 +1,118 @@
+import collections, functools, hashlib, json, os, pathlib, tempfile, threading
+import numpy as np
+import soundfile as sf
+from app.utils.cache import file_digest
+
+SAMPLE_RATE = 16000
+# Wav2Lip and SadTalker share these audio hparams (hparams.py in both repos)
+MEL_PARAMS = {"n_fft": 800, "hop_size": 200, "win_size": 800, "num_mels": 80, "fmin": 55, "fmax": 7600,
+              "preemphasis": 0.97, "min_level_db": -100, "ref_level_db": 20, "max_abs_value": 4.0}
+
+def duration_sec(path):
+    """Duration from the file header only; formats libsndfile can't open fall back to ffprobe."""
+    try:
+        return sf.info(path).duration
+    except RuntimeError:
+        from app.video.assemble import probe_duration
+        return probe_duration(path)
+
+@functools.lru_cache(maxsize=1)
+def _mel_basis():
+    import librosa
+    p = MEL_PARAMS
+    return librosa.filters.mel(sr=SAMPLE_RATE, n_fft=p["n_fft"], n_mels=p["num_mels"], fmin=p["fmin"], fmax=p["fmax"])
+
+def melspectrogram(wav):
+    """(num_mels, T) normalized log-mel, identical to Wav2Lip's / SadTalker's audio.melspectrogram."""
+    import librosa
+    from scipy import signal
+    p = MEL_PARAMS
+    D = librosa.stft(y=signal.lfilter([1, -p["preemphasis"]], [1], wav), n_fft=p["n_fft"],
+                     hop_length=p["hop_size"], win_length=p["win_size"])
+    min_level = np.exp(p["min_level_db"] / 20 * np.log(10))
+    S = 20 * np.log10(np.maximum(min_level, np.dot(_mel_basis(), np.abs(D)))) - p["ref_level_db"]
+    m = p["max_abs_value"]
+    return np.clip((2 * m) * ((S - p["min_level_db"]) / (-p["min_level_db"])) - m, -m, m)
+
+
+class AudioFeatures:
+    """
+    Shared audio front-end for one process: each WAV is decoded once at 16 kHz and its mel spectrogram
+    computed once, both kept in a small in-memory LRU. With cache_dir the mels also persist on disk,
+    keyed by file content and mel parameters. Passed to the lip-sync engines as `audio_features`.
+    """
+
+    def __init__(self, cache_dir=None, max_items=16):
+        self.root = pathlib.Path(cache_dir) if cache_dir else None
+        if self.root is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+        self.max_items = max_items
+        self._mem = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _memo(self, key, compute):
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                return self._mem[key]
+        value = compute()
+        with self._lock:
+            self._mem[key] = value
+            while len(self._mem) > self.max_items:
+                self._mem.popitem(last=False)
+        return value
+
+    @staticmethod
+    def _identity(path):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+    def duration(self, path):
+        return duration_sec(path)
+
+    def num_samples(self, path):
+        """len(self.wav(path)) from the file header, without decoding or resampling."""
+        return int(np.ceil(round(self.duration(path) * SAMPLE_RATE, 6)))
+
+    def wav(self, path):
+        """Mono float32 samples at 16 kHz (read-only; shared between callers)."""
+        def load():
+            import librosa
+            wav = librosa.load(path, sr=SAMPLE_RATE)[0]
+            wav.flags.writeable = False
+            return wav
+        return self._memo(("wav", self._identity(path)), load)
+
+    def mel(self, path, fps=None):
+        """
+        (num_mels, T) mel spectrogram of path. fps first crops the audio to a whole number of video
+        frames, as SadTalker's get_data does; Wav2Lip uses the full clip.
+        """
+        return self._memo(("mel", self._identity(path), fps), lambda: self._disk_mel(path, fps))
+
+    def _disk_mel(self, path, fps):
+        entry = None
+        if self.root is not None:
+            payload = json.dumps({"audio": file_digest(path), "params": MEL_PARAMS, "fps": fps}, sort_keys=True)
+            key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+            entry = self.root / key[:2] / f"{key}.npy"
+            try:
+                return np.load(entry)
+            except (FileNotFoundError, ValueError, EOFError):
+                pass
+        wav = self.wav(path)
+        if fps:
+            per_frame = SAMPLE_RATE / fps
+            wav = wav[:int(int(len(wav) / per_frame) * per_frame)]
+        mel = melspectrogram(wav)
+        if entry is not None:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=entry.parent, suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, mel)
+                os.replace(tmp, entry)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        return mel
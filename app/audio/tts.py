@@ -1,15 +1,69 @@
-import subprocess, os, tempfile, shutil, sys, platform
+import subprocess, os, tempfile, shutil, sys, platform, json, functools
+from app.audio.workers import resident_workers
 
-def synthesize(text:str, out_wav:str, engine:str="piper", voice:str=None):
+BARK_SAMPLE_RATE = 24000  # bark.SAMPLE_RATE, without importing torch just to build a cache key
+
+@functools.lru_cache(maxsize=64)
+def _piper_sample_rate(model):
+    """audio.sample_rate from the voice's <model>.json config (piper's own convention), or None."""
+    try:
+        with open(model + ".json", "r", encoding="utf-8") as f:
+            return json.load(f)["audio"]["sample_rate"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def resolve_voice(engine, voice=None):
+    """The voice the engine will actually use: Piper falls back to the PIPER_VOICE model."""
+    if engine.lower() == "piper":
+        return voice or os.getenv("PIPER_VOICE")
+    return voice
+
+def output_sample_rate(engine, voice=None):
+    """Sample rate the engine writes for this voice (part of the TTS cache key), or None if unknown."""
+    engine = engine.lower()
+    if engine == "piper":
+        model = resolve_voice(engine, voice)
+        return _piper_sample_rate(model) if model else None
+    if engine == "bark":
+        return BARK_SAMPLE_RATE
+    return None
+
+def _cache_key(cache, text, engine, voice):
+    # the resolved model (PIPER_VOICE fallback) is hashed into the key, so another voice is never served
+    model = resolve_voice(engine, voice)
+    return cache.key(text, engine, model, sample_rate=output_sample_rate(engine, model))
+
+def synthesize(text:str, out_wav:str, engine:str="piper", voice:str=None, resident:bool=True, cache=None):
     """
     Generate speech audio to out_wav.
     Priority:
       - Piper (needs 'piper' binary and a voice model via PIPER_VOICE or `voice` path)
       - macOS 'say' fallback if available
+    resident=True routes Piper/Bark through long-lived workers (models loaded once per process);
+    the one-shot subprocess paths below remain as fallback.
+    cache: optional app.audio.cache.TTSCache; only output of the requested engine is stored.
     """
     os.makedirs(os.path.dirname(out_wav), exist_ok=True)
+    if cache is None:
+        return _synthesize(text, out_wav, engine, voice, resident)[0]
+    key = _cache_key(cache, text, engine, voice)
+    if cache.fetch(key, out_wav):
+        return out_wav
+    out_wav, used = _synthesize(text, out_wav, engine, voice, resident)
+    if used == engine.lower():
+        cache.store(key, out_wav)
+    return out_wav
+
+def _synthesize(text, out_wav, engine, voice, resident):
+    """Returns (out_wav, engine actually used)."""
     text = text or ""
 
+    if resident and engine.lower() in ("piper", "bark"):
+        try:
+            return resident_workers().synthesize(text, out_wav, engine=engine, voice=voice), engine.lower()
+        except (RuntimeError, ImportError, OSError) as e:
+            print(f"[TTS] Resident {engine} worker unavailable: {e}. Using one-shot process.", file=sys.stderr)
+
     if engine.lower() == "piper":
         piper_bin = shutil.which("piper")
         model = voice or os.getenv("PIPER_VOICE")  # e.g., en_US-amy-low.onnx
@@ -18,7 +72,7 @@ def synthesize(text:str, out_wav:str, engine:str="piper", voice:str=None):
             # Piper expects text on stdin
             try:
                 subprocess.run(cmd, input=text.encode("utf-8"), check=True)
-                return out_wav
+                return out_wav, "piper"
             except subprocess.CalledProcessError as e:
                 print(f"[TTS] Piper failed: {e}. Falling back if possible.", file=sys.stderr)
         else:
@@ -39,7 +93,7 @@ def synthesize(text:str, out_wav:str, engine:str="piper", voice:str=None):
             ]
             try:
                 subprocess.run(cmd, input=text.encode("utf-8"), check=True, env=env)
-                return out_wav
+                return out_wav, "bark"
             except subprocess.CalledProcessError as e:
                 print(f"[TTS] Bark failed: {e}. Falling back if possible.", file=sys.stderr)
         else:
@@ -63,8 +117,41 @@ def synthesize(text:str, out_wav:str, engine:str="piper", voice:str=None):
                         subprocess.run(["afconvert", "-f", "WAVE", "-d", "LEI16@16000", aiff, out_wav], check=True)
                     else:
                         raise RuntimeError("Neither ffmpeg nor afconvert available for conversion.")
-                return out_wav
+                return out_wav, "say"
             except Exception as e:
                 print(f"[TTS] macOS say fallback failed: {e}", file=sys.stderr)
 
     raise RuntimeError("No TTS path available. Install Piper + voice model, Suno's Bark or use macOS 'say'.")
+
+
+def synthesize_batch(jobs, engine:str="piper", cache=None):
+    """
+    Synthesize many (text, voice, out_wav) jobs on one resident worker per engine/voice. Cached lines
+    are served from `cache` and only the misses reach the engine; each finished line is stored as it
+    completes. If the worker can't be started or dies part-way, the remaining jobs fall back to the
+    one-shot paths.
+    """
+    all_jobs = list(jobs)
+    jobs = all_jobs
+    if cache is not None:
+        keys = {out_wav: _cache_key(cache, text, engine, voice) for text, voice, out_wav in jobs}
+        jobs = [j for j in jobs if not cache.fetch(keys[j[2]], j[2])]
+    done = set()
+    if engine.lower() in ("piper", "bark"):
+        try:
+            workers = resident_workers()
+            for text, voice, out_wav in jobs:
+                workers.synthesize(text, out_wav, engine=engine, voice=voice)
+                done.add(out_wav)
+                if cache is not None:
+                    cache.store(keys[out_wav], out_wav)
+        except (RuntimeError, ImportError, OSError) as e:
+            print(f"[TTS] Resident {engine} worker unavailable: {e}. Using one-shot processes.", file=sys.stderr)
+    for text, voice, out_wav in jobs:
+        if out_wav in done:
+            continue
+        # these already missed the cache above; go straight to the engine instead of fetching again
+        out_wav, used = _synthesize(text, out_wav, engine, voice, resident=False)
+        if cache is not None and used == engine.lower():
+            cache.store(keys[out_wav], out_wav)
+    return [out_wav for _, _, out_wav in all_jobs]
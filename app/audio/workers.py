@@ -0,0 +1,178 @@
+import json, os, shutil, subprocess, tempfile, threading, wave
+
+class PiperWorker:
+    """
+    One resident Piper voice per model, so the model is loaded once instead of once per scene.
+    With the piper-tts package (the pinned 1.3.x) the voice is loaded in-process through
+    `PiperVoice`; otherwise a long-lived `piper --json-input` process takes one JSON line
+    {"text", "output_file"} per job and prints the written path when the utterance is done.
+    Piper builds without `--json-input` raise RuntimeError so callers use the one-shot process.
+    """
+
+    def __init__(self, model, piper_bin=None):
+        self.model = model
+        if not model or not os.path.exists(model):
+            raise RuntimeError("Piper not configured (need 'piper' in PATH and voice model).")
+        self._lock = threading.Lock()
+        self._outdir = None
+        self._proc = None
+        self._voice = None
+        try:
+            from piper import PiperVoice
+            self._voice = PiperVoice.load(model)
+            return
+        except ImportError:
+            pass
+        self.piper_bin = piper_bin or shutil.which("piper")
+        if not self.piper_bin:
+            raise RuntimeError("Piper not configured (need 'piper' in PATH and voice model).")
+        if not _supports_json_input(self.piper_bin):
+            raise RuntimeError(f"{self.piper_bin} has no --json-input mode")
+        self._outdir = tempfile.mkdtemp(prefix="piper_")
+
+    def _ensure_started(self):
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = subprocess.Popen(
+                [self.piper_bin, "-m", self.model, "--json-input", "--output_dir", self._outdir],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding="utf-8", bufsize=1)
+
+    def synthesize(self, text, out_wav):
+        out_wav = os.path.abspath(out_wav)
+        with self._lock:
+            if self._voice is not None:
+                return self._synthesize_in_process(text, out_wav)
+            try:
+                self._ensure_started()
+                self._proc.stdin.write(json.dumps({"text": text, "output_file": out_wav}) + "\n")
+                self._proc.stdin.flush()
+                written = self._proc.stdout.readline().strip()
+            except OSError as e:
+                # the process died (BrokenPipeError); drop it so the next call respawns it
+                self._stop()
+                raise RuntimeError(f"Piper worker died: {e}") from e
+            if not written or not os.path.exists(out_wav):
+                self._stop()
+                raise RuntimeError(f"Piper worker failed for {out_wav} (got {written!r})")
+            return out_wav
+
+    def _synthesize_in_process(self, text, out_wav):
+        try:
+            with wave.open(out_wav, "wb") as wav_file:
+                self._voice.synthesize_wav(text, wav_file)
+        except Exception as e:
+            raise RuntimeError(f"Piper failed for {out_wav}: {e}") from e
+        return out_wav
+
+    def batch(self, jobs):
+        return [self.synthesize(text, out_wav) for text, _voice, out_wav in jobs]
+
+    def _stop(self):
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=10)
+            except Exception:
+                self._proc.kill()
+            self._proc = None
+
+    def close(self):
+        self._stop()
+        self._voice = None
+        if self._outdir:
+            shutil.rmtree(self._outdir, ignore_errors=True)
+
+
+_json_input = {}
+
+def _supports_json_input(piper_bin):
+    """Whether this piper binary takes JSON jobs on stdin (checked once per binary)."""
+    if piper_bin not in _json_input:
+        try:
+            res = subprocess.run([piper_bin, "--help"], capture_output=True, text=True, timeout=30)
+            _json_input[piper_bin] = "--json-input" in res.stdout + res.stderr
+        except (OSError, subprocess.SubprocessError):
+            _json_input[piper_bin] = False
+    return _json_input[piper_bin]
+
+
+class BarkWorker:
+    """
+    Bark in-process with the text/coarse/fine models kept resident. One instance serves every
+    history prompt; generation is serialized because Bark's global model cache isn't thread-safe.
+    """
+
+    def __init__(self, small_models=True, offload_cpu=False):
+        # Bark reads these at import time and treats any non-empty value as true
+        if small_models:
+            os.environ.setdefault("SUNO_USE_SMALL_MODELS", "True")
+        if offload_cpu:
+            os.environ.setdefault("SUNO_OFFLOAD_CPU", "True")
+        from bark import generate_audio, preload_models, SAMPLE_RATE
+        self._generate = generate_audio
+        self.sample_rate = SAMPLE_RATE
+        self._lock = threading.Lock()
+        preload_models()
+
+    def synthesize(self, text, out_wav, voice=None):
+        from scipy.io.wavfile import write as write_wav
+        with self._lock:
+            audio = self._generate(text, history_prompt=voice)
+        os.makedirs(os.path.dirname(os.path.abspath(out_wav)), exist_ok=True)
+        write_wav(out_wav, self.sample_rate, audio)
+        return out_wav
+
+    def batch(self, jobs):
+        return [self.synthesize(text, out_wav, voice) for text, voice, out_wav in jobs]
+
+    def close(self):
+        pass
+
+
+class TTSWorkers:
+    """Registry of resident engine workers, created lazily per (engine, voice model)."""
+
+    def __init__(self):
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def get(self, engine, voice=None):
+        engine = engine.lower()
+        # Bark keeps all history prompts on one set of models; Piper needs a process per voice model
+        key = ("bark", None) if engine == "bark" else (engine, voice or os.getenv("PIPER_VOICE"))
+        with self._lock:
+            if key not in self._workers:
+                if engine == "piper":
+                    self._workers[key] = PiperWorker(key[1])
+                elif engine == "bark":
+                    self._workers[key] = BarkWorker()
+                else:
+                    raise ValueError(f"No resident worker for TTS engine: {engine}")
+            return self._workers[key]
+
+    def synthesize(self, text, out_wav, engine="piper", voice=None):
+        worker = self.get(engine, voice)
+        if engine.lower() == "bark":
+            return worker.synthesize(text, out_wav, voice)
+        return worker.synthesize(text, out_wav)
+
+    def batch(self, jobs, engine="piper"):
+        """jobs: iterable of (text, voice, out_path). Returns the written paths in order."""
+        return [self.synthesize(text, out_wav, engine=engine, voice=voice) for text, voice, out_wav in jobs]
+
+    def close(self):
+        with self._lock:
+            for worker in self._workers.values():
+                worker.close()
+            self._workers.clear()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+def resident_workers():
+    """Process-wide worker registry used by tts.synthesize()."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = TTSWorkers()
+        return _default
@@ -0,0 +1,173 @@
+import hashlib, json, os, pathlib, shutil, time, traceback
+from concurrent.futures import ThreadPoolExecutor
+from app.pipeline import run_project, tts_key
+from app.utils.io import load_spec, ensure_dir
+from app.utils.cache import StageCache
+from app.utils.scheduler import StageScheduler
+from app.utils.trace import Tracer, span
+from app.audio.tts import synthesize_batch
+from app.audio.cache import default_tts_cache
+from app.video.face_swap import face_swap_batch, swap_pairs
+
+def load_specs(source):
+    """
+    Specs of a batch: every *.json in a directory, or a JSONL file whose lines are either a spec
+    object or {"spec": path, "out": path (optional)}. Returns [{"name", "spec", "path", "out"}].
+    """
+    source = pathlib.Path(source)
+    entries = []
+    if source.is_dir():
+        for path in sorted(source.glob("*.json")):
+            entries.append({"name": path.stem, "spec": load_spec(path), "path": str(path), "out": None})
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if "scenes" in item:
+                    entries.append({"name": item.get("name") or f"{source.stem}_{n:04d}", "spec": item, "path": None, "out": None})
+                else:
+                    entries.append({"name": pathlib.Path(item["spec"]).stem, "spec": load_spec(item["spec"]),
+                                    "path": item["spec"], "out": item.get("out")})
+    # names become output/workdir names, so keep them unique
+    seen = {}
+    for e in entries:
+        n = seen[e["name"]] = seen.get(e["name"], 0) + 1
+        if n > 1:
+            e["name"] = f"{e['name']}_{n}"
+    return entries
+
+def spec_digest(spec):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+def plan_tts(specs, cache, tts_cache, plan_dir):
+    """
+    Synthesize every distinct narration line of the batch once, grouped by engine so each engine/voice
+    worker loads once, and publish the WAVs under the scenes' stage-cache keys. Returns (lines, unique, synthesized).
+    """
+    lines, pending = 0, {}
+    for spec in specs:
+        for scene in spec.get("scenes", []):
+            lines += 1
+            key = tts_key(cache, scene)
+            if key in pending or cache.has(key, ".wav"):
+                pending.setdefault(key, None)
+                continue
+            voice = scene.get("voice", {})
+            pending[key] = (voice.get("engine", "piper"), scene.get("script_text", ""), voice.get("voice"))
+    todo = {key: job for key, job in pending.items() if job is not None}
+    by_engine = {}
+    for key, (engine, text, voice) in todo.items():
+        by_engine.setdefault(engine, []).append((text, voice, str(plan_dir / f"{key}.wav")))
+    ensure_dir(plan_dir)
+    for engine, jobs in by_engine.items():
+        print(f"[BATCH] TTS: {len(jobs)} line(s) on {engine}")
+        try:
+            synthesize_batch(jobs, engine=engine, cache=tts_cache)
+        except Exception as e:
+            # the specs that need these lines synthesize (and report) them in their own run
+            print(f"[BATCH] TTS prefetch on {engine} failed: {e}")
+    for key in todo:
+        wav = plan_dir / f"{key}.wav"
+        if wav.exists():
+            cache.store(key, str(wav))
+            wav.unlink()
+    return lines, len(pending), len(todo)
+
+def plan_face_swaps(specs, cache):
+    """All distinct face-swap pairs of the batch in one facefusion run. Returns (pairs, unique)."""
+    pairs = [pair for spec in specs for pair in swap_pairs(spec)]
+    unique = list(dict.fromkeys(pairs))
+    if unique:
+        try:
+            face_swap_batch(unique, cache=cache)
+        except Exception as e:
+            # only the specs using a failed pair fail, when their run retries it
+            print(f"[BATCH] Face swap prefetch failed: {e}")
+    return len(pairs), len(unique)
+
+def run_batch(source, out_dir, workdir, workers=2, use_cache=True, cache_dir=None, limits=None, single_encode=None,
+              tts_cache=None):
+    """
+    Render many specs in this process. Identical specs render once (the output is copied to the rest),
+    distinct TTS lines and face-swap pairs across all specs are produced up front through the shared
+    stage cache, and then `workers` specs render at a time through one StageScheduler, so the resident
+    TTS workers and lip-sync engines load once and the model/ffmpeg/io limits hold for the whole batch.
+    Writes <workdir>/batch_report.json with per-spec status; returns the report.
+    """
+    entries = load_specs(source)
+    root = pathlib.Path(workdir)
+    ensure_dir(root)
+    ensure_dir(out_dir)
+    cache_dir = cache_dir or os.getenv("AI_SHORTS_CACHE") or str(root / "cache")
+    cache = StageCache(cache_dir, enabled=use_cache)
+    if tts_cache is None and use_cache:
+        tts_cache = default_tts_cache()
+    scheduler = StageScheduler(limits)
+    tracer = Tracer()
+
+    primaries = {}
+    for e in entries:
+        e["out"] = e["out"] or str(pathlib.Path(out_dir) / f"{e['name']}.mp4")
+        e["digest"] = spec_digest(e["spec"])
+        primary = primaries.setdefault(e["digest"], e)
+        e["duplicate_of"] = primary["name"] if primary is not e else None
+    unique = list(primaries.values())
+    print(f"[BATCH] {len(entries)} spec(s), {len(unique)} distinct")
+
+    plan = {}
+    if use_cache:
+        with span(tracer, "tts_plan") as sp:
+            plan["tts_lines"], plan["tts_unique"], plan["tts_synthesized"] = plan_tts(
+                [e["spec"] for e in unique], cache, tts_cache, root / "_plan")
+            sp.set(**plan)
+        with span(tracer, "face_swap_plan") as sp:
+            plan["swap_pairs"], plan["swap_unique"] = plan_face_swaps([e["spec"] for e in unique], cache)
+            sp.set(swap_pairs=plan["swap_pairs"], swap_unique=plan["swap_unique"])
+    else:
+        print("[BATCH] Stage cache disabled: no cross-spec TTS / face-swap dedup")
+
+    def render(e):
+        workdir = root / e["name"]
+        ensure_dir(workdir)
+        spec_path = e["path"]
+        if spec_path is None:
+            spec_path = str(workdir / "spec.json")
+            with open(spec_path, "w", encoding="utf-8") as f:
+                json.dump(e["spec"], f, indent=2)
+        e["status"], start = "running", time.time()
+        try:
+            run_project(spec_path, e["out"], str(workdir), use_cache=use_cache, cache_dir=cache_dir,
+                        single_encode=single_encode, tts_cache=tts_cache, scheduler=scheduler)
+            e["status"] = "done"
+        except Exception as ex:
+            e["status"], e["error"] = "failed", f"{type(ex).__name__}: {ex}"
+            traceback.print_exc()
+        e["seconds"] = round(time.time() - start, 2)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="spec") as pool:
+        list(pool.map(render, unique))
+
+    for e in entries:
+        if e["duplicate_of"] is None:
+            continue
+        primary = primaries[e["digest"]]
+        e["status"], e["seconds"] = primary["status"], 0.0
+        if primary["status"] == "done":
+            ensure_dir(pathlib.Path(e["out"]).parent)
+            shutil.copyfile(primary["out"], e["out"])
+        else:
+            e["error"] = primary.get("error")
+
+    report = {"source": str(source), "workers": workers, "plan": plan,
+              "counts": {s: sum(e["status"] == s for e in entries) for s in ("done", "failed")},
+              "specs": [{k: e.get(k) for k in ("name", "path", "out", "status", "error", "seconds", "duplicate_of")}
+                        for e in entries]}
+    tracer.write_report(str(root / "batch_report.json"), **report)
+
+    for e in entries:
+        note = f" (same as {e['duplicate_of']})" if e["duplicate_of"] else ""
+        print(f"[BATCH] {e['status']:7} {e['name']}{note}" + (f": {e['error']}" if e.get("error") else ""))
+    print(f"[BATCH] {report['counts']['done']} done, {report['counts']['failed']} failed; report in {root / 'batch_report.json'}")
+    return report
@@ -0,0 +1,177 @@
+import os, pathlib, queue, shutil, threading, time, traceback, uuid
+from app.pipeline import run_project, RunCancelled
+from app.utils.trace import Tracer
+
+class QueueFull(Exception):
+    pass
+
+class JobCancelled(RunCancelled):
+    pass
+
+
+class Job:
+    """One spec render. state: queued -> running (stage) -> done | failed | cancelled."""
+
+    def __init__(self, job_id, spec_path, out_path, workdir):
+        self.id = job_id
+        self.spec_path, self.out_path, self.workdir = str(spec_path), str(out_path), str(workdir)
+        self.state = "queued"
+        self.stage = None
+        self.error = None
+        self.created = time.time()
+        self.started = self.finished = None
+        self.cancel_requested = threading.Event()
+
+    def to_dict(self):
+        return {"job_id": self.id, "state": self.state, "stage": self.stage, "error": self.error,
+                "out": self.out_path, "created": self.created, "started": self.started, "finished": self.finished}
+
+
+class JobQueue:
+    """
+    Bounded render queue served by a fixed pool of worker threads in this process.
+
+    Jobs run run_project in-process, so the resident TTS workers and lip-sync engines stay loaded
+    between jobs instead of being reloaded by a fresh generate.py per upload. submit() raises
+    QueueFull once max_queued jobs are waiting. Cancelling a queued job drops it and frees its
+    place at once; a running job stops at its next stage boundary. Only the newest keep_finished
+    finished jobs are remembered (their files stay under root). Each job's stage spans are folded
+    into stage_totals for metrics().
+    """
+
+    def __init__(self, root="runs", workers=1, max_queued=8, run_kwargs=None, keep_finished=200):
+        self.root = pathlib.Path(root)
+        self.run_kwargs = run_kwargs or {}
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        # capacity is the count of jobs in state "queued"; cancelled ones left in the queue are skipped
+        self._queue = queue.Queue()
+        self._queued = 0
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.stage_totals = {}
+        self._threads = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True) for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def _new_job_dir(self):
+        while True:
+            job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            workdir = self.root / job_id
+            try:
+                workdir.mkdir(parents=True)
+                return job_id, workdir
+            except FileExistsError:
+                continue
+
+    def submit(self, save_spec):
+        """save_spec(path) writes the uploaded spec into the new job dir. Returns the queued Job."""
+        with self._lock:
+            if self._queued >= self.max_queued:
+                raise QueueFull(f"{self.max_queued} job(s) already queued")
+            self._queued += 1  # reserve the place before the (slow) upload save
+        try:
+            job_id, workdir = self._new_job_dir()
+            spec_path = workdir / "spec.json"
+            try:
+                save_spec(spec_path)
+            except BaseException:
+                shutil.rmtree(workdir, ignore_errors=True)
+                raise
+        except BaseException:
+            with self._lock:
+                self._queued -= 1
+            raise
+        job = Job(job_id, spec_path, workdir / "out.mp4", workdir)
+        with self._lock:
+            self._jobs[job_id] = job
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in sorted(self._jobs.values(), key=lambda j: j.created)]
+
+    def counts(self):
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+        return {s: states.count(s) for s in ("queued", "running", "done", "failed", "cancelled")}
+
+    def metrics(self):
+        """Job counts plus per-stage totals (count, wall/cpu seconds, frames, bytes, cache hits) over finished jobs."""
+        with self._lock:
+            stages = {name: dict(t) for name, t in self.stage_totals.items()}
+        return {"jobs": self.counts(), "stages": stages}
+
+    def _record(self, tracer):
+        with self._lock:
+            for name, t in tracer.totals().items():
+                agg = self.stage_totals.setdefault(name, dict.fromkeys(t, 0))
+                for k, v in t.items():
+                    agg[k] = round(agg[k] + v, 4)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_requested.set()
+        with self._lock:
+            if job.state == "queued":
+                job.state, job.finished = "cancelled", time.time()
+                self._queued -= 1
+                self._prune()
+        return job
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond keep_finished. Caller holds _lock."""
+        finished = sorted((j for j in self._jobs.values() if j.state in ("done", "failed", "cancelled")),
+                          key=lambda j: j.finished or j.created)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        with self._lock:
+            if job.state != "queued":  # cancelled while waiting; its place was freed by cancel()
+                return
+            self._queued -= 1
+            job.state, job.started = "running", time.time()
+
+        def progress(stage):
+            if job.cancel_requested.is_set():
+                raise JobCancelled(job.id)
+            job.stage = stage
+
+        tracer = Tracer()
+        try:
+            run_project(job.spec_path, job.out_path, job.workdir, progress=progress, tracer=tracer, **self.run_kwargs)
+            job.state = "done"
+        except JobCancelled:
+            job.state = "cancelled"
+        except Exception as e:
+            job.state, job.error = "failed", f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+        finally:
+            job.finished = time.time()
+            self._record(tracer)
+            with self._lock:
+                self._prune()
+
+
+def default_job_queue():
+    """Queue sized by AI_SHORTS_WEB_WORKERS (default 1), AI_SHORTS_WEB_QUEUE (default 8) and AI_SHORTS_WEB_KEEP_JOBS (default 200)."""
+    return JobQueue(root=os.getenv("AI_SHORTS_RUNS", "runs"),
+                    workers=int(os.getenv("AI_SHORTS_WEB_WORKERS", "1")),
+                    max_queued=int(os.getenv("AI_SHORTS_WEB_QUEUE", "8")),
+                    keep_finished=int(os.getenv("AI_SHORTS_WEB_KEEP_JOBS", "200")))
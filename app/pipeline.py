@@ -1,69 +1,251 @@
-import os, pathlib, subprocess, sys
+import os, pathlib, subprocess, sys, threading
 from app.utils.io import load_spec, ensure_dir
-from app.audio.tts import synthesize
+from app.utils.cache import StageCache, asset_digest, file_digest
+from app.utils.scheduler import StageScheduler
+from app.utils.trace import Tracer, span
+from app.audio.tts import synthesize, resolve_voice
+from app.audio.cache import default_tts_cache
+from app.audio.features import AudioFeatures
 from app.video.montage import ken_burns_clip
 from app.video.talking_head import generate_talking_head
-from app.video.assemble import write_srt, burn_subtitles_and_watermark, concat_videos_ffmpeg
-from app.video.compress import normalize_and_compress
-from app.video.face_swap import face_swap
+from app.video.assemble import write_srt, burn_subtitles_and_watermark, concat_videos_ffmpeg, merge_srts, probe_duration, audio_duration_sec
+from app.video.compress import normalize_and_compress, encode_final
+from app.video.face_swap import face_swap_batch, swap_pairs
 
-def run_project(spec_path, out_path, workdir):
+class RunCancelled(Exception):
+    """Raised from a progress callback to stop a run; its run_report.json then says "cancelled"."""
+
+
+def tts_key(cache, scene):
+    """
+    Stage-cache key of a scene's narration WAV (shared with the batch planner). Keyed on the voice the
+    engine will really use, so switching PIPER_VOICE doesn't serve the old voice's WAVs.
+    """
+    voice = scene.get("voice", {})
+    engine = voice.get("engine","piper")
+    model = resolve_voice(engine, voice.get("voice"))
+    return cache.key("tts", text=scene.get("script_text", ""), engine=engine, voice=model, voice_file=asset_digest(model))
+
+def _lazy_face_swaps(pairs, cache, tracer, progress):
+    """
+    swapped(portrait, target) for the lip-sync stage. The first call swaps every pair of the spec in one
+    facefusion run (pairs swapped before come from the cache); a re-run whose talking-head scenes all hit
+    the stage cache never calls it, so facefusion isn't started and the swap inputs aren't hashed.
+    """
+    lock, swaps, failed = threading.Lock(), {}, []
+
+    def swapped(portrait, target):
+        with lock:
+            if failed:
+                raise failed[0]
+            if not swaps:
+                progress("face_swap")
+                try:
+                    with span(tracer, "face_swap", pairs=len(pairs)):
+                        swaps.update(face_swap_batch(pairs, cache=cache))
+                except Exception as e:
+                    failed.append(e)
+                    raise
+            return swaps[(portrait, target)]
+    return swapped
+
+def _render_scene(scene, ctx):
+    """
+    TTS -> video -> burn-in for one scene. Each stage holds a slot of its resource class.
+    Returns (scene video, scene srt or None); in single-encode mode the video is a lossless
+    intermediate and subtitles/watermark are left for the final encode.
+    """
+    tmp, cache, sched = ctx["tmp"], ctx["cache"], ctx["scheduler"]
+    fps, width, height = ctx["fps"], ctx["width"], ctx["height"]
+    spec, watermark, single = ctx["spec"], ctx["watermark"], ctx["single_encode"]
+
+    sid = scene["id"]
+    progress, tracer = ctx["progress"], ctx["tracer"]
+    mode = scene.get("mode", "narration")
+    script_text = scene.get("script_text", "")
+    voice = scene.get("voice", {})
+
+    # 1) Audio
+    progress(f"{sid}:tts")
+    audio_wav = str(tmp / f"{sid}.wav")
+    tts_engine = voice.get("engine","piper")
+    key = tts_key(cache, scene)
+    with span(tracer, "tts", scene=sid, engine=tts_engine) as sp:
+        hit = cache.fetch(key, audio_wav)
+        if not hit:
+            with sched.slot("model", sp):
+                synthesize(script_text, audio_wav, engine=tts_engine, voice=voice.get("voice"), cache=ctx["tts_cache"])
+            cache.store(key, audio_wav)
+        sp.set(cache_hit=hit, out_bytes=os.path.getsize(audio_wav))
+    frames = int(audio_duration_sec(audio_wav) * fps)
+
+    # 2) Video per mode
+    progress(f"{sid}:{mode}")
+    raw_mp4 = str(tmp / f"{sid}_raw.mp4")
+    if mode == "narration":
+        images = scene.get("images", [])
+        if single:
+            raw_mp4 = str(tmp / f"{sid}_raw.mkv")
+        raw_key = cache.key("raw", mode=mode, audio=file_digest(audio_wav), images=[asset_digest(i) for i in images],
+                            fps=fps, size=[width, height], lossless=single)
+        with span(tracer, "ken_burns", scene=sid, frames=frames, images=len(images)) as sp:
+            hit = cache.fetch(raw_key, raw_mp4)
+            if not hit:
+                with sched.slot("ffmpeg", sp):
+                    ken_burns_clip(images, raw_mp4, audio_wav, fps=fps, size=(width, height), lossless=single,
+                                   workers=ctx["kb_workers"])
+                cache.store(raw_key, raw_mp4)
+            sp.set(cache_hit=hit, out_bytes=os.path.getsize(raw_mp4))
+    elif mode == "talking_head":
+        portrait = scene["portrait"]
+        engine = scene.get("lipsync_engine", "wav2lip")
+        swap = scene.get("face_swap")==True
+        target = scene.get("target") if swap else None
+        if single:
+            raw_mp4 = str(tmp / f"{sid}_raw.mkv")
+        raw_key = cache.key("raw", mode=mode, audio=file_digest(audio_wav), portrait=asset_digest(portrait),
+                            engine=engine, face_swap_target=asset_digest(target) if swap else None,
+                            size=[width, height], passthrough=single)
+        with span(tracer, "lipsync", scene=sid, engine=engine, frames=frames) as sp:
+            hit = cache.fetch(raw_key, raw_mp4)
+            if not hit:
+                with sched.slot("model", sp):
+                    if swap:
+                        portrait = ctx["face_swap"](portrait, target)
+                    generate_talking_head(portrait, audio_wav, raw_mp4, engine=engine, target_width=width, target_height=height,
+                                          passthrough=single, analysis_cache_dir=ctx["face_cache_dir"],
+                                          audio_features=ctx["audio_features"])
+                cache.store(raw_key, raw_mp4)
+            sp.set(cache_hit=hit, out_bytes=os.path.getsize(raw_mp4))
+    else:
+        raise ValueError(f"Unknown scene mode: {mode}")
+
+    # 3) Subtitles + watermark (optional)
+    progress(f"{sid}:subtitles")
+    final_scene = raw_mp4
+    if single:
+        srt = None
+        if spec.get("subtitles", False):
+            srt = str(tmp / f"{sid}.srt")
+            with sched.slot("io"):
+                write_srt(script_text, audio_wav, srt)
+        print(f"[SCENE] {sid} ready: {final_scene}")
+        return final_scene, srt
+    if spec.get("subtitles", False) or watermark:
+        burned = str(tmp / f"{sid}_burned.mp4")
+        burn_key = cache.key("burn", raw=file_digest(raw_mp4), audio=file_digest(audio_wav),
+                             text=script_text if spec.get("subtitles", False) else None, watermark=watermark)
+        with span(tracer, "burn_in", scene=sid, frames=frames) as sp:
+            hit = cache.fetch(burn_key, burned)
+            if not hit:
+                srt = None
+                if spec.get("subtitles", False):
+                    srt = str(tmp / f"{sid}.srt")
+                    with sched.slot("io"):
+                        write_srt(script_text, audio_wav, srt)
+                with sched.slot("ffmpeg", sp):
+                    burn_subtitles_and_watermark(raw_mp4, srt, watermark, burned)
+                cache.store(burn_key, burned)
+            sp.set(cache_hit=hit, out_bytes=os.path.getsize(burned))
+        final_scene = burned
+
+    print(f"[SCENE] {sid} ready: {final_scene}")
+    return final_scene, None
+
+def run_project(spec_path, out_path, workdir, use_cache=True, cache_dir=None, limits=None, single_encode=None, tts_cache=None,
+                progress=None, tracer=None, trace_path=None, scheduler=None):
+    """
+    progress(stage) is called as each scene stage / final step starts; raising from it aborts the run
+    (raise RunCancelled to have the run reported as cancelled rather than failed).
+    scheduler: a StageScheduler shared with concurrent runs (batch mode), so their stages draw on one set of
+    slots; the spec's "workers" limits are then ignored.
+    Stage spans (wall/CPU time, peak RSS, frames, bytes, cache hits) go to <workdir>/run_report.json,
+    and to a Chrome trace at trace_path if given.
+    """
+    progress = progress or (lambda stage: None)
+    tracer = tracer or Tracer()
     spec = load_spec(spec_path)
     ensure_dir(workdir)
     tmp = pathlib.Path(workdir)
+    # Per-stage artifact cache shared across runs; unchanged scenes reuse their WAV/raw/burned outputs.
+    cache_dir = cache_dir or os.getenv("AI_SHORTS_CACHE") or str(tmp / "cache")
+    cache = StageCache(cache_dir, enabled=use_cache)
+    # Shared WAV cache across specs (intros, outros, catchphrases), if configured
+    if tts_cache is None and use_cache:
+        tts_cache = default_tts_cache()
+    # Scenes run concurrently; per-resource limits come from the caller, then the spec, then defaults.
+    scheduler = scheduler or StageScheduler({**spec.get("workers", {}), **(limits or {})})
 
     fps = spec.get("output", {}).get("fps", 25)
     res = spec.get("output", {}).get("resolution", "960x540")
     width, height = [int(x) for x in res.lower().split("x")]
     target_size_mb = spec.get("output", {}).get("target_size_mb", 3)
     watermark = spec.get("watermark", "")
+    # "two_pass" (default), "fast" (one capped pass, re-encoded only on a size miss) or "crf"
+    compress_mode = spec.get("output", {}).get("compress_mode")
+    # Keep intermediates lossless and do overlays/concat/rate control in one final encode
+    if single_encode is None:
+        single_encode = spec.get("output", {}).get("single_encode", False)
 
-    scene_mp4s = []
-    for scene in spec["scenes"]:
-        sid = scene["id"]
-        mode = scene.get("mode", "narration")
-        duration = float(scene.get("duration_sec", 6))
-        script_text = scene.get("script_text", "")
-        voice = scene.get("voice", {})
-
-        # 1) Audio
-        audio_wav = str(tmp / f"{sid}.wav")
-        synthesize(script_text, audio_wav, engine=voice.get("engine","piper"), voice=voice.get("voice"))
-
-        # 2) Video per mode
-        raw_mp4 = str(tmp / f"{sid}_raw.mp4")
-        if mode == "narration":
-            images = scene.get("images", [])
-            ken_burns_clip(images, raw_mp4, audio_wav, fps=fps, size=(width, height))
-        elif mode == "talking_head":
-            portrait = scene["portrait"]
-            engine = scene.get("lipsync_engine", "wav2lip")
-            if scene.get("face_swap")==True:
-                target = scene.get("target")
-                portrait = face_swap(portrait, target)
-            generate_talking_head(portrait, audio_wav, raw_mp4, engine=engine, target_width=width, target_height=height)
-        else:
-            raise ValueError(f"Unknown scene mode: {mode}")
+    # Ken Burns renders segments in a process pool; split the cores between concurrent encode slots
+    # unless KEN_BURNS_WORKERS pins the pool size
+    kb_workers = int(os.getenv("KEN_BURNS_WORKERS") or max(1, (os.cpu_count() or 1) // scheduler.limits["ffmpeg"]))
+
+    ctx = {"spec": spec, "tmp": tmp, "cache": cache, "scheduler": scheduler, "single_encode": single_encode,
+           "fps": fps, "width": width, "height": height, "watermark": watermark, "kb_workers": kb_workers,
+           "tts_cache": tts_cache, "face_cache_dir": os.path.join(cache_dir, "faces") if use_cache else None,
+           # scene WAVs are decoded and turned into mels once, shared by whichever lip-sync engine runs
+           "audio_features": AudioFeatures(os.path.join(cache_dir, "mels") if use_cache else None),
+           "progress": progress, "tracer": tracer}
+    status = "failed"
+    try:
+        # All face swaps of the spec in one facefusion run, started by the first scene that misses the cache
+        ctx["face_swap"] = _lazy_face_swaps(swap_pairs(spec), cache, tracer, progress)
+        rendered = scheduler.map(lambda scene: _render_scene(scene, ctx), spec["scenes"])
+        scene_mp4s = [video for video, _ in rendered]
 
-        # 3) Subtitles + watermark (optional)
-        final_scene = raw_mp4
-        if spec.get("subtitles", False) or watermark:
+        if single_encode:
+            # 4+5) Concat, overlays and size-targeted compression in one encode
+            progress("encode")
             srt = None
             if spec.get("subtitles", False):
-                srt = str(tmp / f"{sid}.srt")
-                write_srt(script_text, audio_wav, srt)
-            burned = str(tmp / f"{sid}_burned.mp4")
-            burn_subtitles_and_watermark(raw_mp4, srt, watermark, burned)
-            final_scene = burned
-
-        scene_mp4s.append(final_scene)
-
-    # 4) Concat scenes
-    merged = str(tmp / "merged.mp4")
-    concat_videos_ffmpeg(scene_mp4s, merged, target_width=width, target_height=height)
+                offsets, t = [], 0.0
+                for video in scene_mp4s:
+                    offsets.append(t)
+                    t += probe_duration(video)
+                srt = merge_srts([(s, o) for (_, s), o in zip(rendered, offsets)], str(tmp / "merged.srt"))
+            encode_final(scene_mp4s, out_path, width=width, height=height, fps=fps, target_size_mb=target_size_mb,
+                         srt_path=srt, watermark_text=watermark, passlog_dir=str(tmp), tracer=tracer)
+        else:
+            # 4) Concat scenes
+            progress("concat")
+            merged = str(tmp / "merged.mp4")
+            with span(tracer, "concat", scenes=len(scene_mp4s)) as sp:
+                concat_videos_ffmpeg(scene_mp4s, merged, target_width=width, target_height=height)
+                sp.set(out_bytes=os.path.getsize(merged))
 
-    # 5) Compress to target
-    normalize_and_compress(merged, out_path, width=width, height=height, fps=fps, target_size_mb=target_size_mb, two_pass=True)
+            # 5) Compress to target
+            progress("compress")
+            normalize_and_compress(merged, out_path, width=width, height=height, fps=fps, target_size_mb=target_size_mb,
+                                   two_pass=True, tracer=tracer, mode=compress_mode, passlog_dir=str(tmp),
+                                   segment_seconds=spec.get("output", {}).get("segment_seconds"))
+        status = "done"
+    except RunCancelled:
+        status = "cancelled"
+        raise
+    finally:
+        report = tracer.write_report(str(tmp / "run_report.json"), spec=str(spec_path), out=str(out_path), status=status,
+                                     scenes=len(spec["scenes"]), cache={"hits": cache.hits, "misses": cache.misses})
+        if trace_path:
+            tracer.write_chrome_trace(trace_path)
 
+    if use_cache:
+        print(f"[CACHE] {cache.hits} hit(s), {cache.misses} miss(es) in {cache_dir}")
+    if tts_cache is not None:
+        run_stats = dict(tts_cache.stats)
+        totals = tts_cache.flush_stats()
+        print(f"[TTS CACHE] {run_stats['hits']} hit(s), {run_stats['misses']} miss(es), {run_stats['evictions']} eviction(s); "
+              f"{totals['bytes'] / 1024**2:.1f} MB in {tts_cache.root}")
+    print(f"[REPORT] {report}")
     print(f"[DONE] Wrote {out_path}")
     return out_path
@@ -0,0 +1,86 @@
+import hashlib, json, os, pathlib, shutil, tempfile, threading
+
+_CHUNK = 1 << 20
+_digests = {}
+
+def file_digest(path):
+    """
+    sha256 of a file's contents. Memoized on (path, mtime, size) so the same
+    asset referenced by several scenes is only read once per process.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if memo_key in _digests:
+        return _digests[memo_key]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_CHUNK), b""):
+            h.update(block)
+    _digests[memo_key] = h.hexdigest()
+    return _digests[memo_key]
+
+def asset_digest(path):
+    """Content hash for an asset path, or a marker when the file is missing (the stage will fail or fall back anyway)."""
+    if path and os.path.isfile(path):
+        return file_digest(path)
+    return f"missing:{path}"
+
+
+class StageCache:
+    """
+    Content-addressed store for per-stage artifacts (WAV, raw MP4, burned MP4, ...).
+
+    Keys are sha256 digests over a stage name plus a JSON dump of the stage inputs,
+    so a key changes whenever anything that influences the artifact changes.
+    Artifacts are copied in and out (never hard-linked): ffmpeg truncates its
+    outputs in place and would otherwise corrupt the cached copy.
+    """
+
+    def __init__(self, root, enabled=True):
+        self.root = pathlib.Path(root)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, stage, **inputs):
+        payload = json.dumps({"stage": stage, "inputs": inputs}, sort_keys=True, default=str)
+        return f"{stage}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def _path(self, key, suffix):
+        stage, digest = key.split("-", 1)
+        return self.root / stage / digest[:2] / f"{digest}{suffix}"
+
+    def has(self, key, suffix):
+        """True if an artifact is stored under `key` (no copy, not counted as a hit)."""
+        return self.enabled and self._path(key, suffix).exists()
+
+    def fetch(self, key, dst):
+        """Copy the cached artifact for `key` to `dst`. Returns False on a miss."""
+        if not self.enabled:
+            return False
+        src = self._path(key, pathlib.Path(dst).suffix)
+        if not src.exists():
+            with self._lock:
+                self.misses += 1
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+        shutil.copyfile(src, dst)
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, src):
+        """Publish `src` under `key` atomically (temp file + rename) so concurrent runs never see partial files."""
+        if not self.enabled or not os.path.exists(src):
+            return
+        dst = self._path(key, pathlib.Path(src).suffix)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dst.parent, suffix=".part")
+        os.close(fd)
+        try:
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
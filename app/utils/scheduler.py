@@ -0,0 +1,65 @@
+import contextlib, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+# Resource classes a pipeline stage can run under:
+#   model  - heavy model workers (Bark, SadTalker, Wav2Lip, facefusion); RAM-bound
+#   ffmpeg - encodes and other frame-crunching subprocesses; CPU-bound, x264 is already multithreaded
+#   io     - light work (SRT files, cache copies, probes)
+RESOURCES = ("model", "ffmpeg", "io")
+
+def default_limits():
+    cpus = os.cpu_count() or 1
+    return {"model": 1, "ffmpeg": max(2, cpus // 8), "io": 8}
+
+def parse_limits(text):
+    """Parse 'model=2,ffmpeg=4' into a limits dict. Unknown resource names raise ValueError."""
+    limits = {}
+    for part in (text or "").split(","):
+        if not part.strip():
+            continue
+        name, _, value = part.partition("=")
+        limits[name.strip()] = max(1, int(value))
+    return check_limits(limits)
+
+def check_limits(limits):
+    unknown = sorted(set(limits or {}) - set(RESOURCES))
+    if unknown:
+        raise ValueError(f"Unknown worker resource(s): {', '.join(unknown)} (expected {', '.join(RESOURCES)})")
+    return limits
+
+
+class StageScheduler:
+    """
+    Runs independent jobs (scenes) concurrently while capping how many stages of each
+    resource class execute at once. Each job acquires a slot per stage, so scene N+1's TTS
+    overlaps scene N's lip-sync, but two SadTalker runs never share the box unless allowed.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = {**default_limits(), **check_limits(limits or {})}
+        self._slots = {name: threading.BoundedSemaphore(n) for name, n in self.limits.items()}
+
+    @contextlib.contextmanager
+    def slot(self, resource, span=None):
+        """Hold one slot of `resource`; the time spent waiting for it is recorded on `span`, if given."""
+        sem = self._slots[resource]
+        start = time.perf_counter()
+        with sem:
+            if span is not None:
+                span.set(slot_wait_s=round(time.perf_counter() - start, 4))
+            yield
+
+    def map(self, fn, items):
+        """Call fn(item) for every item concurrently; returns results in input order, re-raising the first failure."""
+        items = list(items)
+        if not items:
+            return []
+        workers = min(len(items), sum(self.limits.values()))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stage") as pool:
+            futures = [pool.submit(fn, item) for item in items]
+            try:
+                return [f.result() for f in futures]
+            except BaseException:
+                # don't start scenes that are still queued behind the failure
+                pool.shutdown(cancel_futures=True)
+                raise
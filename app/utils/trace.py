@@ -0,0 +1,115 @@
+import contextlib, json, sys, threading, time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def _rss_peaks_mb():
+    """(this process, largest reaped child) peak RSS in MB; high-water marks, not per-span deltas."""
+    if resource is None:
+        return None, None
+    scale = 1 / 1024**2 if sys.platform == "darwin" else 1 / 1024  # bytes on macOS, KiB on Linux
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1))
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """
+    Collects timing spans for one run: wall time, CPU time (this thread plus subprocesses reaped
+    during the span, e.g. ffmpeg), peak RSS, and whatever a stage sets on its span (frames,
+    out_bytes, cache_hit, ...). Concurrent scenes make the subprocess CPU share approximate.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.t0 = time.perf_counter()
+        self.cpu0 = time.process_time() + _children_cpu()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        sp = Span(name, attrs)
+        start, cpu, child_cpu = time.perf_counter(), time.thread_time(), _children_cpu()
+        status = "ok"
+        try:
+            yield sp
+        except BaseException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            rss, child_rss = _rss_peaks_mb()
+            record = {"name": name, "start_s": round(start - self.t0, 4), "wall_s": round(end - start, 4),
+                      "cpu_s": round(time.thread_time() - cpu + _children_cpu() - child_cpu, 4),
+                      "peak_rss_mb": rss, "child_peak_rss_mb": child_rss, "status": status,
+                      "thread": threading.current_thread().name, **sp.attrs}
+            with self._lock:
+                self.spans.append(record)
+
+    def totals(self):
+        """Per stage name: count, summed wall/cpu seconds, frames, output bytes and cache hits."""
+        out = {}
+        with self._lock:
+            spans = list(self.spans)
+        for s in spans:
+            t = out.setdefault(s["name"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "frames": 0, "out_bytes": 0, "cache_hits": 0})
+            t["count"] += 1
+            t["wall_s"] = round(t["wall_s"] + s["wall_s"], 4)
+            t["cpu_s"] = round(t["cpu_s"] + s["cpu_s"], 4)
+            t["frames"] += s.get("frames") or 0
+            t["out_bytes"] += s.get("out_bytes") or 0
+            t["cache_hits"] += 1 if s.get("cache_hit") else 0
+        return out
+
+    def report(self, **info):
+        rss, child_rss = _rss_peaks_mb()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_s"])
+        return {**info, "wall_s": round(time.perf_counter() - self.t0, 4),
+                "cpu_s": round(time.process_time() + _children_cpu() - self.cpu0, 4),
+                "peak_rss_mb": rss, "child_peak_rss_mb": child_rss,
+                "stages": self.totals(), "spans": spans}
+
+    def write_report(self, path, **info):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(**info), f, indent=2)
+        return path
+
+    def write_chrome_trace(self, path):
+        """Chrome trace-event JSON (chrome://tracing, Perfetto): one complete event per span, one row per thread."""
+        with self._lock:
+            spans = list(self.spans)
+        tids = {}
+        events = []
+        for s in spans:
+            tid = tids.setdefault(s["thread"], len(tids) + 1)
+            args = {k: v for k, v in s.items() if k not in ("name", "start_s", "wall_s", "thread")}
+            events.append({"name": s["name"], "ph": "X", "pid": 1, "tid": tid,
+                           "ts": int(s["start_s"] * 1e6), "dur": int(s["wall_s"] * 1e6), "args": args})
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}} for name, tid in tids.items()]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+
+def span(tracer, name, **attrs):
+    """tracer.span(...) or, without a tracer, a no-op span so instrumented code needn't branch."""
+    if tracer is None:
+        return contextlib.nullcontext(Span(name, attrs))
+    return tracer.span(name, **attrs)
@@ -1,11 +1,33 @@
 import os, subprocess, math, tempfile, wave
 import pathlib
 from pathlib import Path
-import soundfile as sf
+from app.audio.features import duration_sec
+from app.video.media_info import probe
 
 def audio_duration_sec(wav_path: str) -> float:
-    data, samplerate = sf.read(wav_path)
-    return len(data) / float(samplerate)
+    # header only; decoding the whole file just for its length adds up across scenes
+    return duration_sec(wav_path)
+
+def probe_duration(media_path: str) -> float:
+    try:
+        return probe(media_path).duration or 0.0
+    except RuntimeError:
+        return 0.0
+
+def probe_has_audio(media_path: str) -> bool:
+    return probe(media_path).has_audio
+
+def _srt_time(t):
+    ms = int(round(t*1000))
+    hh = ms//3600000; ms-=hh*3600000
+    mm = ms//60000; ms-=mm*60000
+    ss = ms//1000; ms-=ss*1000
+    return f"{hh:02d}:{mm:02d}:{ss:02d},{ms:03d}"
+
+def _parse_srt_time(s):
+    hms, ms = s.strip().split(",")
+    hh, mm, ss = [int(x) for x in hms.split(":")]
+    return hh*3600 + mm*60 + ss + int(ms)/1000.0
 
 def write_srt(text:str, audio_wav:str, srt_path:str):
     dur = max(0.1, audio_duration_sec(audio_wav))
@@ -25,18 +47,33 @@ def write_srt(text:str, audio_wav:str, srt_path:str):
     if cur: chunks.append(' '.join(cur))
 
     seg_dur = dur / len(chunks)
-    def fmt(t):
-        ms = int(t*1000)
-        hh = ms//3600000; ms-=hh*3600000
-        mm = ms//60000; ms-=mm*60000
-        ss = ms//1000; ms-=ss*1000
-        return f"{hh:02d}:{mm:02d}:{ss:02d},{ms:03d}"
-
     with open(srt_path, "w", encoding="utf-8") as f:
         for i, chunk in enumerate(chunks, 1):
             start = seg_dur*(i-1)
             end = seg_dur*i - 0.05
-            f.write(f"{i}\n{fmt(start)} --> {fmt(max(start+0.1, end))}\n{chunk}\n\n")
+            f.write(f"{i}\n{_srt_time(start)} --> {_srt_time(max(start+0.1, end))}\n{chunk}\n\n")
+    return srt_path
+
+def merge_srts(parts, srt_path):
+    """
+    Merge per-scene SRTs into one timeline.
+    parts: list of (srt_path or None, offset_sec) with offsets = start time of each scene in the merged video.
+    """
+    n = 0
+    with open(srt_path, "w", encoding="utf-8") as out:
+        for part, offset in parts:
+            if not part or not os.path.exists(part):
+                continue
+            with open(part, "r", encoding="utf-8") as f:
+                blocks = [b for b in f.read().split("\n\n") if b.strip()]
+            for block in blocks:
+                lines = block.strip().splitlines()
+                if len(lines) < 3 or "-->" not in lines[1]:
+                    continue
+                start, end = lines[1].split("-->")
+                n += 1
+                out.write(f"{n}\n{_srt_time(_parse_srt_time(start)+offset)} --> {_srt_time(_parse_srt_time(end)+offset)}\n")
+                out.write("\n".join(lines[2:]) + "\n\n")
     return srt_path
 
 
@@ -51,21 +88,11 @@ def concat_videos_ffmpeg(mp4_list, out_path, target_width=960, target_height=540
     standard_sample_rate = "44100"
 
     for video in mp4_list:
-        # Check if video has audio
-        has_audio = subprocess.run(
-            ["ffprobe", "-v", "error", "-select_streams", "a", "-show_entries",
-             "stream=codec_type", "-of", "csv=p=0", video],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-        ).stdout.strip() != ""
-
-        if not has_audio:
-            # Get video duration
-            duration_cmd = [
-                "ffprobe", "-v", "error", "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1", video
-            ]
-            duration = subprocess.run(duration_cmd, stdout=subprocess.PIPE,
-                                      stderr=subprocess.PIPE, text=True).stdout.strip()
+        # One probe for audio presence and duration
+        info = probe(video)
+
+        if not info.has_audio:
+            duration = info.duration
 
             # Add silent audio with aspect ratio preservation
             temp_video = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
@@ -116,8 +143,8 @@ def concat_videos_ffmpeg(mp4_list, out_path, target_width=960, target_height=540
 
     return out_path
 
-def burn_subtitles_and_watermark(in_mp4, srt_path, watermark_text, out_mp4):
-    # Build filter graph
+def overlay_filters(srt_path, watermark_text):
+    """Subtitle + watermark video filters, shared by per-scene burn-in and the single final encode."""
     vf = []
     if srt_path and os.path.exists(srt_path) and os.path.getsize(srt_path)>0:
         # Ensure forward slashes for ffmpeg compatibility, even on Windows
@@ -126,6 +153,11 @@ def burn_subtitles_and_watermark(in_mp4, srt_path, watermark_text, out_mp4):
     if watermark_text:
         # bottom-right drawtext
         vf.append(f"drawtext=text='{watermark_text}':x=w-tw-20:y=h-th-10:fontcolor=white:alpha=0.6:fontsize=20:box=1:boxcolor=black@0.3:boxborderw=5")
+    return vf
+
+def burn_subtitles_and_watermark(in_mp4, srt_path, watermark_text, out_mp4):
+    # Build filter graph
+    vf = overlay_filters(srt_path, watermark_text)
     filter_str = ",".join(vf) if vf else "null"
     cmd = ["ffmpeg", "-y", "-i", in_mp4, "-vf", filter_str + ",pad=width=ceil(iw/2)*2:height=ceil(ih/2)*2", "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac", out_mp4]
     subprocess.run(cmd, check=True)
@@ -1,53 +1,160 @@
-import os, subprocess, math
+import contextlib, os, pathlib, shutil, subprocess, math, tempfile
+from app.utils.trace import span
+from app.video.media_info import probe
 
 def size_target_bitrate(duration_sec, target_size_mb, audio_kbps=64):
+    # a zero/unknown duration (empty input, failed probe) has no bitrate to size
+    if not duration_sec or not duration_sec > 0:
+        raise ValueError(f"Can't size a bitrate for duration {duration_sec!r}s (empty input or failed probe)")
     total_bits = target_size_mb * 8 * 1024 * 1024
     audio_bits = audio_kbps*1000 * duration_sec
     video_bits = max(1, total_bits - audio_bits)
     return int(video_bits / duration_sec / 1000)  # kbps
 
-def normalize_and_compress(in_mp4, out_mp4, width=960, height=540, fps=25, target_size_mb=3, two_pass=True):
-    # Estimate duration
-    import subprocess, json, tempfile
-    probe = subprocess.run(["ffprobe", "-v", "error", "-print_format", "json",
-                            "-show_entries", "format=duration", in_mp4],
-                           capture_output=True, text=True, check=True)
-    duration = float(json.loads(probe.stdout)["format"]["duration"])
+AUDIO_ARGS = ["-c:a", "aac", "-b:a", "64k", "-ac", "1", "-ar", "16000"]
 
+def _fit_filter(width, height):
+    return f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},pad=width=ceil(iw/2)*2:height=ceil(ih/2)*2"
+
+@contextlib.contextmanager
+def private_passlog(base_dir):
+    """Pass-log prefix in a fresh directory under base_dir, so concurrent 2-pass encodes never share ffmpeg2pass-0.log."""
+    os.makedirs(base_dir, exist_ok=True)
+    d = tempfile.mkdtemp(prefix=".passlog-", dir=base_dir)
+    try:
+        yield os.path.join(d, "ffmpeg2pass")
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+def _rate_args(mode, b_v):
+    if mode == "crf":
+        return ["-preset", "veryfast", "-crf", "30", "-profile:v", "high"]
+    if mode == "fast":
+        # one-pass ABR; the VBV cap keeps bursts from blowing the size budget
+        return ["-b:v", f"{b_v}k", "-maxrate", f"{int(b_v * 1.5)}k", "-bufsize", f"{b_v * 2}k"]
+    return ["-b:v", f"{b_v}k"]
+
+def _encode(in_mp4, out_mp4, vf, fps, mode, b_v, passlog, tracer, name, frames, start=None, audio=True):
+    """One libx264 encode (two passes in two_pass mode). start=(seconds, frame count) encodes just that video segment."""
+    seek = ["-ss", f"{start[0]:.6f}"] if start else []
+    limit = ["-frames:v", str(start[1])] if start else []
+    base = ["ffmpeg", "-y", *seek, "-i", in_mp4, "-vf", vf, "-r", str(fps), *limit,
+            "-c:v", "libx264", *_rate_args(mode, b_v), "-pix_fmt", "yuv420p"]
+    if mode == "two_pass":
+        with span(tracer, f"{name}_pass1", frames=frames):
+            subprocess.run([*base, "-passlogfile", passlog, "-pass", "1", "-an", "-f", "mp4", os.devnull], check=True)
+        base += ["-passlogfile", passlog, "-pass", "2"]
+        name = f"{name}_pass2"
+    with span(tracer, name, frames=frames) as sp:
+        subprocess.run([*base, *([*AUDIO_ARGS, "-movflags", "+faststart"] if audio else ["-an"]), out_mp4], check=True)
+        sp.set(out_bytes=os.path.getsize(out_mp4))
+
+def _encode_segments(in_mp4, out_mp4, vf, fps, mode, b_v, work, tracer, total_frames, seg_frames, workers):
+    """Video in frame-aligned segments encoded concurrently, joined by stream copy; audio encoded once from the source."""
+    from concurrent.futures import ThreadPoolExecutor
+    bounds = list(range(0, total_frames, seg_frames))
+    parts = [os.path.join(work, f"seg{i:04d}.mp4") for i in range(len(bounds))]
+
+    def encode(i):
+        n = min(seg_frames, total_frames - bounds[i])
+        with private_passlog(work) as passlog:
+            _encode(in_mp4, parts[i], vf, fps, mode, b_v, passlog, tracer, "compress_segment", n,
+                    start=(bounds[i] / fps, n), audio=False)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(encode, range(len(parts))))
+    list_path = os.path.join(work, "segments.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for part in parts:
+            f.write(f"file '{pathlib.Path(part).resolve().as_posix()}'\n")
+    with span(tracer, "compress_mux", segments=len(parts)) as sp:
+        subprocess.run(["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-i", in_mp4,
+                        "-map", "0:v", "-map", "1:a?", "-c:v", "copy", *AUDIO_ARGS, "-movflags", "+faststart", out_mp4], check=True)
+        sp.set(out_bytes=os.path.getsize(out_mp4))
+
+def normalize_and_compress(in_mp4, out_mp4, width=960, height=540, fps=25, target_size_mb=3, two_pass=True, tracer=None,
+                           mode=None, passlog_dir=None, segment_seconds=None, workers=None, tolerance=0.05, max_retries=2):
+    """
+    Scale/crop to width x height at fps and compress towards target_size_mb.
+    mode: "two_pass" (default; two_pass=False means "crf") - 2-pass ABR at the size-target bitrate.
+          "fast" - one VBV-capped pass at that bitrate, re-encoded at a corrected bitrate only if the
+                   result overshoots target_size_mb by more than `tolerance`.
+          "crf" - CRF 30, no size target.
+    Pass-1 stats go to a private directory under passlog_dir (default: next to out_mp4).
+    segment_seconds: outputs longer than two segments are encoded as frame-aligned segments on
+    `workers` threads (default COMPRESS_WORKERS or cores/2) and joined without re-encoding.
+    """
+    duration = probe(in_mp4).duration
+
+    os.makedirs(os.path.dirname(out_mp4), exist_ok=True)
+    mode = mode or ("two_pass" if two_pass else "crf")
+    if mode not in ("two_pass", "fast", "crf"):
+        raise ValueError(f"Unknown compress mode: {mode}")
+    vf = _fit_filter(width, height)
+    total_frames = int(round(duration * fps))
+    seg_frames = int(round(segment_seconds * fps)) if segment_seconds else 0
+    if workers is None:
+        workers = int(os.getenv("COMPRESS_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+    segmented = seg_frames > 0 and total_frames > 2 * seg_frames and workers > 1
+
+    target_bytes = target_size_mb * 1024 * 1024
+    b_v = size_target_bitrate(duration, target_size_mb)
+    work = tempfile.mkdtemp(prefix=".compress-", dir=passlog_dir or os.path.dirname(out_mp4) or ".")
+    try:
+        for attempt in range(max_retries + 1):
+            if segmented:
+                _encode_segments(in_mp4, out_mp4, vf, fps, mode, b_v, work, tracer, total_frames, seg_frames, workers)
+            else:
+                with private_passlog(work) as passlog:
+                    _encode(in_mp4, out_mp4, vf, fps, mode, b_v, passlog, tracer, "compress", total_frames)
+            size = os.path.getsize(out_mp4)
+            if mode != "fast" or size <= target_bytes * (1 + tolerance) or attempt == max_retries:
+                break
+            # overshoot: scale the video bitrate by the miss (audio is a fixed share) and re-encode once more
+            b_v = max(1, int(b_v * target_bytes / size * 0.97))
+            print(f"[COMPRESS] {size / 1024**2:.2f} MB > {target_size_mb} MB target; re-encoding at {b_v} kbps")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return out_mp4
+
+def encode_final(scene_videos, out_mp4, width=960, height=540, fps=25, target_size_mb=3, srt_path=None,
+                 watermark_text="", passlog_dir=None, tracer=None):
+    """
+    Single-encode finish for lossless/raw scene intermediates: scale/crop, concat, subtitles,
+    watermark and size-targeted 2-pass x264 all happen in one filtergraph, so every pixel is
+    lossy-encoded exactly once.
+    """
+    from app.video.assemble import overlay_filters
     os.makedirs(os.path.dirname(out_mp4), exist_ok=True)
 
-    if two_pass:
-        b_v = size_target_bitrate(duration, target_size_mb)
-        # Pass 1
-        cmd1 = [
-            "ffmpeg", "-y", "-i", in_mp4,
-            "-vf", f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},pad=width=ceil(iw/2)*2:height=ceil(ih/2)*2",
-            "-r", str(fps),
-            "-c:v", "libx264", "-b:v", f"{b_v}k",
-            "-pix_fmt", "yuv420p",
-            "-pass", "1", "-an", "-f", "mp4", os.devnull
-        ]
-        subprocess.run(cmd1, check=True)
-        # Pass 2
-        cmd2 = [
-            "ffmpeg", "-y", "-i", in_mp4,
-            "-vf", f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},pad=width=ceil(iw/2)*2:height=ceil(ih/2)*2",
-            "-r", str(fps),
-            "-c:v", "libx264", "-b:v", f"{b_v}k",
-            "-pix_fmt", "yuv420p",
-            "-pass", "2", "-c:a", "aac", "-b:a", "64k", "-ac", "1", "-ar", "16000",
-            "-movflags", "+faststart", out_mp4
-        ]
-        subprocess.run(cmd2, check=True)
-    else:
-        cmd = [
-            "ffmpeg", "-y", "-i", in_mp4,
-            "-vf", f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},pad=width=ceil(iw/2)*2:height=ceil(ih/2)*2",
-            "-r", str(fps),
-            "-c:v", "libx264", "-preset", "veryfast", "-crf", "30",
-            "-profile:v", "high", "-pix_fmt", "yuv420p",
-            "-c:a", "aac", "-b:a", "64k", "-ac", "1", "-ar", "16000",
-            "-movflags", "+faststart", out_mp4
-        ]
-        subprocess.run(cmd, check=True)
+    inputs, chains, concat_in = [], [], []
+    total = 0.0
+    for i, video in enumerate(scene_videos):
+        info = probe(video)
+        dur = info.duration
+        total += dur
+        inputs += ["-i", video]
+        chains.append(f"[{i}:v]scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},"
+                      f"setsar=1,fps={fps},format=yuv420p[v{i}]")
+        if info.has_audio:
+            chains.append(f"[{i}:a]aresample=16000,aformat=sample_fmts=fltp:channel_layouts=mono,"
+                          f"apad=whole_dur={dur},atrim=0:{dur}[a{i}]")
+        else:
+            chains.append(f"anullsrc=channel_layout=mono:sample_rate=16000,atrim=0:{dur},aformat=sample_fmts=fltp[a{i}]")
+        concat_in.append(f"[v{i}][a{i}]")
+    chains.append(f"{''.join(concat_in)}concat=n={len(scene_videos)}:v=1:a=1[vcat][aout]")
+    post = overlay_filters(srt_path, watermark_text) + ["pad=width=ceil(iw/2)*2:height=ceil(ih/2)*2"]
+    chains.append(f"[vcat]{','.join(post)}[vout]")
+    graph = ";".join(chains)
+
+    b_v = size_target_bitrate(total, target_size_mb)
+    with private_passlog(passlog_dir or os.path.dirname(out_mp4)) as passlog:
+        common = ["ffmpeg", "-y", *inputs, "-filter_complex", graph, "-map", "[vout]", "-map", "[aout]",
+                  "-c:v", "libx264", "-b:v", f"{b_v}k", "-pix_fmt", "yuv420p", "-passlogfile", passlog]
+        # pass 1 keeps [aout] mapped (an unconnected filter output is an error) but discards it cheaply
+        with span(tracer, "encode_pass1", frames=int(total*fps)):
+            subprocess.run([*common, "-pass", "1", "-c:a", "pcm_s16le", "-f", "null", os.devnull], check=True)
+        with span(tracer, "encode_pass2", frames=int(total*fps)) as sp:
+            subprocess.run([*common, "-pass", "2", *AUDIO_ARGS, "-movflags", "+faststart", out_mp4], check=True)
+            sp.set(out_bytes=os.path.getsize(out_mp4))
     return out_mp4
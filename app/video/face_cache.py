@@ -0,0 +1,67 @@
+import hashlib, json, os, pathlib, pickle, shutil, tempfile
+from app.utils.cache import file_digest
+
+class FaceAnalysisCache:
+    """
+    On-disk cache of per-portrait face analysis (detector boxes, crop info, landmarks,
+    3DMM coefficient .mat files), keyed by image content hash plus preprocess settings.
+
+    Each entry is a directory holding `meta.pkl` and any artifact files. Entries are
+    published with a directory rename, so concurrent writers never expose half an entry.
+    Used by the Wav2Lip engine and SadTalker's CropAndExtract; both treat it as optional.
+    """
+
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def key(self, image_path, **settings):
+        payload = json.dumps({"image": file_digest(image_path), "settings": settings}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def load(self, key, dest_dir=None, names=None):
+        """
+        Returns (meta, files) or None on a miss. files maps artifact name -> path; with dest_dir
+        the artifacts are copied there first, renamed via `names` (artifact name -> file name).
+        """
+        entry = self.root / key[:2] / key
+        try:
+            with open(entry / "meta.pkl", "rb") as f:
+                meta = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        files = {}
+        for name in meta.get("_files", []):
+            src = entry / name
+            if dest_dir is None:
+                files[name] = str(src)
+                continue
+            dst = os.path.join(dest_dir, (names or {}).get(name, name))
+            try:
+                shutil.copyfile(src, dst)
+            except FileNotFoundError:
+                return None
+            files[name] = dst
+        return meta, files
+
+    def save(self, key, meta, files=None):
+        """Store meta (any picklable dict) and artifact files {name: path}."""
+        entry = self.root / key[:2] / key
+        if entry.exists():
+            return
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=entry.parent, prefix=".part-")
+        try:
+            files = files or {}
+            for name, path in files.items():
+                shutil.copyfile(path, os.path.join(tmp, name))
+            with open(os.path.join(tmp, "meta.pkl"), "wb") as f:
+                pickle.dump({**meta, "_files": sorted(files)}, f)
+            os.replace(tmp, entry)
+        except OSError:
+            if entry.exists():
+                pass  # another worker published the same entry first
+            else:
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
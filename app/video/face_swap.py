@@ -1,48 +1,103 @@
 import os
 import sys
-import datetime
+import json
+import hashlib
+import tempfile
 import subprocess
 import pathlib
+from app.utils.cache import file_digest
 
+PROJECT_ROOT = pathlib.Path(__file__).parent.parent.parent.absolute()
 
-def face_swap(portrait: str, target: str):
-    # Get the project root directory (where generate.py is located)
-    project_root = pathlib.Path(__file__).parent.parent.parent.absolute()
-    
-    # Resolve relative paths to absolute paths
-    portrait_abs = str(project_root / portrait)
-    target_abs = str(project_root / target)
-    
-    if not os.path.isfile(portrait_abs):
-        raise RuntimeError(f"Invalid path to portrait file: {portrait_abs}. Make sure path is correct and the file exists.")
-    if not os.path.isfile(target_abs):
-        raise RuntimeError(f"Invalid path to target file: {target_abs}. Make sure path is correct and the file exists.")
-
-    # Create output filename from portrait filename only (not full path)
-    portrait_name = pathlib.Path(portrait).stem
-    dt = datetime.datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
-    output_path = str(project_root / f"examples/face_swaps/{portrait_name}_{dt}.jpg")
-    
-    # Ensure output directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    repo = os.getenv('FACEFUSION_PATH')
-    cmd = [sys.executable,
-                "facefusion.py",
-                "headless-run",
-                "--config-path", os.path.join(repo, "facefusion.ini"),
-                "--jobs-path", os.path.join(repo, ".jobs"),
-                "--processors", "face_swapper", "face_enhancer",
-                "--face-swapper-model", "inswapper_128_fp16",
-                "--face-swapper-weight", "0.3",
-                "--face-enhancer-model", "gfpgan_1.4",
-                "-s", portrait_abs,  # Use absolute path
-                "-t", target_abs,    # Use absolute path
-                "--output-path", output_path]
-    try:
-        cwd = str(project_root / "third_party/facefusion")
-        subprocess.run(cmd, cwd=cwd)
-        
-    except subprocess.CalledProcessError as e:
-        print(f"Error occurred: {e}")
-    return output_path
\ No newline at end of file
+# everything besides the two images that changes the swapped result; part of the cache key
+SWAP_SETTINGS = {
+    "processors": ["face_swapper", "face_enhancer"],
+    # INT8 needs fp32 weights: FACE_SWAPPER_MODEL=inswapper_128 FACEFUSION_INT8=face_swapper,face_enhancer
+    "face_swapper_model": os.getenv("FACE_SWAPPER_MODEL", "inswapper_128_fp16"),
+    "face_swapper_weight": "0.3",
+    "face_enhancer_model": "gfpgan_1.4",
+    "int8": os.getenv("FACEFUSION_INT8", ""),
+}
+
+def _resolve(path):
+    # spec paths are relative to the project root (where generate.py is located)
+    p = str(PROJECT_ROOT / path)
+    if not os.path.isfile(p):
+        raise RuntimeError(f"Invalid path to file: {p}. Make sure path is correct and the file exists.")
+    return p
+
+def swap_digest(portrait_abs, target_abs):
+    payload = json.dumps({"portrait": file_digest(portrait_abs), "target": file_digest(target_abs), "settings": SWAP_SETTINGS},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def swap_pairs(spec):
+    """(portrait, target) for every face-swapped talking-head scene of a spec."""
+    return [(scene["portrait"], scene.get("target")) for scene in spec.get("scenes", [])
+            if scene.get("mode") == "talking_head" and scene.get("face_swap") == True]
+
+def _run_facefusion(jobs, repo, face_store_path=None):
+    """All pending swaps in one facefusion process (models load once), one job per pair. Returns {id: ok}."""
+    with tempfile.TemporaryDirectory(prefix="faceswap-") as td:
+        pairs_path, results_path = os.path.join(td, "pairs.json"), os.path.join(td, "results.json")
+        with open(pairs_path, "w", encoding="utf-8") as f:
+            json.dump(jobs, f)
+        cmd = [sys.executable, "swap_batch.py", pairs_path, results_path,
+               "headless-run",
+               "--config-path", os.path.join(repo, "facefusion.ini"),
+               "--jobs-path", os.path.join(td, "jobs"),
+               "--processors", *SWAP_SETTINGS["processors"],
+               "--face-swapper-model", SWAP_SETTINGS["face_swapper_model"],
+               "--face-swapper-weight", SWAP_SETTINGS["face_swapper_weight"],
+               "--face-enhancer-model", SWAP_SETTINGS["face_enhancer_model"]]
+        env = dict(os.environ)
+        # CPU session profile: per-pool threads, full graph optimization, cached optimized models (facefusion/cpu_profile.py)
+        env.setdefault("FACEFUSION_CPU_PROFILE", "1")
+        if face_store_path:
+            # detected faces + embeddings persist across runs (facefusion/face_store.py)
+            env["FACEFUSION_FACE_STORE_PATH"] = face_store_path
+        proc = subprocess.run(cmd, cwd=repo, env=env)
+        try:
+            with open(results_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            # died before writing results (bad args, missing models): nothing succeeded
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+def face_swap_batch(pairs, cache=None, out_dir=None):
+    """
+    Swap the portrait face onto each target, for many (portrait, target) pairs at once.
+    Results are named by a content hash of both images plus SWAP_SETTINGS, so a pair swapped
+    before is returned straight from out_dir or `cache` (a StageCache); the rest run together in
+    one facefusion process. Returns {(portrait, target): output jpg}.
+    """
+    out_dir = pathlib.Path(out_dir or PROJECT_ROOT / "examples/face_swaps")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    outputs, pending = {}, {}
+    for portrait, target in dict.fromkeys(pairs):
+        portrait_abs, target_abs = _resolve(portrait), _resolve(target)
+        digest = swap_digest(portrait_abs, target_abs)
+        out = str(out_dir / f"{pathlib.Path(portrait).stem}_{digest[:16]}.jpg")
+        outputs[(portrait, target)] = out
+        if os.path.isfile(out) or (cache is not None and cache.fetch(cache.key("faceswap", swap=digest), out)):
+            continue
+        pending[digest] = {"id": digest[:16], "source": portrait_abs, "target": target_abs, "output": out}
+
+    if pending:
+        repo = os.getenv("FACEFUSION_PATH") or str(PROJECT_ROOT / "third_party/facefusion")
+        print(f"[FACESWAP] {len(pending)} swap(s) in one facefusion run, {len(outputs) - len(pending)} cached")
+        face_store = str(cache.root / "facefusion_faces") if cache is not None and cache.enabled else None
+        results = _run_facefusion(list(pending.values()), repo, face_store)
+        failed = []
+        for digest, job in pending.items():
+            if results.get(job["id"]) and os.path.isfile(job["output"]):
+                if cache is not None:
+                    cache.store(cache.key("faceswap", swap=digest), job["output"])
+            else:
+                failed.append(job["source"] + " -> " + job["target"])
+        if failed:
+            raise RuntimeError(f"Face swap failed for: {', '.join(failed)}")
+    return outputs
+
+def face_swap(portrait: str, target: str, cache=None):
+    return face_swap_batch([(portrait, target)], cache=cache)[(portrait, target)]
@@ -0,0 +1,96 @@
+import collections, json, os, subprocess, threading
+
+def _float(v, default=None):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return default
+
+def _rate(v):
+    """ffprobe rational ("30000/1001") -> float, None for "0/0" or missing."""
+    if not v:
+        return None
+    num, _, den = str(v).partition("/")
+    num, den = _float(num), _float(den or 1)
+    return num / den if num and den else None
+
+
+class StreamInfo:
+    def __init__(self, s):
+        self.index = s.get("index")
+        self.codec_type = s.get("codec_type")
+        self.codec_name = s.get("codec_name")
+        self.width, self.height = s.get("width"), s.get("height")
+        self.fps = _rate(s.get("avg_frame_rate")) or _rate(s.get("r_frame_rate"))
+        self.sample_rate = int(s["sample_rate"]) if s.get("sample_rate") else None
+        self.channels = s.get("channels")
+        self.duration = _float(s.get("duration"))
+        self.nb_frames = int(s["nb_frames"]) if str(s.get("nb_frames", "")).isdigit() else None
+
+    def __repr__(self):
+        return f"StreamInfo({self.index}, {self.codec_type}, {self.codec_name})"
+
+
+class MediaInfo:
+    """One ffprobe -show_streams -show_format result. Fields describe the first video/audio stream."""
+
+    def __init__(self, path, data):
+        self.path = path
+        fmt = data.get("format", {})
+        self.streams = [StreamInfo(s) for s in data.get("streams", [])]
+        self.format_name = fmt.get("format_name")
+        self.bit_rate = int(fmt["bit_rate"]) if fmt.get("bit_rate") else None
+        self.video = next((s for s in self.streams if s.codec_type == "video"), None)
+        self.audio = next((s for s in self.streams if s.codec_type == "audio"), None)
+        # container duration first; some muxers only set it per stream
+        self.duration = _float(fmt.get("duration")) or max([s.duration or 0.0 for s in self.streams] + [0.0])
+
+    @property
+    def has_audio(self):
+        return self.audio is not None
+
+    @property
+    def has_video(self):
+        return self.video is not None
+
+    @property
+    def resolution(self):
+        return (self.video.width, self.video.height) if self.video else None
+
+    @property
+    def fps(self):
+        return self.video.fps if self.video else None
+
+    @property
+    def sample_rate(self):
+        return self.audio.sample_rate if self.audio else None
+
+    def __repr__(self):
+        return f"MediaInfo({self.path!r}, duration={self.duration}, resolution={self.resolution}, fps={self.fps}, sample_rate={self.sample_rate})"
+
+
+_cache = collections.OrderedDict()
+_lock = threading.Lock()
+MAX_ENTRIES = 512
+
+def probe(path):
+    """
+    MediaInfo for path from a single ffprobe call, memoized per (path, mtime, size) so a file
+    rewritten in place is probed again. Raises RuntimeError if ffprobe can't read the file.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    out = subprocess.run(["ffprobe", "-v", "error", "-print_format", "json", "-show_streams", "-show_format", path],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"ffprobe failed on {path}: {out.stderr.strip()}")
+    info = MediaInfo(str(path), json.loads(out.stdout or "{}"))
+    with _lock:
+        _cache[key] = info
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return info
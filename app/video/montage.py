@@ -1,70 +1,167 @@
-import cv2, numpy as np, math, os, subprocess
+import cv2, numpy as np, math, multiprocessing, os, pathlib, subprocess
 from app.video.assemble import audio_duration_sec
 
-def ken_burns_clip(images, out_path:str, audio_file:str, fps=25, size=(960,540)):
+def _pool_context():
+    # Never fork: the pool is started from scheduler threads while resident torch engines run on
+    # others, and a forked child can inherit their held (OpenMP, allocator) locks and hang.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _load_source(img_path, size):
+    img = cv2.imread(img_path)
+    if img is None:
+        # fallback: blank frame
+        w, h = size
+        img = np.zeros((h,w,3), dtype=np.uint8)
+    return img
+
+def _segment_transforms(iw, ih, size, n_frames):
+    """
+    Affine matrices (n_frames, 2, 3) mapping source pixels to output pixels for one pan/zoom segment,
+    plus the factor the source should be pre-downscaled by. Zoom goes 1.05 -> 1.15 and the crop window
+    pans from center slightly to right/down, covering the target aspect ratio.
+    """
+    w, h = size
+    t = np.arange(n_frames, dtype=np.float64) / max(1, n_frames-1)
+    zoom = 1.05 + 0.1 * t
+    target_aspect = w / h
+    if iw / ih > target_aspect:
+        # Image is wider than target aspect ratio, scale to target height and crop width
+        crop_h = ih / zoom
+        crop_w = crop_h * target_aspect
+    else:
+        # Image is taller than target aspect ratio, scale to target width and crop height
+        crop_w = iw / zoom
+        crop_h = crop_w / target_aspect
+    crop_w = np.minimum(crop_w, iw)
+    crop_h = np.minimum(crop_h, ih)
+    cx = np.clip((iw - crop_w) * (0.5 + 0.1 * t), 0, iw - crop_w)
+    cy = np.clip((ih - crop_h) * (0.5 + 0.1 * t), 0, ih - crop_h)
+
+    # The tightest crop still needs w output pixels across; anything beyond that is wasted per-frame work.
+    prescale = min(1.0, w / float(crop_w.min()))
+    sx = w / crop_w / prescale
+    sy = h / crop_h / prescale
+    mats = np.zeros((n_frames, 2, 3), dtype=np.float64)
+    mats[:, 0, 0] = sx
+    mats[:, 0, 2] = -cx * prescale * sx
+    mats[:, 1, 1] = sy
+    mats[:, 1, 2] = -cy * prescale * sy
+    return prescale, mats
+
+def _segment_frames(img_path, size, n_frames, start=0, stop=None):
+    """Yield frames [start, stop) of the pan/zoom segment for one image. The yielded buffer is reused."""
+    w, h = size
+    img = _load_source(img_path, size)
+    ih, iw = img.shape[:2]
+    prescale, mats = _segment_transforms(iw, ih, size, n_frames)
+    if prescale < 1.0:
+        img = cv2.resize(img, (max(1, round(iw*prescale)), max(1, round(ih*prescale))), interpolation=cv2.INTER_AREA)
+    frame = np.empty((h, w, 3), dtype=np.uint8)
+    for m in mats[start:stop]:
+        cv2.warpAffine(img, m, (w, h), dst=frame, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        yield frame
+
+def _open_encoder(out_path, audio_file, fps, size, lossless=False):
+    """One ffmpeg process: raw BGR frames on stdin (+ the scene audio, if given) -> finished clip."""
+    w, h = size
+    if lossless:
+        codec = ["-c:v", "ffv1"]
+    else:
+        codec = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p"]
+    cmd = ["ffmpeg", "-y", "-loglevel", "error",
+           "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", str(fps), "-i", "-"]
+    if audio_file:
+        cmd += ["-i", audio_file, "-map", "0:v", "-map", "1:a", *codec,
+                "-c:a", "pcm_s16le" if lossless else "aac", "-shortest", out_path]
+    else:
+        cmd += [*codec, out_path]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE), cmd
+
+def _encode_frames(frames, out_path, audio_file, fps, size, lossless=False, pad_frames=0):
+    proc, cmd = _open_encoder(out_path, audio_file, fps, size, lossless)
+    frame = None
+    try:
+        for frame in frames:
+            proc.stdin.write(frame.data)
+        # pad last frame if needed
+        for _ in range(pad_frames if frame is not None else 0):
+            proc.stdin.write(frame.data)
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its return code below carries the error
+    finally:
+        proc.stdin.close()
+    ret = proc.wait()
+    if ret != 0:
+        raise subprocess.CalledProcessError(ret, cmd)
+    return out_path
+
+def _render_chunk(job):
+    """Process-pool entry point: encode one chunk of one segment to its own video-only file."""
+    img_path, size, seg_frames, start, stop, pad_frames, fps, chunk_path, lossless = job
+    cv2.setNumThreads(1)  # parallelism comes from the pool; don't oversubscribe
+    frames = _segment_frames(img_path, size, seg_frames, start, stop)
+    return _encode_frames(frames, chunk_path, None, fps, size, lossless, pad_frames)
+
+def _plan_chunks(images, seg_frames, pad_frames, chunk_frames):
+    """(img_path, start, stop, pad) jobs: one per image segment, long segments split into chunk_frames pieces."""
+    jobs = []
+    for idx, img_path in enumerate(images):
+        bounds = list(range(0, seg_frames, chunk_frames)) + [seg_frames]
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            last = idx == len(images)-1 and stop == seg_frames
+            jobs.append((img_path, start, stop, pad_frames if last else 0))
+    return jobs
+
+def ken_burns_clip(images, out_path:str, audio_file:str, fps=25, size=(960,540), lossless=False, workers=None, chunk_frames=250):
     """
     Simple pan/zoom montage from a list of image paths.
     - images: list of image file paths
     - out_path: output video path
+    - lossless: write FFV1 video + PCM audio (use a .mkv out_path) for the single-encode pipeline
+    - workers: processes used to render segments/chunks in parallel (default: KEN_BURNS_WORKERS or all cores)
+    Frames are generated with warpAffine from a per-segment transform table and streamed to ffmpeg.
     """
-    w, h = size
     total_frames = int(audio_duration_sec(audio_file) * fps)
     if not images:
         raise ValueError("No images provided for montage.")
     # Equal segment per image
     seg_frames = max(1, total_frames // len(images))
+    pad_frames = max(0, total_frames - seg_frames * len(images))
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # will be recompressed later via ffmpeg
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    writer = cv2.VideoWriter(out_path, fourcc, fps, (w, h))
-
-    for idx, img_path in enumerate(images):
-        img = cv2.imread(img_path)
-        if img is None:
-            # fallback: blank frame
-            img = np.zeros((h,w,3), dtype=np.uint8)
-        ih, iw = img.shape[:2]
-        current_aspect = iw / ih
-        target_aspect = w / h
-
-        for f in range(seg_frames):
-            t = f / max(1, seg_frames-1)
-            # zoom from 1.05 -> 1.15
-            zoom = 1.05 + 0.1 * t
-
-            # Calculate crop dimensions maintaining aspect ratio to cover the target
-            if current_aspect > target_aspect:
-                # Image is wider than target aspect ratio, scale to target height and crop width
-                crop_h_scaled = int(ih / zoom)
-                crop_w_scaled = int(crop_h_scaled * target_aspect)
-            else:
-                # Image is taller than target aspect ratio, scale to target width and crop height
-                crop_w_scaled = int(iw / zoom)
-                crop_h_scaled = int(crop_w_scaled / target_aspect)
-
-            # Ensure crop dimensions are within image bounds
-            crop_w = min(crop_w_scaled, iw)
-            crop_h = min(crop_h_scaled, ih)
-
-            # pan from center slightly to right/down
-            cx = int((iw - crop_w) * (0.5 + 0.1 * t))
-            cy = int((ih - crop_h) * (0.5 + 0.1 * t))
-            cx = max(0, min(cx, iw - crop_w))
-            cy = max(0, min(cy, ih - crop_h))
-
-            crop = img[cy:cy+crop_h, cx:cx+crop_w]
-            frame = cv2.resize(crop, (w, h), interpolation=cv2.INTER_CUBIC)
-            writer.write(frame)
+    if workers is None:
+        workers = int(os.getenv("KEN_BURNS_WORKERS", os.cpu_count() or 1))
+    jobs = _plan_chunks(images, seg_frames, pad_frames, max(1, chunk_frames))
 
-    # pad last frame if needed
-    written = seg_frames * len(images)
-    for _ in range(max(0, total_frames - written)):
-        writer.write(frame)
+    if workers <= 1 or len(jobs) == 1:
+        def frames():
+            for img_path in images:
+                yield from _segment_frames(img_path, size, seg_frames)
+        return _encode_frames(frames(), out_path, audio_file, fps, size, lossless, pad_frames)
 
-    out_path_audio = out_path.strip().split(".mp4")[0]+"_audio.mp4"   
-    writer.release()
-    cmd = ["ffmpeg", "-i", out_path, "-i", audio_file, "-c:v", "copy", "-c:a", "aac", "-shortest", out_path_audio]
-    subprocess.run(cmd, check=True)
-    os.remove(out_path)
-    os.rename(out_path_audio, out_path)   
+    # Segment parameters depend only on the frame index, so chunks render independently and
+    # are joined by stream copy; the audio is muxed in the same (copy) step.
+    from concurrent.futures import ProcessPoolExecutor
+    stem, ext = os.path.splitext(out_path)
+    chunk_ext = ".mkv" if lossless else ".mp4"
+    chunk_paths = [f"{stem}_kb{i:04d}{chunk_ext}" for i in range(len(jobs))]
+    list_path = f"{stem}_kb.txt"
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=_pool_context()) as pool:
+            list(pool.map(_render_chunk, [(img_path, size, seg_frames, start, stop, pad, fps, cp, lossless)
+                                          for (img_path, start, stop, pad), cp in zip(jobs, chunk_paths)]))
+        with open(list_path, "w", encoding="utf-8") as f:
+            for cp in chunk_paths:
+                f.write(f"file '{pathlib.Path(cp).resolve().as_posix()}'\n")
+        # cut at the exact video length: -shortest over a stream-copied video is timing-dependent
+        # in threaded ffmpeg builds and can drop the last frames
+        n_frames = sum(stop - start + pad for _, start, stop, pad in jobs)
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+                        "-i", audio_file, "-map", "0:v", "-map", "1:a", "-c:v", "copy",
+                        "-c:a", "pcm_s16le" if lossless else "aac", "-t", f"{n_frames / fps:.6f}", out_path], check=True)
+    finally:
+        for p in [*chunk_paths, list_path]:
+            if os.path.exists(p):
+                os.remove(p)
     return out_path
@@ -1,8 +1,50 @@
 import os, sys, shutil, subprocess
+from app.video.face_cache import FaceAnalysisCache
 
-def generate_talking_head(portrait_path, audio_wav, out_mp4, engine="wav2lip", target_width=960, target_height=540):
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _raw_path(out_mp4):
+    root, ext = os.path.splitext(out_mp4)
+    return f"{root}_raw{ext}"
+
+def _standardize(raw_output, out_mp4, target_width, target_height, passthrough=False):
+    """
+    Scale/crop the engine output to the target size, or hand it over untouched when the final encode
+    will do it (the engines then wrote a lossless FFV1/PCM file, so nothing is encoded lossy twice).
+    """
+    if passthrough:
+        os.replace(raw_output, out_mp4)
+        return
+    subprocess.run([
+        "ffmpeg", "-y", "-i", raw_output,
+        "-vf", f"scale={target_width}:{target_height}:force_original_aspect_ratio=increase,crop={target_width}:{target_height},pad=width=ceil(iw/2)*2:height=ceil(ih/2)*2",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac",
+        out_mp4
+    ], check=True)
+    os.remove(raw_output)
+
+def _wav2lip_engine(repo):
+    """Resident Wav2Lip engine (model + S3FD detector loaded once per process)."""
+    if repo not in sys.path:
+        sys.path.insert(0, repo)
+    from wav2lip_engine import get_engine
+    return get_engine(os.path.join(repo, "checkpoints", "Wav2Lip-SD-GAN.pt"))
+
+def _sadtalker_engine(repo):
+    """Resident SadTalker engine (3DMM, audio2coeff and face renderer loaded once per process)."""
+    if repo not in sys.path:
+        sys.path.insert(0, repo)
+    from sadtalker_engine import get_engine
+    return get_engine(os.path.join(repo, "checkpoints"), size=256, preprocess="full")
+
+def generate_talking_head(portrait_path, audio_wav, out_mp4, engine="wav2lip", target_width=960, target_height=540, passthrough=False,
+                          analysis_cache_dir=None, audio_features=None):
     """
     Generate talking head with standardized output resolution to prevent stretching.
+    passthrough=True skips the standardizing re-encode (single-encode mode scales in the final filtergraph);
+    the engine then writes a lossless FFV1 + PCM intermediate, so give a .mkv out_mp4 as for Ken Burns.
+    analysis_cache_dir: reuse per-portrait face boxes / crops / 3DMM coefficients across scenes and runs.
+    audio_features: shared AudioFeatures front-end for the in-process engines (decode + mel once per WAV).
     """
     os.makedirs(os.path.dirname(out_mp4), exist_ok=True)
 
@@ -10,29 +52,26 @@ def generate_talking_head(portrait_path, audio_wav, out_mp4, engine="wav2lip", t
         repo = os.getenv("WAV2LIP_PATH", None)
         if repo and os.path.exists(repo):
             # Generate raw output first
-            raw_output = out_mp4.replace('.mp4', '_raw.mp4')
+            raw_output = _raw_path(out_mp4)
             
-            # Example call (this depends on your local Wav2Lip setup)
-            # Adjust paths/flags to match your cloned repo.
-            cmd = [sys.executable, os.path.join(repo, "inference.py"),
-                "--checkpoint_path", os.path.join(repo, "checkpoints", "Wav2Lip-SD-GAN.pt"),
-                "--face", portrait_path,
-                "--audio", audio_wav,
-                "--outfile", raw_output
-            ]
-            subprocess.run(cmd, check=True)
+            # In-process by default; WAV2LIP_SUBPROCESS=1 runs the inference.py CLI instead
+            if os.getenv("WAV2LIP_SUBPROCESS") != "1":
+                analysis_cache = FaceAnalysisCache(analysis_cache_dir) if analysis_cache_dir else None
+                _wav2lip_engine(repo).generate(portrait_path, audio_wav, raw_output, analysis_cache=analysis_cache,
+                                               audio_features=audio_features, lossless=passthrough)
+            else:
+                cmd = [sys.executable, os.path.join(repo, "inference.py"),
+                    "--checkpoint_path", os.path.join(repo, "checkpoints", "Wav2Lip-SD-GAN.pt"),
+                    "--face", portrait_path,
+                    "--audio", audio_wav,
+                    "--outfile", raw_output
+                ]
+                if passthrough:
+                    cmd.append("--lossless")
+                subprocess.run(cmd, check=True)
             
             # Post-process to standardize resolution and prevent stretching
-            subprocess.run([
-                "ffmpeg", "-y", "-i", raw_output,
-                "-vf", f"scale={target_width}:{target_height}:force_original_aspect_ratio=increase,crop={target_width}:{target_height},pad=width=ceil(iw/2)*2:height=ceil(ih/2)*2",
-                "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac",
-                out_mp4
-            ], check=True)
-            
-            # Clean up raw output
-            if os.path.exists(raw_output):
-                os.remove(raw_output)
+            _standardize(raw_output, out_mp4, target_width, target_height, passthrough)
             return out_mp4
         else:
             raise RuntimeError("WAV2LIP_PATH not set or invalid. Install Wav2Lip and set environment variable.")
@@ -40,42 +79,38 @@ def generate_talking_head(portrait_path, audio_wav, out_mp4, engine="wav2lip", t
         repo = os.getenv("SADTALKER_PATH", None)
         if repo and os.path.exists(repo):
             # Generate raw output first
-            raw_output = out_mp4.replace('.mp4', '_raw.mp4')
-            
-            # Example call (adjust to your local SadTalker CLI)
-            cmd = [sys.executable, os.path.join(repo, "inference.py"),
-                "--source_image", portrait_path,
-                "--driven_audio", audio_wav,
-                "--checkpoint_dir", "third_party/SadTalker/checkpoints/",
-                "--bfm_folder", "third_party/SadTalker/checkpoints/BFM_Fitting",
-                "--result_dir", os.path.dirname(out_mp4),
-                "--enhancer", "gfpgan",
-                "--still",
-                "--preprocess", "full",
-                "--expression_scale", "1.0"
-            ]
-            subprocess.run(cmd, check=True)
-            
-            # Find output mp4 under result_dir, move/rename to raw_output
-            # (This part needs to be adapted based on SadTalker's actual output naming)
-            # For now, assuming it outputs to the result_dir with a predictable name
-            result_files = [f for f in os.listdir(os.path.dirname(out_mp4)) if f.endswith('.mp4')]
-            if result_files:
-                temp_result = os.path.join(os.path.dirname(out_mp4), result_files[0])
-                if temp_result != raw_output:
-                    os.rename(temp_result, raw_output)
+            raw_output = _raw_path(out_mp4)
             
+            # In-process by default; SADTALKER_SUBPROCESS=1 runs the inference.py CLI instead
+            if os.getenv("SADTALKER_SUBPROCESS") != "1":
+                analysis_cache = FaceAnalysisCache(analysis_cache_dir) if analysis_cache_dir else None
+                _sadtalker_engine(repo).generate(portrait_path, audio_wav, raw_output, still=True, enhancer="gfpgan",
+                                                 expression_scale=1.0, analysis_cache=analysis_cache,
+                                                 audio_features=audio_features, lossless=passthrough)
+            else:
+                cmd = [sys.executable, os.path.join(repo, "inference.py"),
+                    "--source_image", portrait_path,
+                    "--driven_audio", audio_wav,
+                    "--checkpoint_dir", os.path.join(repo, "checkpoints"),
+                    "--bfm_folder", os.path.join(repo, "checkpoints", "BFM_Fitting"),
+                    "--outfile", raw_output,
+                    "--enhancer", "gfpgan",
+                    "--still",
+                    "--preprocess", "full",
+                    "--expression_scale", "1.0"
+                ]
+                if passthrough:
+                    cmd.append("--lossless")
+                env = None
+                if analysis_cache_dir:
+                    cmd += ["--analysis_cache_dir", analysis_cache_dir]
+                    # inference.py imports the cache from this app
+                    env = os.environ.copy()
+                    env["PYTHONPATH"] = os.pathsep.join(p for p in [PROJECT_ROOT, env.get("PYTHONPATH")] if p)
+                subprocess.run(cmd, check=True, env=env)
+
             # Post-process to standardize resolution
-            if os.path.exists(raw_output):
-                subprocess.run([
-                    "ffmpeg", "-y", "-i", raw_output,
-                    "-vf", f"scale={target_width}:{target_height}:force_original_aspect_ratio=increase,crop={target_width}:{target_height},pad=width=ceil(iw/2)*2:height=ceil(ih/2)*2",
-                    "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac",
-                    out_mp4
-                ], check=True)
-                
-                # Clean up raw output
-                os.remove(raw_output)
+            _standardize(raw_output, out_mp4, target_width, target_height, passthrough)
             
             return out_mp4
         else:
@@ -1,116 +1,137 @@
 import subprocess
 import os
 import json
-import tempfile
-import shutil
 import argparse
+from app.video.media_info import probe
 
-def get_video_duration(video_path):
-    """Gets the duration of a video in seconds using ffprobe."""
-    try:
-        probe = subprocess.run([
-            "ffprobe", "-v", "error", "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1", video_path
-        ], capture_output=True, text=True, check=True)
-        return float(probe.stdout.strip())
-    except (subprocess.CalledProcessError, ValueError):
-        print(f"Warning: Could not get duration for {video_path}. Assuming 0.")
-        return 0.0
-
-def _pad_video(input_path, target_duration, temp_output_path):
+def _load_manifest(path):
     """
-    Pads a video (video stream with last frame, audio with silence) to a target duration.
-    If video is already long enough, it's just copied.
+    Compose jobs from a manifest: JSON list / JSON lines of {"inputs": [...], "output": ..., "cols": N}
+    or CSV lines "in1,in2[,...],out". Relative paths resolve against the manifest's directory.
     """
-    current_duration = get_video_duration(input_path)
-
-    if current_duration >= target_duration:
-        shutil.copyfile(input_path, temp_output_path)
-        return
-
-    pad_duration = target_duration - current_duration
-
-    # Check for audio stream
-    audio_probe = subprocess.run([
-        "ffprobe", "-v", "error", "-select_streams", "a:0",
-        "-show_entries", "stream=codec_type", "-of", "csv=p=0", input_path
-    ], capture_output=True, text=True)
-    has_audio = audio_probe.stdout.strip() == "audio"
-
-    filter_complex = f"[0:v]tpad=stop_mode=clone:stop_duration={pad_duration}[v_padded]"
-    map_options = ["-map", "[v_padded]"]
-
-    if has_audio:
-        # Get audio sample rate for apad
-        sr_probe = subprocess.run([
-            "ffprobe", "-v", "error", "-select_streams", "a:0",
-            "-show_entries", "stream=sample_rate", "-of", "default=noprint_wrappers=1:nokey=1", input_path
-        ], capture_output=True, text=True)
-        sample_rate = sr_probe.stdout.strip() if sr_probe.stdout.strip() else "44100"
-
-        filter_complex += f";[0:a]apad=whole_dur={target_duration}[a_padded]"
-        map_options.extend(["-map", "[a_padded]"])
+    base = os.path.dirname(os.path.abspath(path))
+    fix = lambda p: p if os.path.isabs(p) else os.path.join(base, p)
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    jobs = []
+    if text.lstrip().startswith("["):
+        rows = json.loads(text)
+    elif text.lstrip().startswith("{"):
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
     else:
-        # If no audio, add a silent audio track for the entire target duration
-        filter_complex += f";anullsrc=channel_layout=stereo:sample_rate=44100:duration={target_duration}[a_padded]"
-        map_options.extend(["-map", "[a_padded]"])
+        rows = []
+        for line in text.splitlines():
+            parts = [p.strip() for p in line.split(",") if p.strip()]
+            if line.strip().startswith("#") or not parts:
+                continue
+            if len(parts) < 2:
+                raise ValueError(f"Manifest line needs at least one input and an output: {line!r}")
+            rows.append({"inputs": parts[:-1], "output": parts[-1]})
+    for row in rows:
+        jobs.append({"inputs": [fix(p) for p in row["inputs"]], "output": fix(row["output"]), "cols": row.get("cols")})
+    return jobs
+
+def compose_videos(inputs, output_path, cols=None, crf=23, preset="fast", threads=None):
+    """
+    Composes videos side-by-side (one row) or as an N-up grid (cols per row) in a single ffmpeg run:
+    shorter inputs hold their last frame and get silence padding (tpad/apad), inputs without audio
+    get a silent track, the tiles are stacked and the audio tracks merged, and the result is encoded
+    once. Each input is probed once.
+    """
+    if not inputs:
+        raise ValueError("No input videos given.")
+    infos = [probe(v) for v in inputs]
+    cols = cols or len(inputs)
+    rows = -(-len(inputs) // cols)
+    max_duration = max(info.duration for info in infos)
+    if infos[0].resolution is None:
+        raise ValueError(f"{inputs[0]} has no video stream.")
+    w0, h0 = infos[0].resolution
+
+    chains, v_labels, a_labels = [], [], []
+    for i, info in enumerate(infos):
+        pad = max_duration - info.duration
+        v = f"[{i}:v]"
+        if pad > 0:
+            v += f"tpad=stop_mode=clone:stop_duration={pad},"
+        if rows == 1:
+            # a single row only needs equal heights
+            v += f"scale=-2:{h0},setsar=1"
+        else:
+            v += f"scale={w0}:{h0}:force_original_aspect_ratio=decrease,pad={w0}:{h0}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+        chains.append(f"{v}[v{i}]")
+        v_labels.append(f"[v{i}]")
+        if info.has_audio:
+            chains.append(f"[{i}:a]apad=whole_dur={max_duration}[a{i}]")
+        else:
+            chains.append(f"anullsrc=channel_layout=stereo:sample_rate=44100,atrim=0:{max_duration}[a{i}]")
+        a_labels.append(f"[a{i}]")
+
+    if len(inputs) == 1:
+        chains.append("[v0]null[v_out]")
+    elif rows == 1:
+        chains.append(f"{''.join(v_labels)}hstack=inputs={len(inputs)}[v_out]")
+    else:
+        layout = "|".join(f"{(i % cols) * w0}_{(i // cols) * h0}" for i in range(len(inputs)))
+        chains.append(f"{''.join(v_labels)}xstack=inputs={len(inputs)}:layout={layout}:fill=black[v_out]")
+    if len(inputs) == 1:
+        chains.append("[a0]anull[a_out]")
+    else:
+        chains.append(f"{''.join(a_labels)}amerge=inputs={len(inputs)}[a_out]")
 
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
     cmd = [
-        "ffmpeg", "-y", "-i", input_path,
-        "-filter_complex", filter_complex,
-        *map_options,
-        "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-        "-c:a", "aac", "-b:a", "128k",
-        temp_output_path
+        "ffmpeg", "-y",
+        *[arg for v in inputs for arg in ("-i", v)],
+        "-filter_complex", ";".join(chains),
+        "-map", "[v_out]",
+        "-map", "[a_out]",
+        "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "192k",
+        *(["-threads", str(threads)] if threads else []),
+        "-t", f"{max_duration}",
+        output_path
     ]
-    subprocess.run(cmd, check=True)
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return output_path
 
+def batch_compose(jobs, workers=None):
+    """
+    Runs compose jobs ({"inputs", "output", "cols"}) concurrently. ffmpeg threads are split between
+    the workers. Returns [(output, error or None)] in job order; one failure doesn't stop the rest.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    workers = workers or max(1, (os.cpu_count() or 1) // 2)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    def run(job):
+        try:
+            compose_videos(job["inputs"], job["output"], cols=job.get("cols"), threads=threads)
+            print(f"[COMBINE] {job['output']}")
+            return job["output"], None
+        except subprocess.CalledProcessError as e:
+            err = (e.stderr or "").strip().splitlines()
+            return job["output"], err[-1] if err else str(e)
+        except Exception as e:
+            return job["output"], f"{type(e).__name__}: {e}"
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run, jobs))
+    for out, err in results:
+        if err:
+            print(f"[COMBINE] failed {out}: {err}")
+    return results
 
 def side_by_side_videos(video1_path, video2_path, output_path):
     """
     Combines two videos side-by-side. If one video is shorter,
     its last frame is held static and audio padded with silence.
     """
-    temp_files = []
     try:
-        duration1 = get_video_duration(video1_path)
-        duration2 = get_video_duration(video2_path)
-        max_duration = max(duration1, duration2)
-
-        # Pad video 1
-        temp_video1_padded = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
-        temp_files.append(temp_video1_padded)
-        print(f"Padding/Processing video 1: {video1_path}")
-        _pad_video(video1_path, max_duration, temp_video1_padded)
-
-        # Pad video 2
-        temp_video2_padded = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
-        temp_files.append(temp_video2_padded)
-        print(f"Padding/Processing video 2: {video2_path}")
-        _pad_video(video2_path, max_duration, temp_video2_padded)
-
-        # Ensure the output directory exists
-        output_dir = os.path.dirname(output_path)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        # Combine padded videos side-by-side with merged audio
         print("Combining videos side by side...")
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", temp_video1_padded,
-            "-i", temp_video2_padded,
-            "-filter_complex",
-            "[0:v][1:v]hstack=inputs=2[v_out];"
-            "[0:a][1:a]amerge=inputs=2[a_out]",
-            "-map", "[v_out]",
-            "-map", "[a_out]",
-            "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-            "-c:a", "aac", "-b:a", "192k",
-            "-shortest", # Ensure output doesn't exceed padded audio duration
-            output_path
-        ]
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        compose_videos([video1_path, video2_path], output_path)
         print(f"Successfully created side-by-side video: {output_path}")
 
     except subprocess.CalledProcessError as e:
@@ -118,19 +139,29 @@ def side_by_side_videos(video1_path, video2_path, output_path):
         print(f"FFmpeg stderr: {e.stderr}") # e.stderr is already decoded because of text=True
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-    finally:
-        # Clean up temporary files
-        for f in temp_files:
-            if os.path.exists(f):
-                os.remove(f)
-        print("Cleaned up temporary files.")
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Combine two videos side-by-side, padding shorter videos with static last frame and silent audio.")
-    parser.add_argument("--vid1", required=True, help="Path to the first input video.")
-    parser.add_argument("--vid2", required=True, help="Path to the second input video.")
-    parser.add_argument("--output", required=True, help="Path for the output side-by-side video.")
+    parser = argparse.ArgumentParser(description="Combine videos side-by-side or in a grid, padding shorter videos with static last frame and silent audio.")
+    parser.add_argument("--vid1", help="Path to the first input video.")
+    parser.add_argument("--vid2", help="Path to the second input video.")
+    parser.add_argument("--inputs", nargs="+", help="Input videos for an N-up layout (instead of --vid1/--vid2).")
+    parser.add_argument("--cols", type=int, default=None, help="Tiles per row (default: all in one row).")
+    parser.add_argument("--output", help="Path for the output video.")
+    parser.add_argument("--manifest", help="Batch mode: JSON/JSONL/CSV manifest of compose jobs (see _load_manifest).")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent jobs in batch mode (default: half the cores).")
 
     args = parser.parse_args()
 
-    side_by_side_videos(args.vid1, args.vid2, args.output)
+    if args.manifest:
+        results = batch_compose(_load_manifest(args.manifest), workers=args.workers)
+        failed = sum(1 for _, err in results if err)
+        print(f"{len(results) - failed} of {len(results)} video(s) combined.")
+        raise SystemExit(1 if failed else 0)
+    if not args.output:
+        parser.error("--output is required without --manifest")
+    if args.inputs:
+        compose_videos(args.inputs, args.output, cols=args.cols)
+    elif args.vid1 and args.vid2:
+        side_by_side_videos(args.vid1, args.vid2, args.output)
+    else:
+        parser.error("give --vid1/--vid2, --inputs or --manifest")
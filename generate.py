@@ -1,20 +1,42 @@
-import argparse, pathlib, os
+import argparse, pathlib, os, sys
 from app.pipeline import run_project
+from app.batch import run_batch
 from app.utils.io import ensure_dir
+from app.utils.scheduler import parse_limits
+from app.audio.cache import TTSCache
 
 os.environ['SADTALKER_PATH'] = os.path.dirname(os.path.abspath(__file__)) + "/third_party/SadTalker"
 os.environ['FACEFUSION_PATH'] = os.path.dirname(os.path.abspath(__file__)) + "/third_party/facefusion"
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--spec", required=True, help="Path to spec JSON")
-    ap.add_argument("--out", required=True, help="Output MP4 path")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--spec", help="Path to spec JSON")
+    src.add_argument("--batch", help="Directory of spec JSONs or a JSONL of specs, rendered in one process")
+    ap.add_argument("--out", required=True, help="Output MP4 path (output directory with --batch)")
     ap.add_argument("--workdir", default="runs/_latest", help="Working directory for intermediates")
+    ap.add_argument("--no-cache", action="store_true", help="Disable the per-stage artifact cache")
+    ap.add_argument("--cache-dir", default=None, help="Artifact cache directory (default: $AI_SHORTS_CACHE or <workdir>/cache)")
+    ap.add_argument("--workers", default=None, help="Per-resource concurrency limits, e.g. model=1,ffmpeg=4,io=8")
+    ap.add_argument("--single-encode", action="store_true", default=None,
+                    help="Keep scene intermediates lossless and encode once at the end")
+    ap.add_argument("--tts-cache", default=None, help="Shared TTS WAV cache directory (default: $AI_SHORTS_TTS_CACHE)")
+    ap.add_argument("--tts-cache-mb", type=float, default=2048, help="TTS cache size budget in MB (LRU eviction)")
+    ap.add_argument("--trace", default=None, help="Also write a Chrome trace (chrome://tracing, Perfetto) of the run's stage spans here")
+    ap.add_argument("--batch-workers", type=int, default=2, help="Specs rendered concurrently in --batch mode")
     args = ap.parse_args()
 
+    tts_cache = TTSCache(args.tts_cache, max_bytes=args.tts_cache_mb * 1024**2) if args.tts_cache else None
+    if args.batch:
+        report = run_batch(args.batch, args.out, args.workdir, workers=args.batch_workers, use_cache=not args.no_cache,
+                           cache_dir=args.cache_dir, limits=parse_limits(args.workers), single_encode=args.single_encode,
+                           tts_cache=tts_cache)
+        sys.exit(1 if report["counts"]["failed"] else 0)
+
     ensure_dir(pathlib.Path(args.out).parent)
     ensure_dir(args.workdir)
-    run_project(args.spec, args.out, args.workdir)
+    run_project(args.spec, args.out, args.workdir, use_cache=not args.no_cache, cache_dir=args.cache_dir, limits=parse_limits(args.workers),
+                single_encode=args.single_encode, trace_path=args.trace, tts_cache=tts_cache)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
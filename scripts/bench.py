@@ -0,0 +1,310 @@
+"""
+CPU benchmark for the render pipeline. Runs offline: synthetic images and specs, a tone-WAV TTS and
+a still-frame talking head stand in for the model engines, so only our own code and ffmpeg are timed.
+
+  python scripts/bench.py                   # run, print a table, write <out>/results.json
+  python scripts/bench.py --save-baseline   # ... and store the results as the baseline
+  python scripts/bench.py --quick           # small sizes, one repeat
+
+Each repeat of each case runs in a fresh process so peak RSS is per case. Exits 1 if a case got slower
+(or bigger) than the baseline by more than --threshold / --mem-threshold.
+"""
+import argparse, hashlib, json, multiprocessing, os, pathlib, platform, statistics, subprocess, sys, time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+import soundfile as sf
+
+WORDS = "the quick brown fox jumps over a lazy dog while seven curious owls watch from the old oak tree".split()
+SECONDS_PER_WORD = 0.35
+
+# ---- deterministic stand-ins -------------------------------------------------------------------
+
+def synthetic_image(path, width, height, seed):
+    """Smooth colour field plus texture, so scaling/encoding costs look like a photo rather than a flat fill."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(2, height // 64), max(2, width // 64), 3), dtype=np.uint8)
+    img = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.normal(0, 12, img.shape)
+    cv2.imwrite(str(path), np.clip(img + noise, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 92])
+    return str(path)
+
+def tone_wav(path, seconds, seed=0, sr=22050):
+    """Mono 16-bit tone with a syllable-rate envelope (Piper writes 22.05 kHz mono)."""
+    t = np.arange(int(seconds * sr)) / sr
+    freq = 110 + seed % 120
+    env = 0.5 + 0.5 * np.sin(2 * np.pi * 3.0 * t) ** 2
+    sf.write(str(path), (0.3 * env * np.sin(2 * np.pi * freq * t)).astype(np.float32), sr, subtype="PCM_16")
+    return str(path)
+
+def script_for(seconds, seed=0):
+    n = max(1, int(round(seconds / SECONDS_PER_WORD)))
+    words = [WORDS[(seed + i) % len(WORDS)] for i in range(n)]
+    # punctuation every ~8 words so write_srt splits into several cues
+    return " ".join(w + ("," if i % 8 == 7 else "") for i, w in enumerate(words)) + "."
+
+def stub_synthesize(text, out_wav, engine="piper", voice=None, resident=True, cache=None):
+    """TTS stand-in: a tone as long as the text would take to read."""
+    os.makedirs(os.path.dirname(out_wav), exist_ok=True)
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+    return tone_wav(out_wav, max(1.0, len(text.split()) * SECONDS_PER_WORD), seed)
+
+def stub_talking_head(portrait_path, audio_wav, out_mp4, engine="wav2lip", target_width=960, target_height=540,
+                      passthrough=False, analysis_cache_dir=None, audio_features=None):
+    """Talking-head stand-in: the portrait held for the length of the audio, at the engine's usual output size."""
+    os.makedirs(os.path.dirname(out_mp4), exist_ok=True)
+    vf = "scale=512:512" if passthrough else \
+        f"scale={target_width}:{target_height}:force_original_aspect_ratio=increase,crop={target_width}:{target_height}"
+    subprocess.run(["ffmpeg", "-y", "-v", "error", "-loop", "1", "-framerate", "25", "-i", portrait_path, "-i", audio_wav,
+                    "-vf", vf, "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-c:a", "aac",
+                    "-shortest", out_mp4], check=True)
+    return out_mp4
+
+def synthetic_spec(path, assets, scenes, images, seconds, resolution, talking_head_every=3, watermark="ai-shorts"):
+    """N scenes of `seconds` each; every talking_head_every-th scene is a talking head, the rest Ken Burns."""
+    w, h = [int(x) for x in resolution.split("x")]
+    out = []
+    for i in range(scenes):
+        scene = {"id": f"s{i}", "script_text": script_for(seconds, i), "voice": {"engine": "stub"}}
+        if talking_head_every and i % talking_head_every == talking_head_every - 1:
+            scene.update(mode="talking_head", portrait=synthetic_image(assets / f"portrait_{i}.jpg", 720, 720, 1000 + i))
+        else:
+            # alternate landscape/portrait sources at a different size than the output
+            scene.update(mode="narration", images=[
+                synthetic_image(assets / f"img_{i}_{j}.jpg", *((w * 3 // 2, h * 3 // 2) if j % 2 == 0 else (h, w)), 100 * i + j)
+                for j in range(images)])
+        out.append(scene)
+    spec = {"project_title": "bench", "output": {"fps": 25, "resolution": resolution, "target_size_mb": 3},
+            "subtitles": True, "watermark": watermark, "scenes": out}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(spec, f, indent=2)
+    return str(path)
+
+# ---- cases ------------------------------------------------------------------------------------
+
+def plan(args):
+    """(name, kind, params) cases. Fixture inputs are built once by prepare() and excluded from the timings."""
+    cases = []
+    for res in args.resolutions:
+        for sec in args.durations:
+            cases.append((f"ken_burns/{res}/{sec:g}s", "ken_burns", {"res": res, "sec": sec}))
+            cases.append((f"burn_in/{res}/{sec:g}s", "burn_in", {"res": res, "sec": sec}))
+            cases.append((f"concat/{res}/{args.scenes}x{sec:g}s", "concat", {"res": res, "sec": sec}))
+            cases.append((f"compress/{res}/{args.scenes * sec:g}s", "compress", {"res": res, "sec": args.scenes * sec}))
+            cases.append((f"run_project/{res}/{args.scenes}x{sec:g}s", "run_project", {"res": res, "sec": sec, "single": False}))
+            cases.append((f"run_project_single/{res}/{args.scenes}x{sec:g}s", "run_project", {"res": res, "sec": sec, "single": True}))
+    for sec in args.durations:
+        cases.append((f"write_srt/{sec:g}s", "write_srt", {"sec": sec}))
+    return cases
+
+def _size(res):
+    return tuple(int(x) for x in res.split("x"))
+
+def _spec_name(res, scenes, sec, watermark):
+    return f"spec_{res}_{scenes}x{sec:g}s" + ("" if watermark else "_nowm")
+
+def prepare(args, root):
+    """Build inputs shared by the cases: images, WAVs, scene clips and specs. Reused if present."""
+    from app.video.montage import ken_burns_clip
+    fx = root / "fixtures"
+    fx.mkdir(parents=True, exist_ok=True)
+    wm = "" if args.no_watermark else "ai-shorts"
+    for res in args.resolutions:
+        w, h = _size(res)
+        imgs = [str(fx / f"kb_{res}_{j}.jpg") for j in range(args.images)]
+        for j, p in enumerate(imgs):
+            if not os.path.exists(p):
+                synthetic_image(p, *((w * 3 // 2, h * 3 // 2) if j % 2 == 0 else (h, w)), j)
+        for sec in sorted({*args.durations, *(args.scenes * s for s in args.durations)}):
+            wav = fx / f"tone_{sec:g}s.wav"
+            if not wav.exists():
+                tone_wav(wav, sec)
+            clip = fx / f"clip_{res}_{sec:g}s.mp4"
+            if not clip.exists():
+                ken_burns_clip(imgs, str(clip), str(wav), fps=25, size=(w, h))
+        for sec in args.durations:
+            spec_dir = fx / _spec_name(res, args.scenes, sec, wm)
+            spec_dir.mkdir(exist_ok=True)
+            if not (spec_dir / "spec.json").exists():
+                synthetic_spec(spec_dir / "spec.json", spec_dir, args.scenes, args.images, sec, res, watermark=wm)
+    return fx
+
+def run_case(kind, params, fx, work, watermark):
+    """Runs in a fresh process: times one call and returns its span (wall/cpu/RSS) plus output seconds and frames."""
+    from app.utils.trace import Tracer
+    from app.video.assemble import write_srt, burn_subtitles_and_watermark, concat_videos_ffmpeg
+    from app.video.compress import normalize_and_compress
+    from app.video.montage import ken_burns_clip
+    import app.pipeline as pipeline
+
+    work = pathlib.Path(work)
+    work.mkdir(parents=True, exist_ok=True)
+    res, sec = params.get("res"), params["sec"]
+    wav, clip = fx / f"tone_{sec:g}s.wav", fx / f"clip_{res}_{sec:g}s.mp4"
+    tracer = Tracer()
+    out_s, frames, stages = sec, int(sec * 25), None
+
+    if kind == "ken_burns":
+        imgs = sorted(str(p) for p in fx.glob(f"kb_{res}_*.jpg"))
+        with tracer.span(kind):
+            ken_burns_clip(imgs, str(work / "kb.mp4"), str(wav), fps=25, size=_size(res))
+    elif kind == "write_srt":
+        text, calls = script_for(sec), 200
+        with tracer.span(kind):
+            for _ in range(calls):
+                write_srt(text, str(wav), str(work / "s.srt"))
+        out_s, frames = sec * calls, None
+    elif kind == "burn_in":
+        srt = write_srt(script_for(sec), str(wav), str(work / "s.srt"))
+        with tracer.span(kind):
+            burn_subtitles_and_watermark(str(clip), srt, watermark, str(work / "burned.mp4"))
+    elif kind == "concat":
+        clips = [str(clip)] * params.get("scenes", 3)
+        with tracer.span(kind):
+            concat_videos_ffmpeg(clips, str(work / "merged.mp4"), *_size(res))
+        out_s, frames = sec * len(clips), int(sec * len(clips) * 25)
+    elif kind == "compress":
+        with tracer.span(kind):
+            normalize_and_compress(str(clip), str(work / "out.mp4"), *_size(res), fps=25, target_size_mb=3)
+    elif kind == "run_project":
+        pipeline.synthesize = stub_synthesize
+        pipeline.generate_talking_head = stub_talking_head
+        spec = fx / _spec_name(res, params["scenes"], sec, watermark) / "spec.json"
+        with tracer.span(kind):
+            pipeline.run_project(str(spec), str(work / "final.mp4"), str(work), use_cache=False,
+                                 single_encode=params["single"], tracer=tracer)
+        out_s, frames = sec * params["scenes"], int(sec * params["scenes"] * 25)
+        stages = {k: v for k, v in tracer.totals().items() if k != kind}
+    else:
+        raise ValueError(f"Unknown bench case: {kind}")
+
+    sp = next(s for s in tracer.spans if s["name"] == kind)
+    return {"wall_s": sp["wall_s"], "cpu_s": sp["cpu_s"], "peak_rss_mb": sp["peak_rss_mb"],
+            "child_peak_rss_mb": sp["child_peak_rss_mb"], "output_s": out_s, "frames": frames, "stages": stages}
+
+def measure(name, kind, params, args, fx, root):
+    """Median wall time over args.repeat fresh-process runs; max RSS."""
+    runs = []
+    ctx = multiprocessing.get_context("spawn")
+    for i in range(args.repeat):
+        work = root / "work" / name.replace("/", "_") / str(i)
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            runs.append(pool.submit(run_case, kind, {**params, "scenes": args.scenes}, fx, str(work),
+                                    "" if args.no_watermark else "ai-shorts").result())
+    wall = statistics.median(r["wall_s"] for r in runs)
+    r = runs[0]
+    return {"wall_s": round(wall, 4), "cpu_s": round(statistics.median(q["cpu_s"] for q in runs), 4),
+            "fps": round(r["frames"] / wall, 2) if r["frames"] and wall else None,
+            "s_per_output_s": round(wall / r["output_s"], 4),
+            "peak_rss_mb": max(q["peak_rss_mb"] or 0 for q in runs),
+            "child_peak_rss_mb": max(q["child_peak_rss_mb"] or 0 for q in runs), "repeats": len(runs),
+            "walls": [q["wall_s"] for q in runs], **({"stages": r["stages"]} if r["stages"] else {})}
+
+# ---- baseline ---------------------------------------------------------------------------------
+
+def host_info():
+    ff = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+    return {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count(),
+            "ffmpeg": ff.splitlines()[0] if ff else None}
+
+def compare(results, baseline, threshold, mem_threshold):
+    """
+    Per case: (name, wall ratio, rss ratio, flags). Peak RSS compares the larger of process and ffmpeg peaks.
+    A case that raised is flagged ERROR whether or not there is a baseline.
+    """
+    rows = []
+    for name, cur in results["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if "error" in cur:
+            rows.append((name, None, None, ["ERROR"]))
+            continue
+        if not base or "error" in base:
+            rows.append((name, None, None, []))
+            continue
+        wall = cur["wall_s"] / base["wall_s"] if base["wall_s"] else None
+        peak = lambda m: max(m.get("peak_rss_mb") or 0, m.get("child_peak_rss_mb") or 0)
+        mem = peak(cur) / peak(base) if peak(base) else None
+        flags = []
+        if wall is not None and wall > 1 + threshold:
+            flags.append("SLOWER")
+        if mem is not None and mem > 1 + mem_threshold:
+            flags.append("MEMORY")
+        rows.append((name, wall, mem, flags))
+    return rows
+
+def print_table(results, rows):
+    ratios = {name: (wall, mem, flags) for name, wall, mem, flags in rows}
+    print(f"{'case':44} {'wall s':>8} {'fps':>8} {'s/out-s':>8} {'rss MB':>8} {'ff MB':>8} {'vs base':>8}  flags")
+    for name, m in results["cases"].items():
+        if "error" in m:
+            print(f"{name:44} ERROR {m['error']}")
+            continue
+        wall, _, flags = ratios.get(name, (None, None, []))
+        fps = f"{m['fps']:.1f}" if m["fps"] else "-"
+        print(f"{name:44} {m['wall_s']:8.3f} {fps:>8} {m['s_per_output_s']:8.4f} "
+              f"{m['peak_rss_mb'] or 0:8.1f} {m['child_peak_rss_mb'] or 0:8.1f} "
+              f"{(f'{wall:.2f}x' if wall else '-'):>8}  {' '.join(flags)}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline CPU benchmark of the render pipeline")
+    ap.add_argument("--out", default="runs/bench", help="Fixtures, scratch output and results.json")
+    ap.add_argument("--baseline", default=None, help="Baseline JSON to compare against (default: <out>/baseline.json)")
+    ap.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    ap.add_argument("--resolutions", default="960x540", help="Comma-separated output sizes, e.g. 640x360,960x540,1280x720")
+    ap.add_argument("--durations", default="5,15", help="Comma-separated scene lengths in seconds")
+    ap.add_argument("--scenes", type=int, default=3, help="Scenes per synthetic spec (every third is a talking head)")
+    ap.add_argument("--images", type=int, default=3, help="Images per narration scene")
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per case; wall time is the median")
+    ap.add_argument("--only", default=None, help="Run only cases whose name contains this")
+    ap.add_argument("--quick", action="store_true", help="Smoke-test sizes: 640x360, 3 s scenes, 2 scenes, 1 repeat")
+    ap.add_argument("--no-watermark", action="store_true", help="Skip the drawtext watermark (ffmpeg builds without libfreetype)")
+    ap.add_argument("--threshold", type=float, default=0.15, help="Flag cases more than this fraction slower than baseline")
+    ap.add_argument("--mem-threshold", type=float, default=0.20, help="Flag cases whose peak RSS grew by more than this fraction")
+    args = ap.parse_args()
+    if args.quick:
+        args.resolutions, args.durations, args.scenes, args.images, args.repeat = "640x360", "3", 2, 2, 1
+    args.resolutions = [r.strip() for r in args.resolutions.split(",") if r.strip()]
+    args.durations = [float(d) for d in args.durations.split(",") if d.strip()]
+
+    root = pathlib.Path(args.out).resolve()
+    fx = prepare(args, root)
+    results = {"host": host_info(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "params": {k: getattr(args, k) for k in ("resolutions", "durations", "scenes", "images", "repeat", "no_watermark")},
+               "cases": {}}
+    for name, kind, params in plan(args):
+        if args.only and args.only not in name:
+            continue
+        print(f"[BENCH] {name}")
+        try:
+            results["cases"][name] = measure(name, kind, params, args, fx, root)
+        except Exception as e:
+            results["cases"][name] = {"error": f"{type(e).__name__}: {e}"}
+
+    baseline_path = pathlib.Path(args.baseline) if args.baseline else root / "baseline.json"
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+    if baseline and baseline.get("host", {}).get("cpus") != results["host"]["cpus"]:
+        print(f"[BENCH] baseline was recorded on a different host ({baseline['host']}); ratios are indicative only")
+    rows = compare(results, baseline, args.threshold, args.mem_threshold)
+    results["regressions"] = [{"case": n, "wall_ratio": w and round(w, 3), "rss_ratio": m and round(m, 3), "flags": f}
+                              for n, w, m, f in rows if f]
+    print_table(results, rows)
+
+    (root / "results.json").write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"[BENCH] baseline saved to {baseline_path}")
+    print(f"[BENCH] results in {root / 'results.json'}")
+    errors = [r["case"] for r in results["regressions"] if "ERROR" in r["flags"]]
+    if errors:
+        print(f"[BENCH] {len(errors)} case(s) failed: {', '.join(errors)}")
+        sys.exit(1)
+    if results["regressions"] and not args.save_baseline:
+        print(f"[BENCH] {len(results['regressions'])} regression(s) vs {baseline_path}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Accuracy/speed report for facefusion's ONNX models on CPU: stock session vs the CPU profile
+(explicit threads, graph optimization, cached optimized model) vs the INT8 dynamically quantized
+variant. Each variant runs the same random inputs; accuracy is measured against the stock model.
+
+  python scripts/onnx_cpu_report.py                          # swapper, enhancer, detector, landmarker
+  python scripts/onnx_cpu_report.py --models path/a.onnx --runs 50 --out report.json
+"""
+import argparse, json, os, pathlib, statistics, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FACEFUSION = os.path.join(ROOT, "third_party", "facefusion")
+sys.path.insert(0, FACEFUSION)
+
+import numpy as np
+import onnxruntime
+from facefusion.cpu_profile import create_cpu_session, quantize_model
+
+MODELS_DIR = os.path.join(FACEFUSION, ".assets", "models")
+# the models the face-swap stage loads, and the pool each belongs to
+DEFAULT_MODELS = {"inswapper_128_fp16": "face_swapper", "inswapper_128": "face_swapper", "gfpgan_1.4": "face_enhancer",
+                  "yoloface_8n": "face_detector", "2dfan4": "face_landmarker", "arcface_w600k_r50": "face_recognizer"}
+DTYPES = {"tensor(float)": np.float32, "tensor(float16)": np.float16, "tensor(double)": np.float64,
+          "tensor(int64)": np.int64, "tensor(int32)": np.int32, "tensor(uint8)": np.uint8}
+
+def random_inputs(session, seed=0):
+    rng = np.random.default_rng(seed)
+    feeds = {}
+    for inp in session.get_inputs():
+        shape = [d if isinstance(d, int) and d > 0 else 1 for d in inp.shape]
+        dtype = DTYPES.get(inp.type, np.float32)
+        if np.issubdtype(dtype, np.floating):
+            feeds[inp.name] = rng.uniform(-1, 1, shape).astype(dtype)
+        else:
+            feeds[inp.name] = rng.integers(0, 2, shape).astype(dtype)
+    return feeds
+
+def time_session(session, feeds, runs, warmup=2):
+    for _ in range(warmup):
+        outputs = session.run(None, feeds)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        outputs = session.run(None, feeds)
+        times.append((time.perf_counter() - start) * 1000)
+    return outputs, times
+
+def accuracy(ref, out):
+    """First-output agreement: max/mean abs error, cosine similarity and PSNR over the reference's range."""
+    ref, out = np.asarray(ref[0], np.float32).ravel(), np.asarray(out[0], np.float32).ravel()
+    err = np.abs(ref - out)
+    cos = float(np.dot(ref, out) / (np.linalg.norm(ref) * np.linalg.norm(out) + 1e-12))
+    mse = float(np.mean(err ** 2))
+    span = float(ref.max() - ref.min()) or 1.0
+    return {"max_abs": round(float(err.max()), 6), "mean_abs": round(float(err.mean()), 6), "cosine": round(cos, 6),
+            "psnr_db": round(10 * np.log10(span ** 2 / mse), 2) if mse > 0 else None}
+
+def _int8(model_path, cache_dir):
+    int8_path = quantize_model(model_path, cache_dir)
+    if int8_path is None:
+        raise RuntimeError("model could not be quantized dynamically (fp16 weights?)")
+    return int8_path
+
+def report_model(model_path, pool, args, cache_dir):
+    providers = ["CPUExecutionProvider"]
+    base_settings = {"intra_op_threads": args.intra_threads or os.cpu_count() or 1, "inter_op_threads": args.inter_threads,
+                     "graph_optimization": args.graph_optimization, "optimized_model_path": cache_dir, "int8": False}
+    variants = {
+        "stock": lambda: onnxruntime.InferenceSession(model_path, providers=providers),
+        "cpu_profile": lambda: create_cpu_session(model_path, base_settings, providers),
+        # a second load starts from the cached optimized graph
+        "cpu_profile_cached": lambda: create_cpu_session(model_path, base_settings, providers),
+        "int8": lambda: create_cpu_session(_int8(model_path, cache_dir), base_settings, providers),
+    }
+    rows, ref, feeds = {}, None, None
+    for name, make in variants.items():
+        start = time.perf_counter()
+        try:
+            session = make()
+        except Exception as e:
+            rows[name] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        load_ms = (time.perf_counter() - start) * 1000
+        feeds = feeds or random_inputs(session)
+        try:
+            outputs, times = time_session(session, feeds, args.runs)
+        except Exception as e:
+            rows[name] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        if ref is None:
+            ref = outputs
+        rows[name] = {"load_ms": round(load_ms, 1), "median_ms": round(statistics.median(times), 2),
+                      "mean_ms": round(statistics.mean(times), 2), **accuracy(ref, outputs)}
+    stock = rows.get("stock", {}).get("median_ms")
+    for row in rows.values():
+        if stock and row.get("median_ms"):
+            row["speedup"] = round(stock / row["median_ms"], 2)
+    return {"model": os.path.basename(model_path), "pool": pool, "variants": rows}
+
+def main():
+    ap = argparse.ArgumentParser(description="CPU accuracy/speed report for facefusion ONNX models")
+    ap.add_argument("--models", nargs="*", default=None, help="ONNX files (default: facefusion's swap-path models that are downloaded)")
+    ap.add_argument("--runs", type=int, default=20, help="Timed runs per variant (median reported)")
+    ap.add_argument("--intra-threads", type=int, default=None, help="intra_op threads for the profiled variants (default: all cores)")
+    ap.add_argument("--inter-threads", type=int, default=1)
+    ap.add_argument("--graph-optimization", default="all", choices=["disable", "basic", "extended", "all"])
+    ap.add_argument("--out", default=None, help="Also write the report as JSON")
+    args = ap.parse_args()
+
+    if args.models:
+        models = [(p, pathlib.Path(p).stem) for p in args.models]
+    else:
+        models = [(os.path.join(MODELS_DIR, f"{name}.onnx"), pool) for name, pool in DEFAULT_MODELS.items()
+                  if os.path.isfile(os.path.join(MODELS_DIR, f"{name}.onnx"))]
+    if not models:
+        sys.exit(f"No models found in {MODELS_DIR}; run facefusion once (or force-download) or pass --models")
+
+    report = {"onnxruntime": onnxruntime.__version__, "cpus": os.cpu_count(), "runs": args.runs, "models": []}
+    print(f"{'model':24} {'variant':20} {'load ms':>9} {'median ms':>10} {'speedup':>8} {'max abs':>9} {'cosine':>9} {'psnr dB':>8}")
+    for model_path, pool in models:
+        with tempfile.TemporaryDirectory(prefix="ort-cache-") as cache_dir:
+            entry = report_model(model_path, pool, args, cache_dir)
+        report["models"].append(entry)
+        for name, row in entry["variants"].items():
+            if "error" in row:
+                print(f"{entry['model']:24} {name:20} {row['error']}")
+                continue
+            print(f"{entry['model']:24} {name:20} {row['load_ms']:9.1f} {row['median_ms']:10.2f} {row.get('speedup', 1.0):8.2f} "
+                  f"{row['max_abs']:9.4f} {row['cosine']:9.5f} {row['psnr_db'] if row['psnr_db'] is not None else 'inf':>8}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[REPORT] {args.out}")
+
+if __name__ == "__main__":
+    main()
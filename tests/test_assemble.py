@@ -0,0 +1,12 @@
+"""Subtitle merging for the single final encode (app/video/assemble.py)."""
+from app.video.assemble import merge_srts
+
+def test_merge_srts_offsets(tmp_path):
+    a, b = tmp_path / "a.srt", tmp_path / "b.srt"
+    a.write_text("1\n00:00:00,000 --> 00:00:01,500\nfirst\n\n2\n00:00:01,500 --> 00:00:02,000\nsecond\n\n", encoding="utf-8")
+    b.write_text("1\n00:00:00,250 --> 00:00:01,000\nthird\nline two\n\n", encoding="utf-8")
+    out = merge_srts([(str(a), 0.0), (None, 2.0), (str(b), 62.5)], str(tmp_path / "merged.srt"))
+    assert open(out, encoding="utf-8").read() == (
+        "1\n00:00:00,000 --> 00:00:01,500\nfirst\n\n"
+        "2\n00:00:01,500 --> 00:00:02,000\nsecond\n\n"
+        "3\n00:01:02,750 --> 00:01:03,500\nthird\nline two\n\n")
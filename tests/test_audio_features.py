@@ -0,0 +1,44 @@
+"""Zero-copy Wav2Lip mel windows (third_party/Wav2Lip/wav2lip_engine.py)."""
+import os, sys
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _old_mel_chunks(mel, fps, mel_step_size=16):
+    # the loop wav2lip_engine.mel_chunks_for replaced
+    mel_chunks, mel_idx_multiplier, i = [], 80. / fps, 0
+    while 1:
+        start_idx = int(i * mel_idx_multiplier)
+        if start_idx + mel_step_size > len(mel[0]):
+            mel_chunks.append(mel[:, len(mel[0]) - mel_step_size:])
+            break
+        mel_chunks.append(mel[:, start_idx: start_idx + mel_step_size])
+        i += 1
+    return mel_chunks
+
+def test_mel_chunks_match_old_loop():
+    pytest.importorskip("torch")
+    pytest.importorskip("librosa")
+    sys.path.insert(0, os.path.join(ROOT, "third_party", "Wav2Lip"))
+    from wav2lip_engine import mel_chunks_for
+    rng = np.random.default_rng(0)
+    for fps in (24, 25, 29.97, 30, 60):
+        for frames in (16, 17, 80, 81, 333, 1000):
+            mel = rng.standard_normal((80, frames)).astype(np.float32)
+            old, new = _old_mel_chunks(mel, fps), mel_chunks_for(mel, fps)
+            assert len(new) == len(old), (fps, frames)
+            for i, chunk in enumerate(old):
+                np.testing.assert_array_equal(new[i], chunk)
+
+def test_num_samples_from_header(tmp_path):
+    import importlib.util
+    import soundfile as sf
+    from app.audio.features import AudioFeatures
+    features = AudioFeatures()
+    for sr, n in ((16000, 16000), (16000, 12345), (22050, 22050), (22050, 30001), (44100, 7)):
+        path = str(tmp_path / f"{sr}_{n}.wav")
+        sf.write(path, np.zeros(n, dtype=np.float32), sr)
+        assert features.num_samples(path) == int(np.ceil(n * 16000 / sr)), (sr, n)
+        if importlib.util.find_spec("librosa"):
+            assert features.num_samples(path) == len(features.wav(path)), (sr, n)
@@ -0,0 +1,57 @@
+"""Multi-spec batch mode (app/batch.py)."""
+import json, os
+
+import app.batch as batch
+
+def _spec(line):
+    return {"scenes": [{"id": "s1", "mode": "narration", "script_text": line, "voice": {"engine": "piper"}},
+                       {"id": "s2", "mode": "narration", "script_text": "outro", "voice": {"engine": "piper"}}]}
+
+def test_load_specs_jsonl(tmp_path):
+    spec_file = tmp_path / "intro.json"
+    spec_file.write_text(json.dumps(_spec("hi")), encoding="utf-8")
+    lines = [_spec("a"), {"spec": str(spec_file), "out": "x.mp4"}, {"spec": str(spec_file)}]
+    source = tmp_path / "night.jsonl"
+    source.write_text("\n".join(json.dumps(l) for l in lines) + "\n\n", encoding="utf-8")
+    entries = batch.load_specs(source)
+    assert [e["name"] for e in entries] == ["night_0001", "intro", "intro_2"]
+    assert entries[0]["path"] is None and entries[1]["out"] == "x.mp4" and entries[1]["spec"] == _spec("hi")
+
+def test_run_batch_dedups_specs_and_lines(tmp_path, monkeypatch):
+    specs = tmp_path / "specs"
+    specs.mkdir()
+    for name, line in [("a", "hello"), ("b", "hello"), ("c", "world"), ("d", "boom")]:
+        (specs / f"{name}.json").write_text(json.dumps(_spec(line)), encoding="utf-8")
+    synthesized, rendered = [], []
+
+    def fake_synthesize_batch(jobs, engine="piper", cache=None):
+        for text, _voice, out_wav in jobs:
+            synthesized.append(text)
+            open(out_wav, "wb").write(text.encode())
+
+    def fake_run_project(spec_path, out_path, workdir, **kwargs):
+        rendered.append(os.path.basename(spec_path))
+        if "boom" in open(spec_path, encoding="utf-8").read():
+            raise RuntimeError("boom")
+        open(out_path, "w").write("mp4")
+
+    monkeypatch.setattr(batch, "synthesize_batch", fake_synthesize_batch)
+    monkeypatch.setattr(batch, "run_project", fake_run_project)
+    monkeypatch.delenv("AI_SHORTS_CACHE", raising=False)
+    monkeypatch.delenv("AI_SHORTS_TTS_CACHE", raising=False)
+    out, work = tmp_path / "out", tmp_path / "work"
+
+    report = batch.run_batch(specs, out, work, workers=2)
+    assert sorted(rendered) == ["a.json", "c.json", "d.json"]
+    assert sorted(synthesized) == ["boom", "hello", "outro", "world"]
+    assert report["plan"]["tts_lines"] == 6 and report["plan"]["tts_unique"] == 4
+    assert report["counts"] == {"done": 3, "failed": 1}
+    status = {s["name"]: s for s in report["specs"]}
+    assert status["b"]["duplicate_of"] == "a" and (out / "b.mp4").read_text() == "mp4"
+    assert status["d"]["status"] == "failed" and "boom" in status["d"]["error"]
+    assert json.loads((work / "batch_report.json").read_text())["counts"] == report["counts"]
+
+    # a second batch finds every line in the shared stage cache
+    synthesized.clear()
+    report = batch.run_batch(specs, out, work, workers=2)
+    assert synthesized == [] and report["plan"]["tts_synthesized"] == 0
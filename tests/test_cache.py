@@ -0,0 +1,41 @@
+"""StageCache keys and artifact store (app/utils/cache.py)."""
+from app.pipeline import tts_key
+from app.utils.cache import StageCache
+
+def test_stage_cache_key_is_stable(tmp_path):
+    cache = StageCache(tmp_path)
+    key = cache.key("tts", text="hi", engine="piper", voice=None)
+    # keys name artifacts persisted across runs and releases: changing the scheme invalidates every cache
+    assert key == "tts-e7b98847d0f01f386ba825decc115eeb0960f0ac80ebc5fb0ec699f69c453066"
+    assert cache.key("tts", voice=None, engine="piper", text="hi") == key
+    assert StageCache(tmp_path / "other").key("tts", text="hi", engine="piper", voice=None) == key
+    assert cache.key("tts", text="hi!", engine="piper", voice=None) != key
+    assert cache.key("raw", text="hi", engine="piper", voice=None) != key
+
+def test_stage_cache_store_fetch(tmp_path):
+    cache = StageCache(tmp_path / "cache")
+    src, dst = tmp_path / "a.wav", tmp_path / "out" / "b.wav"
+    src.write_bytes(b"RIFF")
+    key = cache.key("tts", text="x")
+    assert not cache.has(key, ".wav") and not cache.fetch(key, dst)
+    cache.store(key, src)
+    assert cache.has(key, ".wav") and cache.fetch(key, dst)
+    assert dst.read_bytes() == b"RIFF"
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not StageCache(tmp_path / "cache", enabled=False).fetch(key, dst)
+
+def test_tts_key_follows_piper_voice_env(tmp_path, monkeypatch):
+    cache = StageCache(tmp_path)
+    scene = {"script_text": "hello", "voice": {"engine": "piper"}}
+    a, b = tmp_path / "a.onnx", tmp_path / "b.onnx"
+    a.write_bytes(b"voice a")
+    b.write_bytes(b"voice b")
+    monkeypatch.setenv("PIPER_VOICE", str(a))
+    key_a = tts_key(cache, scene)
+    assert tts_key(cache, {**scene, "voice": {"engine": "piper", "voice": str(a)}}) == key_a
+    monkeypatch.setenv("PIPER_VOICE", str(b))
+    key_b = tts_key(cache, scene)
+    assert key_b != key_a
+    # same path, new model file
+    b.write_bytes(b"voice b, retrained")
+    assert tts_key(cache, scene) != key_b
@@ -0,0 +1,12 @@
+"""Size-targeted bitrate (app/video/compress.py)."""
+import pytest
+
+from app.video.compress import size_target_bitrate
+
+def test_size_target_bitrate():
+    assert size_target_bitrate(60, 3) == int((3 * 8 * 1024 * 1024 - 64000 * 60) / 60 / 1000)
+
+@pytest.mark.parametrize("duration", [0, 0.0, -1.0, None, float("nan")])
+def test_size_target_bitrate_rejects_empty_duration(duration):
+    with pytest.raises(ValueError):
+        size_target_bitrate(duration, 3)
@@ -0,0 +1,36 @@
+"""Persisted static-face store (third_party/facefusion/facefusion/face_store.py)."""
+import os, sys, time
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def face_store(tmp_path, monkeypatch):
+    pytest.importorskip("onnxruntime")
+    sys.path.insert(0, os.path.join(ROOT, "third_party", "facefusion"))
+    from facefusion import face_store
+    face_store.set_face_store_path(str(tmp_path / "faces"))
+    yield face_store
+    face_store.set_face_store_path(None)
+
+def test_static_image_key_follows_content_not_mtime(face_store, tmp_path):
+    image = tmp_path / "target.jpg"
+    image.write_bytes(b"jpeg bytes")
+    frame = np.zeros((4, 4, 3), np.uint8)
+    face_store.register_static_image(str(image), frame)
+    first = face_store.create_vision_hash(frame)
+    # facefusion reads targets from a fresh temp copy each run: same bytes, new mtime
+    os.utime(image, (1, 1))
+    face_store.register_static_image(str(image), frame)
+    assert face_store.create_vision_hash(frame) == first
+
+def test_disk_store_is_bounded_and_cleared(face_store, monkeypatch):
+    monkeypatch.setattr(face_store, "FACE_STORE_DISK_SIZE", 3000)
+    for i in range(6):
+        face_store.write_static_faces(f"{i:02d}" + "a" * 38, ["x" * 500])
+        time.sleep(0.01)
+    kept = sorted(os.path.basename(path)[:2] for _, _, path in face_store.scan_static_faces())
+    assert kept[0] != "00" and sum(size for _, size, _ in face_store.scan_static_faces()) <= 3000
+    face_store.clear_static_faces()
+    assert face_store.scan_static_faces() == []
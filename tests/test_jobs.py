@@ -0,0 +1,75 @@
+"""Web job queue (app/jobs.py)."""
+import json, os, threading, time
+import pytest
+
+import app.jobs as jobs
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.time() + timeout
+    while not cond():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+@pytest.fixture
+def job_queue(tmp_path, monkeypatch):
+    gate = threading.Event()
+
+    def fake_run_project(spec_path, out_path, workdir, progress=None, tracer=None, **kwargs):
+        spec = json.load(open(spec_path, encoding="utf-8"))
+        progress("tts")
+        gate.wait(5)
+        progress("concat")
+        if spec.get("fail"):
+            raise RuntimeError("render failed")
+        open(out_path, "w").write("mp4")
+
+    monkeypatch.setattr(jobs, "run_project", fake_run_project)
+    q = jobs.JobQueue(root=tmp_path, workers=1, max_queued=2, keep_finished=2)
+    return q, gate
+
+def _save(spec):
+    return lambda path: open(path, "w", encoding="utf-8").write(json.dumps(spec))
+
+def test_job_queue_states(job_queue):
+    q, gate = job_queue
+    first = q.submit(_save({}))
+    wait_for(lambda: first.state == "running" and first.stage == "tts")
+    failing, cancelled = q.submit(_save({"fail": True})), q.submit(_save({}))
+    assert (failing.state, cancelled.state) == ("queued", "queued")
+    with pytest.raises(jobs.QueueFull):
+        q.submit(_save({}))
+    # cancelling a queued job frees its place straight away
+    assert q.cancel(cancelled.id).state == "cancelled"
+    late = q.submit(_save({}))
+    gate.set()
+    wait_for(lambda: late.state == "done")
+    assert first.state == "done" and os.path.exists(first.out_path)
+    assert failing.state == "failed" and "render failed" in failing.error
+    assert cancelled.state == "cancelled" and cancelled.started is None
+    # only the newest keep_finished finished jobs are remembered
+    wait_for(lambda: len(q.list()) == 2)
+    assert q.get(first.id) is None
+
+def test_job_queue_cancel_running_stops_at_next_stage(job_queue):
+    q, gate = job_queue
+    job = q.submit(_save({}))
+    wait_for(lambda: job.stage == "tts")
+    q.cancel(job.id)
+    assert job.state == "running"
+    gate.set()
+    wait_for(lambda: job.state == "cancelled")
+    assert job.stage == "tts" and not os.path.exists(job.out_path)
+
+def test_cancelled_run_reports_cancelled(tmp_path):
+    from app.pipeline import run_project
+    spec = tmp_path / "spec.json"
+    spec.write_text(json.dumps({"scenes": [{"id": "s1", "script_text": "hello"}]}), encoding="utf-8")
+
+    def progress(stage):
+        raise jobs.JobCancelled("job")
+
+    with pytest.raises(jobs.JobCancelled):
+        run_project(str(spec), str(tmp_path / "out.mp4"), str(tmp_path / "work"), use_cache=False, progress=progress)
+    report = json.load(open(tmp_path / "work" / "run_report.json", encoding="utf-8"))
+    assert report["status"] == "cancelled"
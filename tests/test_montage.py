@@ -0,0 +1,36 @@
+"""Segment-parallel Ken Burns rendering (app/video/montage.py)."""
+import shutil, threading
+import cv2, numpy as np
+import pytest
+import soundfile as sf
+
+from app.video.montage import ken_burns_clip
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+def _frame_count(path):
+    cap = cv2.VideoCapture(str(path))
+    n = 0
+    while cap.read()[0]:
+        n += 1
+    cap.release()
+    return n
+
+def test_parallel_chunks_from_a_thread_match_serial(tmp_path):
+    images = []
+    for i in range(2):
+        path = tmp_path / f"img{i}.png"
+        cv2.imwrite(str(path), np.full((180, 320, 3), 60 * (i + 1), np.uint8))
+        images.append(str(path))
+    wav = tmp_path / "line.wav"
+    sf.write(str(wav), np.zeros(16000 * 2, np.float32), 16000)
+
+    serial = ken_burns_clip(images, str(tmp_path / "serial.mp4"), str(wav), fps=10, size=(160, 90), workers=1)
+    # the pipeline starts the pool from a scheduler thread; it must not fork that process
+    out = {}
+    worker = threading.Thread(target=lambda: out.update(path=ken_burns_clip(
+        images, str(tmp_path / "parallel.mp4"), str(wav), fps=10, size=(160, 90), workers=2, chunk_frames=5)))
+    worker.start()
+    worker.join(120)
+    assert not worker.is_alive()
+    assert _frame_count(out["path"]) == _frame_count(serial) == 20
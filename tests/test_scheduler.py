@@ -0,0 +1,15 @@
+"""Worker limits (app/utils/scheduler.py)."""
+import pytest
+
+from app.utils.scheduler import StageScheduler, parse_limits
+
+def test_parse_limits():
+    assert parse_limits("model=2, ffmpeg=4") == {"model": 2, "ffmpeg": 4}
+    assert parse_limits("io=0") == {"io": 1}
+    assert parse_limits("") == {} and parse_limits(None) == {}
+
+def test_parse_limits_rejects_unknown_resources():
+    with pytest.raises(ValueError, match="modle"):
+        parse_limits("modle=2")
+    with pytest.raises(ValueError):
+        StageScheduler({"fmpeg": 1})
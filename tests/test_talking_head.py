@@ -0,0 +1,37 @@
+"""Lossless talking-head intermediates for single-encode mode (app/video/talking_head.py)."""
+import os, shutil, subprocess, sys
+import numpy as np
+import pytest
+
+import app.video.talking_head as talking_head
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_passthrough_asks_the_engine_for_a_lossless_file(tmp_path, monkeypatch):
+    calls = []
+
+    class FakeEngine:
+        def generate(self, face, audio, outfile, analysis_cache=None, audio_features=None, lossless=False):
+            calls.append((outfile, lossless))
+            open(outfile, "wb").write(b"ffv1")
+
+    monkeypatch.setenv("WAV2LIP_PATH", str(tmp_path))
+    monkeypatch.delenv("WAV2LIP_SUBPROCESS", raising=False)
+    monkeypatch.setattr(talking_head, "_wav2lip_engine", lambda repo: FakeEngine())
+    out = str(tmp_path / "scene" / "s1_raw.mkv")
+    assert talking_head.generate_talking_head("face.png", "line.wav", out, passthrough=True) == out
+    assert calls == [(str(tmp_path / "scene" / "s1_raw_raw.mkv"), True)]
+    assert open(out, "rb").read() == b"ffv1"
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_sadtalker_lossless_writer_keeps_frames_exact(tmp_path):
+    sys.path.insert(0, os.path.join(ROOT, "third_party", "SadTalker"))
+    from src.utils.videoio import write_video_with_audio, iter_video_frames
+    wav = str(tmp_path / "line.wav")
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "sine=d=1", wav], check=True)
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (64, 96, 3), dtype=np.uint8) for _ in range(10)]
+    out = write_video_with_audio(iter(frames), wav, str(tmp_path / "head.mkv"), audio_seconds=0.4, lossless=True)
+    decoded = list(iter_video_frames(out))
+    assert len(decoded) == len(frames)
+    assert all(np.array_equal(a, b) for a, b in zip(frames, decoded))
@@ -0,0 +1,81 @@
+"""Shared TTS WAV cache (app/audio/cache.py)."""
+import os
+
+from app.audio.cache import TTSCache
+
+def test_tts_cache_evicts_least_recently_used(tmp_path):
+    cache = TTSCache(tmp_path / "tts", max_bytes=2500)
+    src = tmp_path / "line.wav"
+    src.write_bytes(b"0" * 1000)
+    keys = [cache.key(f"line {i}", "piper") for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.store(key, src)
+        os.utime(cache._entry(key), (1000 + i, 1000 + i))
+    assert cache.stats["evictions"] == 2
+    assert not cache.fetch(keys[0], tmp_path / "a.wav") and not cache.fetch(keys[1], tmp_path / "a.wav")
+    assert cache.fetch(keys[3], tmp_path / "b.wav")
+    assert sum(p.stat().st_size for p in cache.root.glob("*/*.wav")) <= 2500
+
+def test_tts_cache_key(tmp_path):
+    cache = TTSCache(tmp_path / "tts")
+    assert cache.key("Hello   world", "Piper") == cache.key("Hello world", "piper")
+    assert cache.key("Hello", "piper", sample_rate=22050) != cache.key("Hello", "piper", sample_rate=16000)
+
+def test_synthesize_keys_on_resolved_piper_voice(tmp_path, monkeypatch):
+    import app.audio.tts as tts
+    calls = []
+
+    def fake_synthesize(text, out_wav, engine, voice, resident):
+        calls.append(voice)
+        open(out_wav, "wb").write(b"RIFF")
+        return out_wav, engine.lower()
+
+    monkeypatch.setattr(tts, "_synthesize", fake_synthesize)
+    cache = TTSCache(tmp_path / "tts")
+    a, b = tmp_path / "a.onnx", tmp_path / "b.onnx"
+    a.write_bytes(b"voice a")
+    b.write_bytes(b"voice b")
+    monkeypatch.setenv("PIPER_VOICE", str(a))
+    tts.synthesize("hello", str(tmp_path / "1.wav"), engine="piper", cache=cache)
+    tts.synthesize("hello", str(tmp_path / "2.wav"), engine="piper", cache=cache)
+    monkeypatch.setenv("PIPER_VOICE", str(b))
+    tts.synthesize("hello", str(tmp_path / "3.wav"), engine="piper", cache=cache)
+    assert len(calls) == 2 and cache.stats["hits"] == 1
+
+def _fake_piper(tmp_path, body):
+    piper = tmp_path / "piper"
+    piper.write_text("#!/bin/sh\n" + body)
+    piper.chmod(0o755)
+    model = tmp_path / "voice.onnx"
+    model.write_bytes(b"voice")
+    return str(piper), str(model)
+
+def test_piper_worker_needs_json_input(tmp_path, monkeypatch):
+    import sys, pytest
+    import app.audio.workers as workers
+    monkeypatch.setitem(sys.modules, "piper", None)
+    piper, model = _fake_piper(tmp_path, 'echo "usage: piper -m MODEL [--output_dir DIR]"\n')
+    with pytest.raises(RuntimeError, match="json-input"):
+        workers.PiperWorker(model, piper_bin=piper)
+
+def test_piper_worker_respawns_after_dying(tmp_path, monkeypatch):
+    import sys, pytest
+    import app.audio.workers as workers
+    monkeypatch.setitem(sys.modules, "piper", None)
+    # first process exits without answering; later ones write the requested file
+    piper, model = _fake_piper(tmp_path, f"""case "$1" in --help) echo "--json-input"; exit 0;; esac
+if [ ! -e {tmp_path}/started ]; then touch {tmp_path}/started; exit 1; fi
+while read -r line; do
+  out=$(echo "$line" | sed 's/.*"output_file": "\\([^"]*\\)".*/\\1/')
+  : > "$out"; echo "$out"
+done
+""")
+    worker = workers.PiperWorker(model, piper_bin=piper)
+    try:
+        with pytest.raises(RuntimeError):
+            worker.synthesize("one", str(tmp_path / "1.wav"))
+        assert worker._proc is None
+        assert worker.synthesize("two", str(tmp_path / "2.wav")) == str(tmp_path / "2.wav")
+        assert os.path.exists(tmp_path / "2.wav")
+    finally:
+        worker.close()
@@ -1,97 +1,45 @@
-from glob import glob
-import shutil
 import torch
 from time import  strftime
-import os, sys, time
+import os, sys
 from argparse import ArgumentParser
 
-from src.utils.preprocess import CropAndExtract
-from src.test_audio2coeff import Audio2Coeff  
-from src.facerender.animate import AnimateFromCoeff
-from src.generate_batch import get_data
-from src.generate_facerender_batch import get_facerender_data
-from src.utils.init_path import init_path
+from sadtalker_engine import SadTalkerEngine, NoFaceError
 
 def main(args):
     #torch.backends.cudnn.enabled = False
 
-    pic_path = args.source_image
-    audio_path = args.driven_audio
-    save_dir = os.path.join(args.result_dir, strftime("%Y_%m_%d_%H.%M.%S"))
-    os.makedirs(save_dir, exist_ok=True)
-    pose_style = args.pose_style
-    device = args.device
-    batch_size = args.batch_size
-    input_yaw_list = args.input_yaw
-    input_pitch_list = args.input_pitch
-    input_roll_list = args.input_roll
-    ref_eyeblink = args.ref_eyeblink
-    ref_pose = args.ref_pose
+    if args.outfile:
+        out_path = args.outfile
+        save_dir = os.path.splitext(out_path)[0] if args.verbose else None
+    else:
+        save_dir = os.path.join(args.result_dir, strftime("%Y_%m_%d_%H.%M.%S"))
+        out_path = save_dir+'.mp4'
+        if not args.verbose:
+            save_dir = None
 
     current_root_path = os.path.split(sys.argv[0])[0]
 
-    sadtalker_paths = init_path(args.checkpoint_dir, os.path.join(current_root_path, 'src/config'), args.size, args.old_version, args.preprocess)
-
     #init model
-    preprocess_model = CropAndExtract(sadtalker_paths, device)
-
-    audio_to_coeff = Audio2Coeff(sadtalker_paths,  device)
-    
-    animate_from_coeff = AnimateFromCoeff(sadtalker_paths, device)
-
-    #crop image and extract 3dmm from image
-    first_frame_dir = os.path.join(save_dir, 'first_frame_dir')
-    os.makedirs(first_frame_dir, exist_ok=True)
-    print('3DMM Extraction for source image')
-    first_coeff_path, crop_pic_path, crop_info =  preprocess_model.generate(pic_path, first_frame_dir, args.preprocess,\
-                                                                             source_image_flag=True, pic_size=args.size)
-    if first_coeff_path is None:
-        print("Can't get the coeffs of the input")
+    engine = SadTalkerEngine(args.checkpoint_dir, os.path.join(current_root_path, 'src/config'), args.size,
+                             args.preprocess, args.old_version, args.device)
+
+    analysis_cache = None
+    if args.analysis_cache_dir:
+        # provided by the host app (its root must be on PYTHONPATH)
+        from app.video.face_cache import FaceAnalysisCache
+        analysis_cache = FaceAnalysisCache(args.analysis_cache_dir)
+
+    try:
+        engine.generate(args.source_image, args.driven_audio, out_path, still=args.still, enhancer=args.enhancer,
+                        background_enhancer=args.background_enhancer, enhancer_mode=args.enhancer_mode, pose_style=args.pose_style,
+                        batch_size=args.batch_size, expression_scale=args.expression_scale, fps=args.fps,
+                        input_yaw=args.input_yaw, input_pitch=args.input_pitch, input_roll=args.input_roll,
+                        ref_eyeblink=args.ref_eyeblink, ref_pose=args.ref_pose, analysis_cache=analysis_cache,
+                        work_dir=save_dir, face3d_args=args if args.face3dvis else None, lossless=args.lossless)
+    except NoFaceError as e:
+        print(e)
         return
-
-    if ref_eyeblink is not None:
-        ref_eyeblink_videoname = os.path.splitext(os.path.split(ref_eyeblink)[-1])[0]
-        ref_eyeblink_frame_dir = os.path.join(save_dir, ref_eyeblink_videoname)
-        os.makedirs(ref_eyeblink_frame_dir, exist_ok=True)
-        print('3DMM Extraction for the reference video providing eye blinking')
-        ref_eyeblink_coeff_path, _, _ =  preprocess_model.generate(ref_eyeblink, ref_eyeblink_frame_dir, args.preprocess, source_image_flag=False)
-    else:
-        ref_eyeblink_coeff_path=None
-
-    if ref_pose is not None:
-        if ref_pose == ref_eyeblink: 
-            ref_pose_coeff_path = ref_eyeblink_coeff_path
-        else:
-            ref_pose_videoname = os.path.splitext(os.path.split(ref_pose)[-1])[0]
-            ref_pose_frame_dir = os.path.join(save_dir, ref_pose_videoname)
-            os.makedirs(ref_pose_frame_dir, exist_ok=True)
-            print('3DMM Extraction for the reference video providing pose')
-            ref_pose_coeff_path, _, _ =  preprocess_model.generate(ref_pose, ref_pose_frame_dir, args.preprocess, source_image_flag=False)
-    else:
-        ref_pose_coeff_path=None
-
-    #audio2ceoff
-    batch = get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, still=args.still)
-    coeff_path = audio_to_coeff.generate(batch, save_dir, pose_style, ref_pose_coeff_path)
-
-    # 3dface render
-    if args.face3dvis:
-        from src.face3d.visualize import gen_composed_video
-        gen_composed_video(args, device, first_coeff_path, coeff_path, audio_path, os.path.join(save_dir, '3dface.mp4'))
-    
-    #coeff2video
-    data = get_facerender_data(coeff_path, crop_pic_path, first_coeff_path, audio_path, 
-                                batch_size, input_yaw_list, input_pitch_list, input_roll_list,
-                                expression_scale=args.expression_scale, still_mode=args.still, preprocess=args.preprocess, size=args.size)
-    
-    result = animate_from_coeff.generate(data, save_dir, pic_path, crop_info, \
-                                enhancer=args.enhancer, background_enhancer=args.background_enhancer, preprocess=args.preprocess, img_size=args.size, fps=args.fps)
-    
-    shutil.move(result, save_dir+'.mp4')
-    print('The generated video is named:', save_dir+'.mp4')
-
-    if not args.verbose:
-        shutil.rmtree(save_dir)
+    print('The generated video is named:', out_path)
 
     
 if __name__ == '__main__':
@@ -103,6 +51,7 @@ if __name__ == '__main__':
     parser.add_argument("--ref_pose", default=None, help="path to reference video providing pose")
     parser.add_argument("--checkpoint_dir", default='./checkpoints', help="path to output")
     parser.add_argument("--result_dir", default='./results', help="path to output")
+    parser.add_argument("--outfile", default=None, help="exact output video path (default: a timestamped mp4 under --result_dir)")
     parser.add_argument("--pose_style", type=int, default=0,  help="input pose style from [0, 46)")
     parser.add_argument("--batch_size", type=int, default=2,  help="the batch size of facerender")
     parser.add_argument("--size", type=int, default=256,  help="the image size of the facerender")
@@ -111,6 +60,7 @@ if __name__ == '__main__':
     parser.add_argument('--input_pitch', nargs='+', type=int, default=None, help="the input pitch degree of the user")
     parser.add_argument('--input_roll', nargs='+', type=int, default=None, help="the input roll degree of the user")
     parser.add_argument('--enhancer',  type=str, default=None, help="Face enhancer, [gfpgan, RestoreFormer]")
+    parser.add_argument('--enhancer_mode', default='crop', choices=['crop', 'frame'], help="crop: batched GFPGAN on face crops + static background once; frame: every full frame")
     parser.add_argument('--background_enhancer',  type=str, default=None, help="background enhancer, [realesrgan]")
     parser.add_argument("--cpu", dest="cpu", action="store_true") 
     parser.add_argument("--face3dvis", action="store_true", help="generate 3d face and 3d landmarks") 
@@ -119,6 +69,8 @@ if __name__ == '__main__':
     parser.add_argument("--verbose",action="store_true", help="saving the intermedia output or not" ) 
     parser.add_argument("--old_version",action="store_true", help="use the pth other than safetensor version" ) 
     parser.add_argument("--fps", type=int, default=25, help="frames per second of the output video")
+    parser.add_argument("--lossless", action="store_true", help="write FFV1 video + PCM audio (use a .mkv --outfile) instead of H.264/AAC")
+    parser.add_argument("--analysis_cache_dir", default=None, help="reuse face crop/landmarks/3DMM coeffs across runs (keyed by image hash + preprocess settings)")
 
 
     # net structure and parameters
@@ -0,0 +1,139 @@
+"""
+Library-mode SadTalker: keeps CropAndExtract, Audio2Coeff and AnimateFromCoeff (3DMM recon net,
+audio2pose/exp, facevid2vid + mapping net) resident across calls and writes each result to the
+caller's output path, so a project with many talking-head scenes loads the checkpoints once.
+inference.py is a thin CLI over this module.
+"""
+import os, sys, shutil, tempfile, threading
+import torch
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from src.utils.preprocess import CropAndExtract
+from src.test_audio2coeff import Audio2Coeff
+from src.facerender.animate import AnimateFromCoeff
+from src.generate_batch import get_data
+from src.generate_facerender_batch import get_facerender_data
+from src.utils.init_path import init_path
+
+
+class NoFaceError(RuntimeError):
+    pass
+
+
+def default_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class SadTalkerEngine:
+    """
+    Resident SadTalker models for one (checkpoints, size, preprocess family).
+
+    engine = SadTalkerEngine("checkpoints", preprocess="full")
+    engine.generate("portrait.png", "line.wav", "out.mp4", still=True, enhancer="gfpgan")
+
+    The face renderer config depends on whether preprocess is a 'full' mode, so an engine only
+    serves requests of its own family; use get_engine() to get one per family. Calls are
+    serialized and keep their intermediates in a private directory next to out_path.
+    """
+
+    def __init__(self, checkpoint_dir, config_dir=None, size=256, preprocess="crop", old_version=False, device=None):
+        self.device = device or default_device()
+        self.size = size
+        self.preprocess = preprocess
+        self.paths = init_path(checkpoint_dir, config_dir or os.path.join(ROOT, "src", "config"), size, old_version, preprocess)
+        self.preprocess_model = CropAndExtract(self.paths, self.device)
+        self.audio_to_coeff = Audio2Coeff(self.paths, self.device)
+        self.animate_from_coeff = AnimateFromCoeff(self.paths, self.device)
+        self._lock = threading.Lock()
+
+    def _check_preprocess(self, preprocess):
+        if ("full" in preprocess) != ("full" in self.preprocess):
+            raise ValueError(f"Engine loaded for preprocess={self.preprocess!r} can't serve preprocess={preprocess!r}")
+
+    def generate(self, source_image, driven_audio, out_path, still=False, preprocess=None, enhancer=None,
+                 background_enhancer=None, enhancer_mode='crop', pose_style=0, batch_size=2, expression_scale=1.0, fps=25,
+                 input_yaw=None, input_pitch=None, input_roll=None, ref_eyeblink=None, ref_pose=None,
+                 analysis_cache=None, audio_features=None, work_dir=None, face3d_args=None, lossless=False):
+        """
+        Animate source_image with driven_audio and write the video to out_path, which is returned.
+        work_dir keeps the intermediates (crops, landmarks, coeffs) there instead of discarding them;
+        face3d_args (the CLI namespace) also renders the 3D face visualization. enhancer_mode='crop'
+        runs GFPGAN on batches of face crops and on the background once, 'frame' on every full frame.
+        audio_features (app.audio.features.AudioFeatures or alike) shares the decoded audio and mel.
+        lossless writes FFV1 video + PCM audio (give a .mkv out_path) for an intermediate encoded again later.
+        """
+        preprocess = preprocess or self.preprocess
+        self._check_preprocess(preprocess)
+        out_path = os.path.abspath(out_path)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        save_dir = work_dir or tempfile.mkdtemp(dir=os.path.dirname(out_path), prefix=".sadtalker-")
+        os.makedirs(save_dir, exist_ok=True)
+        try:
+            with self._lock:
+                #crop image and extract 3dmm from image
+                first_frame_dir = os.path.join(save_dir, 'first_frame_dir')
+                os.makedirs(first_frame_dir, exist_ok=True)
+                print('3DMM Extraction for source image')
+                first_coeff_path, crop_pic_path, crop_info = self.preprocess_model.generate(
+                    source_image, first_frame_dir, preprocess, source_image_flag=True, pic_size=self.size,
+                    analysis_cache=analysis_cache)
+                if first_coeff_path is None:
+                    raise NoFaceError(f"Can't get the coeffs of the input: {source_image}")
+
+                ref_eyeblink_coeff_path = self._ref_coeffs(ref_eyeblink, save_dir, preprocess, 'eye blinking')
+                if ref_pose is not None and ref_pose == ref_eyeblink:
+                    ref_pose_coeff_path = ref_eyeblink_coeff_path
+                else:
+                    ref_pose_coeff_path = self._ref_coeffs(ref_pose, save_dir, preprocess, 'pose')
+
+                #audio2ceoff
+                batch = get_data(first_coeff_path, driven_audio, self.device, ref_eyeblink_coeff_path, still=still,
+                                 audio_features=audio_features)
+                coeff_path = self.audio_to_coeff.generate(batch, save_dir, pose_style, ref_pose_coeff_path)
+
+                # 3dface render
+                if face3d_args is not None:
+                    from src.face3d.visualize import gen_composed_video
+                    gen_composed_video(face3d_args, self.device, first_coeff_path, coeff_path, driven_audio,
+                                       os.path.join(save_dir, '3dface.mp4'))
+
+                #coeff2video
+                data = get_facerender_data(coeff_path, crop_pic_path, first_coeff_path, driven_audio,
+                                           batch_size, input_yaw, input_pitch, input_roll,
+                                           expression_scale=expression_scale, still_mode=still, preprocess=preprocess, size=self.size)
+                result = self.animate_from_coeff.generate(data, save_dir, source_image, crop_info,
+                                                          enhancer=enhancer, background_enhancer=background_enhancer,
+                                                          preprocess=preprocess, img_size=self.size, fps=fps,
+                                                          still_mode=still, enhancer_mode=enhancer_mode, lossless=lossless)
+            if work_dir:
+                shutil.copyfile(result, out_path)
+            else:
+                os.replace(result, out_path)
+        finally:
+            if not work_dir:
+                shutil.rmtree(save_dir, ignore_errors=True)
+        return out_path
+
+    def _ref_coeffs(self, ref_video, save_dir, preprocess, what):
+        if ref_video is None:
+            return None
+        frame_dir = os.path.join(save_dir, os.path.splitext(os.path.split(ref_video)[-1])[0])
+        os.makedirs(frame_dir, exist_ok=True)
+        print(f'3DMM Extraction for the reference video providing {what}')
+        coeff_path, _, _ = self.preprocess_model.generate(ref_video, frame_dir, preprocess, source_image_flag=False)
+        return coeff_path
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(checkpoint_dir, size=256, preprocess="crop", old_version=False, **kwargs):
+    """Process-wide engine per (checkpoints, size, preprocess family, options); models load on first use only."""
+    key = (os.path.abspath(checkpoint_dir), size, "full" in preprocess, old_version, repr(sorted(kwargs.items())))
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = SadTalkerEngine(checkpoint_dir, size=size, preprocess=preprocess, old_version=old_version, **kwargs)
+        return _engines[key]
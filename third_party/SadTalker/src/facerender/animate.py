@@ -9,7 +9,6 @@ import safetensors.torch
 warnings.filterwarnings('ignore')
 
 
-import imageio
 import torch
 import torchvision
 
@@ -17,12 +16,11 @@ import torchvision
 from src.facerender.modules.keypoint_detector import HEEstimator, KPDetector
 from src.facerender.modules.mapping import MappingNet
 from src.facerender.modules.generator import OcclusionAwareGenerator, OcclusionAwareSPADEGenerator
-from src.facerender.modules.make_animation import make_animation 
+from src.facerender.modules.make_animation import make_animation_stream
 
-from pydub import AudioSegment 
-from src.utils.face_enhancer import enhancer_generator_with_len, enhancer_list
-from src.utils.paste_pic import paste_pic
-from src.utils.videoio import save_video_with_watermark
+from src.utils.face_enhancer import enhance_frames, enhance_frame, enhance_crop_frames, load_restorer
+from src.utils.paste_pic import load_full_img, paste_box, paste_frames, scale_crop_info, PasteBack
+from src.utils.videoio import write_video_with_audio
 
 try:
     import webui  # in webui
@@ -154,7 +152,8 @@ class AnimateFromCoeff():
 
         return checkpoint['epoch']
 
-    def generate(self, x, video_save_dir, pic_path, crop_info, enhancer=None, background_enhancer=None, preprocess='crop', img_size=256, fps=25):
+    def generate(self, x, video_save_dir, pic_path, crop_info, enhancer=None, background_enhancer=None, preprocess='crop', img_size=256, fps=25, still_mode=False,
+                 enhancer_mode='crop', enhance_batch_size=8, lossless=False):
 
         source_image=x['source_image'].type(torch.FloatTensor)
         source_semantics=x['source_semantics'].type(torch.FloatTensor)
@@ -180,92 +179,66 @@ class AnimateFromCoeff():
 
         frame_num = x['frame_num']
 
-        predictions_video = make_animation(source_image, source_semantics, target_semantics,
-                                        self.generator, self.kp_extractor, self.he_estimator, self.mapping, 
-                                        yaw_c_seq, pitch_c_seq, roll_c_seq, use_exp = True)
-
-        predictions_video = predictions_video.reshape((-1,)+predictions_video.shape[2:])
-        predictions_video = predictions_video[:frame_num]
-
-        video = []
-        for idx in range(predictions_video.shape[0]):
-            image = predictions_video[idx]
-            image = np.transpose(image.data.cpu().numpy(), [1, 2, 0]).astype(np.float32)
-            video.append(image)
-        result = img_as_ubyte(video)
+        predictions = make_animation_stream(source_image, source_semantics, target_semantics,
+                                        self.generator, self.kp_extractor, self.mapping,
+                                        yaw_c_seq, pitch_c_seq, roll_c_seq)
 
         ### the generated video is 256x256, so we keep the aspect ratio, 
         original_size = crop_info[0]
-        if original_size:
-            result = [ cv2.resize(result_i,(img_size, int(img_size * original_size[1]/original_size[0]) )) for result_i in result ]
-        
-        video_name = x['video_name']  + '.mp4'
-        path = os.path.join(video_save_dir, 'temp_'+video_name)
-        
-        writer = imageio.get_writer(path, fps=float(fps), codec='libx264', macro_block_size=1, format='FFMPEG')
-        for frame in result:
-            h, w, _ = frame.shape
-            new_w = w if w % 2 == 0 else w - 1
-            new_h = h if h % 2 == 0 else h - 1
-            if (new_w, new_h) != (w, h):
-                frame = frame[:new_h, :new_w]  # crop to even size
-            writer.append_data(frame)
-        writer.close()
-
-        av_path = os.path.join(video_save_dir, video_name)
-        return_path = av_path 
-        
-        audio_path =  x['audio_path'] 
-        audio_name = os.path.splitext(os.path.split(audio_path)[-1])[0]
-        new_audio_path = os.path.join(video_save_dir, audio_name+'.wav')
-        start_time = 0
-        # cog will not keep the .mp3 filename
-        sound = AudioSegment.from_file(audio_path)
-        frames = frame_num 
-        end_time = start_time + frames*1/25*1000
-        word1=sound.set_frame_rate(16000)
-        word = word1[start_time:end_time]
-        word.export(new_audio_path, format="wav")
-
-        save_video_with_watermark(path, new_audio_path, av_path, watermark= False)
-        print(f'The generated video is named {video_save_dir}/{video_name}') 
-
+        out_size = (img_size, int(img_size * original_size[1]/original_size[0])) if original_size else None
+
+        def crop_frames():
+            # chunk -> uint8 -> resize, one facerender batch at a time; the padding frames past frame_num are dropped
+            remaining = frame_num
+            for chunk in predictions:
+                chunk = img_as_ubyte(np.transpose(chunk[:remaining].data.cpu().numpy(), [0, 2, 3, 1]).astype(np.float32))
+                remaining -= len(chunk)
+                for image in chunk:
+                    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+                    if out_size:
+                        image = cv2.resize(image, out_size)
+                    h, w = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+                    yield image[:h, :w]  # crop to even size
+                if remaining <= 0:
+                    break
+
+        frames = crop_frames()
+        ext = '.mkv' if lossless else '.mp4'
+        video_name = x['video_name']  + ext
+        # 'crop' mode enhances the face crops in GFPGAN batches before paste-back and the static
+        # background once; 'frame' enhances every pasted full frame (face detection + bg upsampler each time)
+        crop_enhance = enhancer and enhancer_mode == 'crop'
+        if crop_enhance:
+            frames = enhance_crop_frames(frames, method=enhancer, batch_size=enhance_batch_size, reuse_landmarks=still_mode)
         if 'full' in preprocess.lower():
-            # only add watermark to the full image.
-            video_name_full = x['video_name']  + '_full.mp4'
-            full_video_path = os.path.join(video_save_dir, video_name_full)
-            return_path = full_video_path
-            paste_pic(path, pic_path, crop_info, new_audio_path, full_video_path, extended_crop= True if 'ext' in preprocess.lower() else False)
-            print(f'The generated video is named {video_save_dir}/{video_name_full}') 
-        else:
-            full_video_path = av_path 
+            if paste_box(crop_info) is None:
+                print("you didn't crop the image")
+            else:
+                video_name = x['video_name']  + '_full' + ext
+                full_img = load_full_img(pic_path)
+                extended_crop = True if 'ext' in preprocess.lower() else False
+                if crop_enhance:
+                    background = enhance_frame(load_restorer(enhancer, background_enhancer), full_img)
+                    crop_info = scale_crop_info(crop_info, background.shape[1] / full_img.shape[1])
+                    full_img = background
+                if still_mode:
+                    # static background: reuse the clone correction and blend only the face ROI
+                    frames = PasteBack(full_img, crop_info, extended_crop).paste_frames(frames)
+                else:
+                    frames = paste_frames(frames, full_img, crop_info, extended_crop=extended_crop)
 
         #### paste back then enhancers
         if enhancer:
-            video_name_enhancer = x['video_name']  + '_enhanced.mp4'
-            enhanced_path = os.path.join(video_save_dir, 'temp_'+video_name_enhancer)
-            av_path_enhancer = os.path.join(video_save_dir, video_name_enhancer) 
-            return_path = av_path_enhancer
-
-            try:
-                enhanced_images_gen_with_len = enhancer_generator_with_len(full_video_path, method=enhancer, bg_upsampler=background_enhancer)
-                writer = imageio.get_writer(enhanced_path, fps=float(fps), codec='libx264', macro_block_size=1, format='FFMPEG')
-                for frame in enhanced_images_gen_with_len:
-                    writer.append_data(frame)
-                writer.close()
-            except:
-                enhanced_images_gen_with_len = enhancer_list(full_video_path, method=enhancer, bg_upsampler=background_enhancer)
-                writer = imageio.get_writer(enhanced_path, fps=float(fps), codec='libx264', macro_block_size=1, format='FFMPEG')
-                for frame in enhanced_images_gen_with_len:
-                    writer.append_data(frame)
-                writer.close()
-            
-            save_video_with_watermark(enhanced_path, new_audio_path, av_path_enhancer, watermark= False)
-            print(f'The generated video is named {video_save_dir}/{video_name_enhancer}')
-            os.remove(enhanced_path)
-
-        os.remove(path)
-        os.remove(new_audio_path)
+            video_name = x['video_name']  + '_enhanced' + ext
+            if not crop_enhance:
+                frames = enhance_frames(frames, method=enhancer, bg_upsampler=background_enhancer)
+
+        # render -> resize -> paste -> enhance stream straight into one encoder; the audio is cut to the
+        # rendered length (frame_num at 25fps, as get_data counts frames) and resampled there as well
+        return_path = os.path.join(video_save_dir, video_name)
+        write_video_with_audio(frames, x['audio_path'], return_path, fps=fps, audio_seconds=frame_num / 25,
+                               lossless=lossless)
+        print(f'The generated video is named {return_path}')
 
         return return_path
 
@@ -138,6 +138,32 @@ def make_animation(source_image, source_semantics, target_semantics,
         predictions_ts = torch.stack(predictions, dim=1)
     return predictions_ts
 
+def make_animation_stream(source_image, source_semantics, target_semantics,
+                            generator, kp_detector, mapping,
+                            yaw_c_seq=None, pitch_c_seq=None, roll_c_seq=None):
+    """
+    Same renderer as make_animation, but yields (batch_size, C, H, W) predictions in output frame order
+    instead of stacking the whole clip. get_facerender_data lays frames out batch-major
+    (frame = b * T + t), so each step renders batch_size consecutive frames rather than one time
+    index across the batch; per-frame results are identical.
+    """
+    batch_size = target_semantics.shape[0]
+    target_flat = target_semantics.reshape((-1,) + target_semantics.shape[2:])
+    seqs = {name: seq.reshape(-1) for name, seq in
+            (('yaw_in', yaw_c_seq), ('pitch_in', pitch_c_seq), ('roll_in', roll_c_seq)) if seq is not None}
+    with torch.no_grad():
+        kp_canonical = kp_detector(source_image)
+        he_source = mapping(source_semantics)
+        kp_source = keypoint_transformation(kp_canonical, he_source)
+
+        for start in tqdm(range(0, target_flat.shape[0], batch_size), 'Face Renderer:'):
+            he_driving = mapping(target_flat[start:start+batch_size])
+            for name, seq in seqs.items():
+                he_driving[name] = seq[start:start+batch_size]
+            kp_driving = keypoint_transformation(kp_canonical, he_driving)
+            out = generator(source_image, kp_source=kp_source, kp_driving=kp_driving)
+            yield out['prediction']
+
 class AnimateModel(torch.nn.Module):
     """
     Merge all generator related updates into single model for better multi-gpu usage
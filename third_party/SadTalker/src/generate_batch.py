@@ -1,6 +1,5 @@
 import os
 
-from tqdm import tqdm
 import torch
 import numpy as np
 import random
@@ -48,7 +47,8 @@ def generate_blink_seq_randomly(num_frames):
             break
     return ratio
 
-def get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, still=False, idlemode=False, length_of_audio=False, use_blink=True):
+def get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, still=False, idlemode=False, length_of_audio=False, use_blink=True,
+             audio_features=None):
 
     syncnet_mel_step_size = 16
     fps = 25
@@ -61,22 +61,20 @@ def get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, stil
         num_frames = int(length_of_audio * 25)
         indiv_mels = np.zeros((num_frames, 80, 16))
     else:
-        wav = audio.load_wav(audio_path, 16000) 
-        wav_length, num_frames = parse_audio_length(len(wav), 16000, 25)
-        wav = crop_pad_audio(wav, wav_length)
-        orig_mel = audio.melspectrogram(wav).T
-        spec = orig_mel.copy()         # nframes 80
-        indiv_mels = []
-
-        for i in tqdm(range(num_frames), 'mel:'):
-            start_frame_num = i-2
-            start_idx = int(80. * (start_frame_num / float(fps)))
-            end_idx = start_idx + syncnet_mel_step_size
-            seq = list(range(start_idx, end_idx))
-            seq = [ min(max(item, 0), orig_mel.shape[0]-1) for item in seq ]
-            m = spec[seq, :]
-            indiv_mels.append(m.T)
-        indiv_mels = np.asarray(indiv_mels)         # T 80 16
+        if audio_features is not None:
+            # shared front-end: mel cached per WAV, frame count from the header (a cached mel skips the decode)
+            orig_mel = audio_features.mel(audio_path, fps=fps).T
+            num_frames = int(audio_features.num_samples(audio_path) / (16000 / fps))
+        else:
+            wav = audio.load_wav(audio_path, 16000) 
+            wav_length, num_frames = parse_audio_length(len(wav), 16000, 25)
+            wav = crop_pad_audio(wav, wav_length)
+            orig_mel = audio.melspectrogram(wav).T
+
+        # window i covers mel frames [start_i, start_i + 16), start_i = int(80 * (i-2) / fps), clamped to the clip
+        starts = (80. * ((np.arange(num_frames) - 2) / float(fps))).astype(int)
+        seq = np.clip(starts[:, None] + np.arange(syncnet_mel_step_size), 0, orig_mel.shape[0]-1)
+        indiv_mels = orig_mel[seq].transpose(0, 2, 1)         # T 80 16
 
     ratio = generate_blink_seq_randomly(num_frames)      # T
     source_semantics_path = first_coeff_path
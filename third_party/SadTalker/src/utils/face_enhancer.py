@@ -1,4 +1,5 @@
 import os
+import functools
 import torch 
 
 from gfpgan import GFPGANer
@@ -48,6 +49,95 @@ def enhancer_generator_no_len(images, method='gfpgan', bg_upsampler='realesrgan'
     if not isinstance(images, list) and os.path.isfile(images): # handle video to images
         images = load_video_to_cv2(images)
 
+    restorer = load_restorer(method, bg_upsampler)
+
+    # ------------------------ restore ------------------------
+    for idx in tqdm(range(len(images)), 'Face Enhancer:'):
+        img = cv2.cvtColor(images[idx], cv2.COLOR_RGB2BGR)
+        r_img = enhance_frame(restorer, img)
+        yield cv2.cvtColor(r_img, cv2.COLOR_BGR2RGB)
+
+def enhance_frames(frames, method='gfpgan', bg_upsampler='realesrgan'):
+    """Lazily enhance an iterable of BGR frames (e.g. a render/paste-back stream), yielding BGR frames."""
+    restorer = load_restorer(method, bg_upsampler)
+    for img in frames:
+        yield enhance_frame(restorer, img)
+
+def enhance_frame(restorer, img):
+    # restore faces and background if necessary
+    cropped_faces, restored_faces, r_img = restorer.enhance(
+        img,
+        has_aligned=False,
+        only_center_face=False,
+        paste_back=True)
+    return r_img
+
+@torch.no_grad()
+def enhance_crop_batch(restorer, crops, weight=0.5, landmarks=None):
+    """
+    Restore the faces of several crop images with one GFPGAN forward pass and paste them back into their
+    (upscaled) crops. The background upsampler is not used; the caller enhances the static background
+    once. landmarks (5-point, per face) skips the face detector, e.g. for a still-mode clip.
+    Returns (restored crops, landmarks of the first crop).
+    """
+    from basicsr.utils import img2tensor, tensor2img
+    from torchvision.transforms.functional import normalize
+
+    helper = restorer.face_helper
+    aligned, per_crop, first_landmarks = [], [], None
+    for crop in crops:
+        helper.clean_all()
+        helper.read_image(crop)
+        if landmarks is None:
+            helper.get_face_landmarks_5(only_center_face=False, eye_dist_threshold=5)
+        else:
+            helper.all_landmarks_5 = [lm.copy() for lm in landmarks]
+        if first_landmarks is None:
+            first_landmarks = [lm.copy() for lm in helper.all_landmarks_5]
+        helper.align_warp_face()
+        per_crop.append((list(helper.all_landmarks_5), list(helper.affine_matrices)))
+        aligned.extend(helper.cropped_faces)
+
+    restored = []
+    if aligned:
+        batch = torch.stack([normalize(img2tensor(face / 255., bgr2rgb=True, float32=True), (0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
+                             for face in aligned]).to(restorer.device)
+        output = restorer.gfpgan(batch, return_rgb=False, weight=weight)[0]
+        restored = [tensor2img(o, rgb2bgr=True, min_max=(-1, 1)).astype('uint8') for o in output]
+
+    results, i = [], 0
+    for crop, (crop_landmarks, affine_matrices) in zip(crops, per_crop):
+        helper.clean_all()
+        helper.read_image(crop)
+        helper.all_landmarks_5 = crop_landmarks
+        helper.affine_matrices = affine_matrices
+        for face in restored[i:i + len(affine_matrices)]:
+            helper.add_restored_face(face)
+        i += len(affine_matrices)
+        helper.get_inverse_affine(None)
+        results.append(helper.paste_faces_to_input_image())
+    return results, first_landmarks
+
+def enhance_crop_frames(frames, method='gfpgan', batch_size=8, reuse_landmarks=False):
+    """
+    Lazily enhance a stream of BGR face crops (before paste-back) batch_size at a time. reuse_landmarks
+    aligns every crop with the first crop's landmarks, which is safe when the head doesn't move (still mode).
+    """
+    restorer = load_restorer(method, None)
+    landmarks, batch = None, []
+    for frame in frames:
+        batch.append(frame.copy())
+        if len(batch) == batch_size:
+            out, first = enhance_crop_batch(restorer, batch, landmarks=landmarks)
+            landmarks = first if reuse_landmarks and first else None
+            yield from out
+            batch = []
+    if batch:
+        yield from enhance_crop_batch(restorer, batch, landmarks=landmarks)[0]
+
+@functools.lru_cache(maxsize=4)
+def load_restorer(method='gfpgan', bg_upsampler='realesrgan'):
+    """GFPGAN restorer (+ optional background upsampler); cached, so resident engines load it once."""
     # ------------------------ set up GFPGAN restorer ------------------------
     if  method == 'gfpgan':
         arch = 'clean'
@@ -107,17 +197,4 @@ def enhancer_generator_no_len(images, method='gfpgan', bg_upsampler='realesrgan'
         channel_multiplier=channel_multiplier,
         bg_upsampler=bg_upsampler)
 
-    # ------------------------ restore ------------------------
-    for idx in tqdm(range(len(images)), 'Face Enhancer:'):
-        
-        img = cv2.cvtColor(images[idx], cv2.COLOR_RGB2BGR)
-        
-        # restore faces and background if necessary
-        cropped_faces, restored_faces, r_img = restorer.enhance(
-            img,
-            has_aligned=False,
-            only_center_face=False,
-            paste_back=True)
-        
-        r_img = cv2.cvtColor(r_img, cv2.COLOR_BGR2RGB)
-        yield r_img
+    return restorer
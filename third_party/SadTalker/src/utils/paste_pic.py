@@ -1,66 +1,129 @@
 import cv2, os
 import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import uuid
 
-from src.utils.videoio import save_video_with_watermark 
-
-def paste_pic(video_path, pic_path, crop_info, new_audio_path, full_video_path, extended_crop=False):
+from src.utils.videoio import save_video_with_watermark, iter_video_frames
 
+def load_full_img(pic_path):
     if not os.path.isfile(pic_path):
         raise ValueError('pic_path must be a valid path to video/image file')
     elif pic_path.split('.')[-1] in ['jpg', 'png', 'jpeg']:
         # loader for first frame
-        full_img = cv2.imread(pic_path)
+        return cv2.imread(pic_path)
     else:
         # loader for videos
-        video_stream = cv2.VideoCapture(pic_path)
-        fps = video_stream.get(cv2.CAP_PROP_FPS)
-        full_frames = [] 
-        while 1:
-            still_reading, frame = video_stream.read()
-            if not still_reading:
-                video_stream.release()
-                break 
-            break 
-        full_img = frame
+        return next(iter_video_frames(pic_path))
+
+def paste_box(crop_info, extended_crop=False):
+    """(oy1, oy2, ox1, ox2) of the face crop in the original picture, or None if it wasn't cropped."""
+    if len(crop_info) != 3:
+        return None
+    clx, cly, crx, cry = crop_info[1]
+    lx, ly, rx, ry = crop_info[2]
+    lx, ly, rx, ry = int(lx), int(ly), int(rx), int(ry)
+    if extended_crop:
+        return cly, cry, clx, crx
+    return cly+ly, cly+ry, clx+lx, clx+rx
+
+def scale_crop_info(crop_info, scale):
+    """crop_info for the same picture resized by `scale` (e.g. an upscaled, enhanced background)."""
+    original_size, crop_box, quad = crop_info
+    return (original_size, tuple(int(round(v * scale)) for v in crop_box), tuple(int(round(float(v) * scale)) for v in quad))
+
+def paste_frames(crop_frames, full_img, crop_info, extended_crop=False):
+    """Yield each BGR crop frame blended back into full_img; consumes crop_frames lazily."""
+    oy1, oy2, ox1, ox2 = paste_box(crop_info, extended_crop)
+    for crop_frame in tqdm(crop_frames, 'seamlessClone:'):
+        p = cv2.resize(crop_frame.astype(np.uint8), (ox2-ox1, oy2 - oy1))
+
+        mask = 255*np.ones(p.shape, p.dtype)
+        location = ((ox1+ox2) // 2, (oy1+oy2) // 2)
+        yield cv2.seamlessClone(p, full_img, mask, location, cv2.NORMAL_CLONE)
+
+def feather_mask(h, w, feather=0.08):
+    """(h, w, 1) float32 alpha: 1 inside, ramping to 0 over `feather` of the shorter side at the edges."""
+    ramp = max(1, int(min(h, w) * feather))
+    inner = np.zeros((h, w), np.uint8)
+    inner[1:-1, 1:-1] = 1
+    dist = cv2.distanceTransform(inner, cv2.DIST_L2, 3)
+    return np.clip(dist / ramp, 0, 1).astype(np.float32)[..., None]
+
+class PasteBack:
+    """
+    Paste-back for a static background (still mode): the Poisson colour correction seamlessClone would
+    compute is taken once from the first frame and reused as an offset field, and each frame only
+    blends the face ROI with a cached feathered mask. Per-frame work runs on a small thread pool
+    (cv2 releases the GIL) with a bounded window, so frames are still consumed lazily.
+    """
+
+    def __init__(self, full_img, crop_info, extended_crop=False, feather=0.08, workers=None):
+        self.full_img = full_img
+        self.box = paste_box(crop_info, extended_crop)
+        oy1, oy2, ox1, ox2 = self.box
+        self.size = (ox2 - ox1, oy2 - oy1)
+        self.bg = full_img[oy1:oy2, ox1:ox2].astype(np.float32)
+        self.alpha = feather_mask(oy2 - oy1, ox2 - ox1, feather)
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.offset = None
+
+    def _resize(self, crop_frame):
+        return cv2.resize(crop_frame.astype(np.uint8, copy=False), self.size)
+
+    def _init_offset(self, p):
+        oy1, oy2, ox1, ox2 = self.box
+        mask = 255*np.ones(p.shape, p.dtype)
+        cloned = cv2.seamlessClone(p, self.full_img, mask, ((ox1+ox2) // 2, (oy1+oy2) // 2), cv2.NORMAL_CLONE)
+        # what Poisson blending added to the face; background-dependent, so it holds for every frame
+        self.offset = cloned[oy1:oy2, ox1:ox2].astype(np.float32) - p
+        # pre-blend the constant terms: out = p*alpha + (offset*alpha + bg*(1-alpha))
+        self.base = self.offset * self.alpha + self.bg * (1 - self.alpha)
+
+    def paste(self, crop_frame):
+        p = self._resize(crop_frame)
+        if self.offset is None:
+            self._init_offset(p)
+        oy1, oy2, ox1, ox2 = self.box
+        out = self.full_img.copy()
+        roi = p.astype(np.float32) * self.alpha
+        roi += self.base
+        out[oy1:oy2, ox1:ox2] = np.clip(roi, 0, 255).astype(np.uint8)
+        return out
+
+    def paste_frames(self, crop_frames):
+        frames = iter(crop_frames)
+        first = next(frames, None)
+        if first is None:
+            return
+        yield self.paste(first)  # sets up the offset before any worker runs
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for crop_frame in frames:
+                pending.append(pool.submit(self.paste, crop_frame.copy()))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+def paste_pic(video_path, pic_path, crop_info, new_audio_path, full_video_path, extended_crop=False):
+
+    full_img = load_full_img(pic_path)
     frame_h = full_img.shape[0]
     frame_w = full_img.shape[1]
 
-    video_stream = cv2.VideoCapture(video_path)
-    fps = video_stream.get(cv2.CAP_PROP_FPS)
-    crop_frames = []
-    while 1:
-        still_reading, frame = video_stream.read()
-        if not still_reading:
-            video_stream.release()
-            break
-        crop_frames.append(frame)
-    
-    if len(crop_info) != 3:
+    if paste_box(crop_info, extended_crop) is None:
         print("you didn't crop the image")
         return
-    else:
-        r_w, r_h = crop_info[0]
-        clx, cly, crx, cry = crop_info[1]
-        lx, ly, rx, ry = crop_info[2]
-        lx, ly, rx, ry = int(lx), int(ly), int(rx), int(ry)
-        # oy1, oy2, ox1, ox2 = cly+ly, cly+ry, clx+lx, clx+rx
-        # oy1, oy2, ox1, ox2 = cly+ly, cly+ry, clx+lx, clx+rx
-
-        if extended_crop:
-            oy1, oy2, ox1, ox2 = cly, cry, clx, crx
-        else:
-            oy1, oy2, ox1, ox2 = cly+ly, cly+ry, clx+lx, clx+rx
+
+    video_stream = cv2.VideoCapture(video_path)
+    fps = video_stream.get(cv2.CAP_PROP_FPS)
+    video_stream.release()
 
     tmp_path = str(uuid.uuid4())+'.mp4'
     out_tmp = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*'MP4V'), fps, (frame_w, frame_h))
-    for crop_frame in tqdm(crop_frames, 'seamlessClone:'):
-        p = cv2.resize(crop_frame.astype(np.uint8), (ox2-ox1, oy2 - oy1)) 
-
-        mask = 255*np.ones(p.shape, p.dtype)
-        location = ((ox1+ox2) // 2, (oy1+oy2) // 2)
-        gen_img = cv2.seamlessClone(p, full_img, mask, location, cv2.NORMAL_CLONE)
+    for gen_img in paste_frames(iter_video_frames(video_path), full_img, crop_info, extended_crop):
         out_tmp.write(gen_img)
 
     out_tmp.release()
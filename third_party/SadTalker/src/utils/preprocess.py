@@ -60,7 +60,11 @@ class CropAndExtract():
         self.lm3d_std = load_lm3d(sadtalker_path['dir_of_BFM_fitting'])
         self.device = device
     
-    def generate(self, input_path, save_dir, crop_or_resize='crop', source_image_flag=False, pic_size=256):
+    def generate(self, input_path, save_dir, crop_or_resize='crop', source_image_flag=False, pic_size=256, analysis_cache=None):
+        """
+        analysis_cache: optional FaceAnalysisCache-like object (key/load/save). On a hit the crop png,
+        landmarks and 3DMM .mat are restored into save_dir and crop/landmark/recon models are skipped.
+        """
 
         pic_name = os.path.splitext(os.path.split(input_path)[-1])[0]  
 
@@ -68,6 +72,16 @@ class CropAndExtract():
         coeff_path =  os.path.join(save_dir, pic_name+'.mat')  
         png_path =  os.path.join(save_dir, pic_name+'.png')  
 
+        cache_key = None
+        if analysis_cache is not None and os.path.isfile(input_path):
+            cache_key = analysis_cache.key(input_path, engine='sadtalker', preprocess=crop_or_resize,
+                                           size=pic_size, source_image_flag=source_image_flag)
+            hit = analysis_cache.load(cache_key, save_dir, names={'coeff.mat': pic_name+'.mat', 'crop.png': pic_name+'.png',
+                                                                  'landmarks.txt': pic_name+'_landmarks.txt'})
+            if hit is not None:
+                print(' Using cached face analysis.')
+                return coeff_path, png_path, hit[0]['crop_info']
+
         #load input
         if not os.path.isfile(input_path):
             raise ValueError('input_path must be a valid path to video/image file')
@@ -167,4 +181,10 @@ class CropAndExtract():
 
             savemat(coeff_path, {'coeff_3dmm': semantic_npy, 'full_3dmm': np.array(full_coeffs)[0]})
 
+        if cache_key is not None:
+            files = {'coeff.mat': coeff_path, 'crop.png': png_path}
+            if os.path.isfile(landmarks_path):
+                files['landmarks.txt'] = landmarks_path
+            analysis_cache.save(cache_key, {'crop_info': crop_info}, files)
+
         return coeff_path, png_path, crop_info
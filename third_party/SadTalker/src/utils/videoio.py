@@ -1,21 +1,62 @@
 import shutil
 import uuid
+import subprocess
 
 import os
 
 import cv2
+import numpy as np
 
-def load_video_to_cv2(input_path):
+def iter_video_frames(input_path):
+    """Yield BGR frames one at a time instead of decoding the whole video into memory."""
     video_stream = cv2.VideoCapture(input_path)
-    fps = video_stream.get(cv2.CAP_PROP_FPS)
-    full_frames = [] 
-    while 1:
-        still_reading, frame = video_stream.read()
-        if not still_reading:
-            video_stream.release()
-            break 
-        full_frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-    return full_frames
+    try:
+        while 1:
+            still_reading, frame = video_stream.read()
+            if not still_reading:
+                break
+            yield frame
+    finally:
+        video_stream.release()
+
+def load_video_to_cv2(input_path):
+    return [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in iter_video_frames(input_path)]
+
+def write_video_with_audio(frames, audio, save_path, fps=25, audio_seconds=None, lossless=False):
+    """
+    Encode an iterable of BGR uint8 frames plus the audio track with a single ffmpeg process.
+    Frames are piped as raw video, so only the frame being written is held here. Odd frame
+    sizes are cropped to even (yuv420p); audio_seconds trims the track to the video length.
+    lossless writes FFV1 video + PCM audio (use a .mkv save_path) instead of H.264/AAC.
+    """
+    proc = cmd = None
+    try:
+        for frame in frames:
+            if proc is None:
+                h, w = frame.shape[0] // 2 * 2, frame.shape[1] // 2 * 2
+                cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+                       '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{w}x{h}', '-r', str(float(fps)), '-i', '-']
+                if audio_seconds is not None:
+                    cmd += ['-t', f'{audio_seconds:.3f}']
+                cmd += ['-i', audio, '-map', '0:v', '-map', '1:a']
+                if lossless:
+                    cmd += ['-c:v', 'ffv1', '-c:a', 'pcm_s16le']
+                else:
+                    cmd += ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', '18', '-c:a', 'aac']
+                cmd += ['-ar', '16000', save_path]
+                proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            proc.stdin.write(np.ascontiguousarray(frame[:h, :w]).data)
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its return code below carries the error
+    finally:
+        if proc is not None:
+            proc.stdin.close()
+            ret = proc.wait()
+    if proc is None:
+        raise ValueError(f'No frames to write to {save_path}')
+    if ret != 0:
+        raise subprocess.CalledProcessError(ret, cmd)
+    return save_path
 
 def save_video_with_watermark(video, audio, save_path, watermark=False):
     temp_file = str(uuid.uuid4())+'.mp4'
@@ -0,0 +1,323 @@
+"""
+Library-mode Wav2Lip: keeps the lip-sync model and the S3FD face detector resident across calls
+and writes to caller-supplied output paths, so several scenes (or jobs) can reuse one loaded
+engine without spawning inference.py. inference.py is a thin CLI over this module.
+"""
+import os, sys, shutil, subprocess, tempfile, threading
+import numpy as np
+import cv2, torch
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import audio, face_detection
+from models import Wav2Lip
+
+mel_step_size = 16
+IMAGE_EXTS = ('.jpg', '.png', '.jpeg')
+
+def default_device():
+	return 'cuda' if torch.cuda.is_available() else 'mps' if torch.backends.mps.is_available() else 'cpu'
+
+def get_smoothened_boxes(boxes, T):
+	for i in range(len(boxes)):
+		if i + T > len(boxes):
+			window = boxes[len(boxes) - T:]
+		else:
+			window = boxes[i : i + T]
+		boxes[i] = np.mean(window, axis=0)
+	return boxes
+
+def load_model(path, device):
+	print(f"Load checkpoint from: {path}")
+	if device == 'cuda':
+		checkpoint = torch.load(path, weights_only=False)
+	else:
+		checkpoint = torch.load(path, map_location=torch.device('cpu'), weights_only=False)
+
+	# Case 1: TorchScript model
+	if isinstance(checkpoint, torch.jit.ScriptModule):
+		print("Loaded TorchScript model.")
+		return checkpoint.to(device).eval()
+
+	# Case 2: state_dict checkpoint
+	model = Wav2Lip()
+	s = checkpoint["state_dict"]
+	new_s = {k.replace('module.', ''): v for k, v in s.items()}
+	model.load_state_dict(new_s)
+	return model.to(device).eval()
+
+class MelWindows:
+	"""
+	Per-frame (num_mels, mel_step_size) windows as views into one strided array over the mel.
+	Indexing one frame returns a view; slicing gathers just that batch.
+	"""
+
+	def __init__(self, mel, starts):
+		self.view = np.lib.stride_tricks.sliding_window_view(mel, mel_step_size, axis=1).transpose(1, 0, 2)
+		self.starts = np.asarray(starts)
+
+	def __len__(self):
+		return len(self.starts)
+
+	def __getitem__(self, i):
+		return self.view[self.starts[i]]
+
+	def __iter__(self):
+		return (self.view[s] for s in self.starts)
+
+def mel_chunks_for(mel, fps):
+	# window i starts at int(i * 80/fps); the first one running past the end is replaced by the last full window
+	mel_idx_multiplier = 80./fps
+	n = int(max(0, mel.shape[1] - mel_step_size) / mel_idx_multiplier) + 2
+	starts = (np.arange(n) * mel_idx_multiplier).astype(int)
+	starts = starts[starts + mel_step_size <= mel.shape[1]]
+	return MelWindows(mel, np.append(starts, mel.shape[1] - mel_step_size))
+
+
+class Wav2LipEngine:
+	"""
+	Resident Wav2Lip model + face detector.
+
+	engine = Wav2LipEngine("checkpoints/Wav2Lip-SD-GAN.pt")
+	engine.generate("portrait.jpg", "line.wav", "out.mp4")
+
+	generate() keeps all scratch files in a private temp dir, so concurrent calls don't collide.
+	"""
+
+	def __init__(self, checkpoint_path, device=None, face_det_batch_size=16, wav2lip_batch_size=128,
+				 pads=(0, 10, 0, 0), nosmooth=False, img_size=96):
+		self.device = device or default_device()
+		print('Using {} for inference.'.format(self.device))
+		self.face_det_batch_size = face_det_batch_size
+		self.wav2lip_batch_size = wav2lip_batch_size
+		self.pads = list(pads)
+		self.nosmooth = nosmooth
+		self.img_size = img_size
+		self.model = load_model(checkpoint_path, self.device)
+		print("Model loaded")
+		self.detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D,
+													 flip_input=False, device=self.device)
+		self._detect_lock = threading.Lock()
+
+	def face_detect(self, images, pads=None):
+		batch_size = self.face_det_batch_size
+		while 1:
+			predictions = []
+			try:
+				with self._detect_lock:
+					for i in range(0, len(images), batch_size):
+						predictions.extend(self.detector.get_detections_for_batch(np.array(images[i:i + batch_size])))
+			except RuntimeError:
+				if batch_size == 1:
+					raise RuntimeError('Image too big to run face detection on GPU. Please use the --resize_factor argument')
+				batch_size //= 2
+				print('Recovering from OOM error; New batch size: {}'.format(batch_size))
+				continue
+			break
+
+		results = []
+		pady1, pady2, padx1, padx2 = pads or self.pads
+		for rect, image in zip(predictions, images):
+			if rect is None:
+				raise ValueError('Face not detected! Ensure the video contains a face in all the frames.')
+
+			y1 = max(0, rect[1] - pady1)
+			y2 = min(image.shape[0], rect[3] + pady2)
+			x1 = max(0, rect[0] - padx1)
+			x2 = min(image.shape[1], rect[2] + padx2)
+			results.append([x1, y1, x2, y2])
+
+		boxes = np.array(results)
+		if not self.nosmooth: boxes = get_smoothened_boxes(boxes, T=5)
+		return [[image[y1: y2, x1:x2], (y1, y2, x1, x2)] for image, (x1, y1, x2, y2) in zip(images, boxes)]
+
+	def _batch(self, img_batch, mel_batch):
+		img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
+
+		img_masked = img_batch.copy()
+		img_masked[:, self.img_size//2:] = 0
+
+		img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
+		mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+		return img_batch, mel_batch
+
+	def datagen(self, frames, mels, static=False, box=None):
+		img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+
+		if box is None or box[0] == -1:
+			if not static:
+				face_det_results = self.face_detect(frames) # BGR2RGB for CNN face detection
+			else:
+				face_det_results = self.face_detect([frames[0]])
+		else:
+			print('Using the specified bounding box instead of face detection...')
+			y1, y2, x1, x2 = box
+			face_det_results = [[f[y1: y2, x1:x2], (y1, y2, x1, x2)] for f in frames]
+
+		for i, m in enumerate(mels):
+			idx = 0 if static else i%len(frames)
+			frame_to_save = frames[idx].copy()
+			face, coords = face_det_results[idx].copy()
+
+			face = cv2.resize(face, (self.img_size, self.img_size))
+
+			img_batch.append(face)
+			mel_batch.append(m)
+			frame_batch.append(frame_to_save)
+			coords_batch.append(coords)
+
+			if len(img_batch) >= self.wav2lip_batch_size:
+				yield (*self._batch(img_batch, mel_batch), frame_batch, coords_batch)
+				img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+
+		if len(img_batch) > 0:
+			yield (*self._batch(img_batch, mel_batch), frame_batch, coords_batch)
+
+	def datagen_static(self, frame, mels, box=None):
+		"""
+		Static-portrait generator: the face is detected, cropped, resized and masked once, and each
+		batch only carries mel windows plus the (shared) face input. Yields (img_batch, mel_batch, coords).
+		"""
+		if box is None or box[0] == -1:
+			face, coords = self.face_detect([frame])[0]
+		else:
+			y1, y2, x1, x2 = box
+			face, coords = frame[y1: y2, x1:x2], (y1, y2, x1, x2)
+		face = cv2.resize(face, (self.img_size, self.img_size))
+		face_input, _ = self._batch([face], [mels[0]])
+		face_input = face_input[0].astype(np.float32)
+
+		for i in range(0, len(mels), self.wav2lip_batch_size):
+			chunk = mels[i:i + self.wav2lip_batch_size]
+			img_batch = np.broadcast_to(face_input, (len(chunk),) + face_input.shape)
+			mel_batch = np.asarray(chunk)[..., np.newaxis]
+			yield img_batch, mel_batch, coords
+
+	def _predict(self, img_batch, mel_batch):
+		img_batch = torch.from_numpy(np.ascontiguousarray(np.transpose(img_batch, (0, 3, 1, 2)), dtype=np.float32)).to(self.device)
+		mel_batch = torch.from_numpy(np.ascontiguousarray(np.transpose(mel_batch, (0, 3, 1, 2)), dtype=np.float32)).to(self.device)
+		with torch.no_grad():
+			pred = self.model(mel_batch, img_batch)
+		return (pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.).astype(np.uint8)
+
+	def _open_writer(self, outfile, audio_path, fps, frame_w, frame_h, lossless=False):
+		"""Raw BGR frames on stdin + the driving audio -> final H.264 (or FFV1/PCM if lossless) file, in one ffmpeg process."""
+		os.makedirs(os.path.dirname(os.path.abspath(outfile)), exist_ok=True)
+		if lossless:
+			codec = ['-c:v', 'ffv1', '-c:a', 'pcm_s16le']
+		else:
+			codec = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-pix_fmt', 'yuv420p', '-c:a', 'aac']
+		cmd = ['ffmpeg', '-y', '-loglevel', 'error',
+			   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{frame_w}x{frame_h}', '-r', str(fps), '-i', '-',
+			   '-i', audio_path, '-map', '0:v', '-map', '1:a',
+			   '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+			   *codec, '-shortest', outfile]
+		return subprocess.Popen(cmd, stdin=subprocess.PIPE), cmd
+
+	def read_frames(self, face, fps=25., resize_factor=1, crop=(0, -1, 0, -1), rotate=False):
+		"""Returns (frames, fps, static)."""
+		if not os.path.isfile(face):
+			raise ValueError('face must be a valid path to video/image file')
+		if face.lower().endswith(IMAGE_EXTS):
+			return [cv2.imread(face)], fps, True
+
+		video_stream = cv2.VideoCapture(face)
+		fps = video_stream.get(cv2.CAP_PROP_FPS)
+		print('Reading video frames...')
+		full_frames = []
+		while 1:
+			still_reading, frame = video_stream.read()
+			if not still_reading:
+				video_stream.release()
+				break
+			if resize_factor > 1:
+				frame = cv2.resize(frame, (frame.shape[1]//resize_factor, frame.shape[0]//resize_factor))
+			if rotate:
+				frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+			y1, y2, x1, x2 = crop
+			if x2 == -1: x2 = frame.shape[1]
+			if y2 == -1: y2 = frame.shape[0]
+			full_frames.append(frame[y1:y2, x1:x2])
+		return full_frames, fps, False
+
+	def cached_box(self, face, frame, analysis_cache):
+		"""Padded face box for a still portrait, served from the on-disk analysis cache when possible."""
+		key = analysis_cache.key(face, engine='wav2lip', pads=self.pads, nosmooth=self.nosmooth)
+		hit = analysis_cache.load(key)
+		if hit is not None:
+			return hit[0]['box']
+		box = tuple(int(v) for v in self.face_detect([frame])[0][1])
+		analysis_cache.save(key, {'box': box})
+		return box
+
+	def generate(self, face, audio_path, outfile, fps=25., static=False, box=None, resize_factor=1,
+				 crop=(0, -1, 0, -1), rotate=False, analysis_cache=None, audio_features=None, lossless=False):
+		"""
+		lossless: write FFV1 video + PCM audio (use a .mkv outfile) for an intermediate that is encoded again later.
+		analysis_cache: optional FaceAnalysisCache-like object (key/load/save) for still-image face boxes.
+		audio_features: optional shared front-end with .mel(path); the mel is then decoded/computed once per WAV.
+		"""
+		full_frames, fps, is_image = self.read_frames(face, fps, resize_factor, crop, rotate)
+		static = static or is_image
+		print("Number of frames available for inference: "+str(len(full_frames)))
+		if is_image and analysis_cache is not None and (box is None or box[0] == -1):
+			box = self.cached_box(face, full_frames[0], analysis_cache)
+
+		workdir = tempfile.mkdtemp(prefix="wav2lip_")
+		try:
+			if audio_features is not None:
+				mel = audio_features.mel(audio_path)
+			else:
+				if not audio_path.endswith('.wav'):
+					print('Extracting raw audio...')
+					wav_path = os.path.join(workdir, 'temp.wav')
+					subprocess.run(['ffmpeg', '-y', '-i', audio_path, '-strict', '-2', wav_path], check=True)
+					audio_path = wav_path
+
+				wav = audio.load_wav(audio_path, 16000)
+				mel = audio.melspectrogram(wav)
+			if np.isnan(mel.reshape(-1)).sum() > 0:
+				raise ValueError('Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
+
+			mel_chunks = mel_chunks_for(mel, fps)
+			print("Length of mel chunks: {}".format(len(mel_chunks)))
+			full_frames = full_frames[:len(mel_chunks)]
+
+			frame_h, frame_w = full_frames[0].shape[:-1]
+			proc, cmd = self._open_writer(outfile, audio_path, fps, frame_w, frame_h, lossless)
+			try:
+				if static:
+					# One preallocated canvas: only the face ROI changes between frames
+					canvas = full_frames[0].copy()
+					for img_batch, mel_batch, (y1, y2, x1, x2) in self.datagen_static(canvas, mel_chunks, box):
+						roi = canvas[y1:y2, x1:x2]
+						for p in self._predict(img_batch, mel_batch):
+							roi[:] = cv2.resize(p, (x2 - x1, y2 - y1))
+							proc.stdin.write(canvas.data)
+				else:
+					for img_batch, mel_batch, frames, coords in self.datagen(full_frames.copy(), mel_chunks, static, box):
+						for p, f, c in zip(self._predict(img_batch, mel_batch), frames, coords):
+							y1, y2, x1, x2 = c
+							f[y1:y2, x1:x2] = cv2.resize(p, (x2 - x1, y2 - y1))
+							proc.stdin.write(f.data)
+			except BrokenPipeError:
+				pass  # ffmpeg exited early; its return code below carries the error
+			finally:
+				proc.stdin.close()
+			ret = proc.wait()
+			if ret != 0:
+				raise subprocess.CalledProcessError(ret, cmd)
+		finally:
+			shutil.rmtree(workdir, ignore_errors=True)
+		return outfile
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(checkpoint_path, **kwargs):
+	"""Process-wide engine per (checkpoint, options); the model and detector load on first use only."""
+	key = (os.path.abspath(checkpoint_path), repr(sorted(kwargs.items())))
+	with _engines_lock:
+		if key not in _engines:
+			_engines[key] = Wav2LipEngine(checkpoint_path, **kwargs)
+		return _engines[key]
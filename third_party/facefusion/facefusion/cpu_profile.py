@@ -0,0 +1,145 @@
+import hashlib
+import os
+import platform
+from typing import Dict, List, Optional
+
+import onnxruntime
+
+from facefusion import logger
+
+GRAPH_OPTIMIZATION_LEVELS =\
+{
+	'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+	'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+	'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+	'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+
+
+def parse_pool_values(value : Optional[str]) -> Dict[str, int]:
+	pool_values : Dict[str, int] = {}
+
+	for item in (value or '').split(','):
+		if '=' in item:
+			pool_name, pool_value = item.split('=', 1)
+			pool_values[pool_name.strip()] = int(pool_value)
+		elif item.strip():
+			pool_values['default'] = int(item)
+	return pool_values
+
+
+def get_pool_name(module_name : Optional[str]) -> str:
+	return (module_name or 'default').split('.')[-1]
+
+
+def get_cpu_settings(module_name : Optional[str], execution_thread_count : int = 1) -> Dict[str, object]:
+	"""
+	Per pool CPU settings from the environment:
+	FACEFUSION_CPU_INTRA_THREADS / FACEFUSION_CPU_INTER_THREADS as "4" or "default=2,face_swapper=4",
+	FACEFUSION_GRAPH_OPTIMIZATION (disable, basic, extended, all), FACEFUSION_OPTIMIZED_MODEL_PATH
+	and FACEFUSION_INT8 as a comma separated list of pools to run quantized.
+	"""
+	pool_name = get_pool_name(module_name)
+	intra_threads = parse_pool_values(os.getenv('FACEFUSION_CPU_INTRA_THREADS'))
+	inter_threads = parse_pool_values(os.getenv('FACEFUSION_CPU_INTER_THREADS'))
+	# frames already run on execution_thread_count threads, so each session gets its share of the cores
+	default_intra_threads = max(1, (os.cpu_count() or 1) // max(1, execution_thread_count))
+
+	return\
+	{
+		'intra_op_threads': intra_threads.get(pool_name, intra_threads.get('default', default_intra_threads)),
+		'inter_op_threads': inter_threads.get(pool_name, inter_threads.get('default', 1)),
+		'graph_optimization': os.getenv('FACEFUSION_GRAPH_OPTIMIZATION', 'all'),
+		'optimized_model_path': os.getenv('FACEFUSION_OPTIMIZED_MODEL_PATH', '.caches/optimized'),
+		'int8': pool_name in [ name.strip() for name in os.getenv('FACEFUSION_INT8', '').split(',') ]
+	}
+
+
+def get_model_cache_path(model_path : str, cache_path : str, suffix : str) -> str:
+	model_stat = os.stat(model_path)
+	model_key = '|'.join([ os.path.abspath(model_path), str(model_stat.st_mtime_ns), str(model_stat.st_size), onnxruntime.__version__ ])
+	model_hash = hashlib.sha1(model_key.encode()).hexdigest()[:12]
+	model_name = os.path.splitext(os.path.basename(model_path))[0]
+	return os.path.join(cache_path, model_name + '.' + model_hash + suffix)
+
+
+def quantize_model(model_path : str, cache_path : str) -> Optional[str]:
+	"""Dynamically quantized (INT8 weights) copy of the model, created once in cache_path. None if the model can't be quantized."""
+	int8_model_path = get_model_cache_path(model_path, cache_path, '.int8.onnx')
+
+	if os.path.isfile(int8_model_path):
+		return int8_model_path
+	try:
+		from onnxruntime.quantization import QuantType, quantize_dynamic
+
+		os.makedirs(cache_path, exist_ok = True)
+		temp_model_path = int8_model_path + '.part'
+		quantize_dynamic(model_path, temp_model_path, weight_type = QuantType.QInt8)
+		os.replace(temp_model_path, int8_model_path)
+		return int8_model_path
+	except Exception as exception:
+		# fp16 graphs and some exotic ops cannot be quantized dynamically; stay on the original model
+		logger.warn('INT8 quantization of ' + os.path.basename(model_path) + ' failed: ' + str(exception), __name__)
+		return None
+
+
+def create_cpu_session(model_path : str, cpu_settings : Dict[str, object], providers : List[object]) -> onnxruntime.InferenceSession:
+	"""
+	InferenceSession with explicit thread pools and graph optimization, on the INT8 copy of the model when
+	requested. An INT8 model that fails to load is dropped from the cache and the original model is used.
+	"""
+	cache_path = cpu_settings.get('optimized_model_path')
+
+	if cpu_settings.get('int8') and cache_path:
+		int8_model_path = quantize_model(model_path, cache_path)
+
+		if int8_model_path:
+			try:
+				return load_cpu_session(int8_model_path, cpu_settings, providers)
+			except Exception as exception:
+				# quantized ops missing from this CPU build (ConvInteger, MatMulInteger) or a broken cache file
+				logger.warn('INT8 model ' + os.path.basename(int8_model_path) + ' failed to load, using the original model: ' + str(exception), __name__)
+				if os.path.isfile(int8_model_path):
+					os.remove(int8_model_path)
+	return load_cpu_session(model_path, cpu_settings, providers)
+
+
+def load_cpu_session(model_path : str, cpu_settings : Dict[str, object], providers : List[object]) -> onnxruntime.InferenceSession:
+	"""
+	The optimized graph is written to the cache on first load and later sessions start from it with
+	optimizations off.
+	"""
+	session_options = onnxruntime.SessionOptions()
+	session_options.intra_op_num_threads = int(cpu_settings.get('intra_op_threads'))
+	session_options.inter_op_num_threads = int(cpu_settings.get('inter_op_threads'))
+	session_options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL if int(cpu_settings.get('inter_op_threads')) > 1 else onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+	cache_path = cpu_settings.get('optimized_model_path')
+	graph_optimization = str(cpu_settings.get('graph_optimization'))
+	session_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS.get(graph_optimization, GRAPH_OPTIMIZATION_LEVELS.get('all'))
+
+	optimized_model_path = None
+
+	if cache_path and graph_optimization != 'disable':
+		optimized_model_path = get_model_cache_path(model_path, cache_path, '.' + graph_optimization + '.' + platform.machine() + '.onnx')
+
+		if os.path.isfile(optimized_model_path):
+			model_path = optimized_model_path
+			session_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS.get('disable')
+			optimized_model_path = None
+		else:
+			os.makedirs(cache_path, exist_ok = True)
+			session_options.optimized_model_filepath = optimized_model_path + '.' + str(os.getpid()) + '.part'
+	try:
+		inference_session = onnxruntime.InferenceSession(model_path, sess_options = session_options, providers = providers)
+	except Exception:
+		if optimized_model_path and os.path.isfile(session_options.optimized_model_filepath):
+			os.remove(session_options.optimized_model_filepath)
+		raise
+
+	if optimized_model_path and os.path.isfile(session_options.optimized_model_filepath):
+		os.replace(session_options.optimized_model_filepath, optimized_model_path)
+	return inference_session
+
+
+def is_cpu_profile(execution_providers : List[str]) -> bool:
+	return os.getenv('FACEFUSION_CPU_PROFILE') == '1' and list(execution_providers) == [ 'cpu' ]
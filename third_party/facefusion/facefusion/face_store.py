@@ -1,28 +1,183 @@
-from typing import List, Optional
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 
-from facefusion.hash_helper import create_hash
+from facefusion import state_manager
 from facefusion.types import Face, FaceStore, VisionFrame
 
 FACE_STORE : FaceStore =\
 {
-	'static_faces': {}
+	'static_faces': OrderedDict()
 }
+FACE_STORE_LOCK = threading.Lock()
+FACE_STORE_SIZE = int(os.getenv('FACEFUSION_FACE_STORE_SIZE', '512'))
+FACE_STORE_PATH : Optional[str] = os.getenv('FACEFUSION_FACE_STORE_PATH')
+FACE_STORE_DISK_SIZE = int(float(os.getenv('FACEFUSION_FACE_STORE_DISK_MB', '256')) * 1024 * 1024)
+FACE_STORE_DISK_LOCK = threading.Lock()
+FACE_STORE_DISK_BYTES : Optional[int] = None
+STATIC_IMAGE_SOURCES = {}
 
 
 def get_face_store() -> FaceStore:
 	return FACE_STORE
 
 
+def set_face_store_path(face_store_path : Optional[str]) -> None:
+	global FACE_STORE_PATH, FACE_STORE_DISK_BYTES
+
+	FACE_STORE_PATH = face_store_path
+	FACE_STORE_DISK_BYTES = None
+
+
+def register_static_image(image_path : str, vision_frame : VisionFrame) -> None:
+	# keyed by file content, not path + mtime: targets are read from a fresh temp copy on every run
+	if vision_frame is not None and os.path.isfile(image_path):
+		with open(image_path, 'rb') as image_file:
+			image_digest = hashlib.sha1(image_file.read()).hexdigest()
+		STATIC_IMAGE_SOURCES[id(vision_frame)] = (weakref.ref(vision_frame), image_digest)
+
+
+def get_detector_settings() -> str:
+	return '|'.join(str(state_manager.get_item(key)) for key in [ 'face_detector_model', 'face_detector_size', 'face_detector_angles', 'face_detector_score', 'face_landmarker_model', 'face_landmarker_score' ])
+
+
+def create_vision_hash(vision_frame : VisionFrame) -> str:
+	static_source = STATIC_IMAGE_SOURCES.get(id(vision_frame))
+
+	if static_source and static_source[0]() is vision_frame:
+		content_key = 'file:' + static_source[1]
+	else:
+		# persisted across runs, so a cryptographic digest rather than crc32: a collision would serve wrong faces forever
+		frame_buffer = memoryview(vision_frame).cast('B') if vision_frame.flags.c_contiguous else vision_frame.tobytes()
+		content_key = 'frame:' + hashlib.blake2b(frame_buffer, digest_size = 20).hexdigest() + ':' + str(vision_frame.shape)
+	return hashlib.sha1((content_key + '#' + get_detector_settings()).encode()).hexdigest()
+
+
 def get_static_faces(vision_frame : VisionFrame) -> Optional[List[Face]]:
-	vision_hash = create_hash(vision_frame.tobytes())
-	return FACE_STORE.get('static_faces').get(vision_hash)
+	vision_hash = create_vision_hash(vision_frame)
+
+	with FACE_STORE_LOCK:
+		static_faces = FACE_STORE.get('static_faces')
+		if vision_hash in static_faces:
+			static_faces.move_to_end(vision_hash)
+			return static_faces.get(vision_hash)
+	faces = read_static_faces(vision_hash)
+	if faces:
+		store_static_faces(vision_hash, faces)
+	return faces
 
 
 def set_static_faces(vision_frame : VisionFrame, faces : List[Face]) -> None:
-	vision_hash = create_hash(vision_frame.tobytes())
+	vision_hash = create_vision_hash(vision_frame)
 	if vision_hash:
-		FACE_STORE['static_faces'][vision_hash] = faces
+		store_static_faces(vision_hash, faces)
+		write_static_faces(vision_hash, faces)
+
+
+def store_static_faces(vision_hash : str, faces : List[Face]) -> None:
+	with FACE_STORE_LOCK:
+		static_faces = FACE_STORE.get('static_faces')
+		static_faces[vision_hash] = faces
+		static_faces.move_to_end(vision_hash)
+		while len(static_faces) > FACE_STORE_SIZE:
+			static_faces.popitem(last = False)
+
+
+def get_static_faces_path(vision_hash : str) -> Optional[str]:
+	if FACE_STORE_PATH:
+		return os.path.join(FACE_STORE_PATH, vision_hash[:2], vision_hash + '.pkl')
+	return None
+
+
+def read_static_faces(vision_hash : str) -> Optional[List[Face]]:
+	static_faces_path = get_static_faces_path(vision_hash)
+
+	if static_faces_path:
+		try:
+			with open(static_faces_path, 'rb') as static_faces_file:
+				faces = pickle.load(static_faces_file)
+			# the mtime is the last use, for eviction
+			os.utime(static_faces_path)
+			return faces
+		except (OSError, EOFError, pickle.UnpicklingError):
+			return None
+	return None
+
+
+def write_static_faces(vision_hash : str, faces : List[Face]) -> None:
+	global FACE_STORE_DISK_BYTES
+
+	static_faces_path = get_static_faces_path(vision_hash)
+
+	if static_faces_path and not os.path.exists(static_faces_path):
+		os.makedirs(os.path.dirname(static_faces_path), exist_ok = True)
+		file_descriptor, temp_path = tempfile.mkstemp(dir = os.path.dirname(static_faces_path), suffix = '.part')
+		try:
+			with os.fdopen(file_descriptor, 'wb') as temp_file:
+				pickle.dump(faces, temp_file)
+			os.replace(temp_path, static_faces_path)
+		finally:
+			if os.path.exists(temp_path):
+				os.remove(temp_path)
+
+		with FACE_STORE_DISK_LOCK:
+			if FACE_STORE_DISK_BYTES is None:
+				FACE_STORE_DISK_BYTES = sum(size for _, size, _ in scan_static_faces())
+			else:
+				FACE_STORE_DISK_BYTES += os.path.getsize(static_faces_path)
+			if FACE_STORE_DISK_BYTES > FACE_STORE_DISK_SIZE:
+				evict_static_faces()
+
+
+def scan_static_faces() -> List[Tuple[float, int, str]]:
+	static_faces_entries = []
+
+	if FACE_STORE_PATH:
+		for static_faces_path in glob.glob(os.path.join(FACE_STORE_PATH, '*', '*.pkl')):
+			try:
+				static_faces_stat = os.stat(static_faces_path)
+				static_faces_entries.append((static_faces_stat.st_mtime, static_faces_stat.st_size, static_faces_path))
+			except FileNotFoundError:
+				continue
+	return static_faces_entries
+
+
+def evict_static_faces() -> None:
+	"""Delete the least recently used persisted entries until the store fits FACEFUSION_FACE_STORE_DISK_MB. Caller holds FACE_STORE_DISK_LOCK."""
+	global FACE_STORE_DISK_BYTES
+
+	static_faces_entries = scan_static_faces()
+	total_size = sum(size for _, size, _ in static_faces_entries)
+
+	for _, size, static_faces_path in sorted(static_faces_entries):
+		if total_size <= FACE_STORE_DISK_SIZE:
+			break
+		try:
+			os.remove(static_faces_path)
+		except FileNotFoundError:
+			pass
+		total_size -= size
+	FACE_STORE_DISK_BYTES = total_size
 
 
 def clear_static_faces() -> None:
-	FACE_STORE['static_faces'].clear()
+	global FACE_STORE_DISK_BYTES
+
+	with FACE_STORE_LOCK:
+		FACE_STORE['static_faces'].clear()
+	for key, static_source in list(STATIC_IMAGE_SOURCES.items()):
+		if static_source[0]() is None:
+			STATIC_IMAGE_SOURCES.pop(key, None)
+	with FACE_STORE_DISK_LOCK:
+		for _, _, static_faces_path in scan_static_faces():
+			try:
+				os.remove(static_faces_path)
+			except FileNotFoundError:
+				pass
+		FACE_STORE_DISK_BYTES = 0 if FACE_STORE_PATH else None
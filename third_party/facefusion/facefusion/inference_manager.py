@@ -1,12 +1,13 @@
 import importlib
 import random
 from time import sleep, time
-from typing import List
+from typing import List, Optional
 
 from onnxruntime import InferenceSession
 
 from facefusion import logger, process_manager, state_manager, wording
 from facefusion.app_context import detect_app_context
+from facefusion.cpu_profile import create_cpu_session, get_cpu_settings, is_cpu_profile
 from facefusion.execution import create_inference_session_providers
 from facefusion.exit_helper import fatal_exit
 from facefusion.filesystem import get_file_name, is_file
@@ -35,19 +36,19 @@ def get_inference_pool(module_name : str, model_names : List[str], model_source_
 		if app_context == 'ui' and INFERENCE_POOL_SET.get('cli').get(inference_context):
 			INFERENCE_POOL_SET['ui'][inference_context] = INFERENCE_POOL_SET.get('cli').get(inference_context)
 		if not INFERENCE_POOL_SET.get(app_context).get(inference_context):
-			INFERENCE_POOL_SET[app_context][inference_context] = create_inference_pool(model_source_set, execution_device_id, execution_providers)
+			INFERENCE_POOL_SET[app_context][inference_context] = create_inference_pool(model_source_set, execution_device_id, execution_providers, module_name)
 
 	current_inference_context = get_inference_context(module_name, model_names, random.choice(execution_device_ids), execution_providers)
 	return INFERENCE_POOL_SET.get(app_context).get(current_inference_context)
 
 
-def create_inference_pool(model_source_set : DownloadSet, execution_device_id : str, execution_providers : List[ExecutionProvider]) -> InferencePool:
+def create_inference_pool(model_source_set : DownloadSet, execution_device_id : str, execution_providers : List[ExecutionProvider], module_name : Optional[str] = None) -> InferencePool:
 	inference_pool : InferencePool = {}
 
 	for model_name in model_source_set.keys():
 		model_path = model_source_set.get(model_name).get('path')
 		if is_file(model_path):
-			inference_pool[model_name] = create_inference_session(model_path, execution_device_id, execution_providers)
+			inference_pool[model_name] = create_inference_session(model_path, execution_device_id, execution_providers, module_name)
 
 	return inference_pool
 
@@ -64,13 +65,17 @@ def clear_inference_pool(module_name : str, model_names : List[str]) -> None:
 			del INFERENCE_POOL_SET[app_context][inference_context]
 
 
-def create_inference_session(model_path : str, execution_device_id : str, execution_providers : List[ExecutionProvider]) -> InferenceSession:
+def create_inference_session(model_path : str, execution_device_id : str, execution_providers : List[ExecutionProvider], module_name : Optional[str] = None) -> InferenceSession:
 	model_file_name = get_file_name(model_path)
 	start_time = time()
 
 	try:
 		inference_session_providers = create_inference_session_providers(execution_device_id, execution_providers)
-		inference_session = InferenceSession(model_path, providers = inference_session_providers)
+		if is_cpu_profile(execution_providers):
+			cpu_settings = get_cpu_settings(module_name, state_manager.get_item('execution_thread_count') or 1)
+			inference_session = create_cpu_session(model_path, cpu_settings, inference_session_providers)
+		else:
+			inference_session = InferenceSession(model_path, providers = inference_session_providers)
 		logger.debug(wording.get('loading_model_succeeded').format(model_name = model_file_name, seconds = calculate_end_time(start_time)), __name__)
 		return inference_session
 
@@ -1,4 +1,4 @@
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, TypeAlias, TypedDict
 
 import cv2
@@ -44,7 +44,7 @@ Face = namedtuple('Face',
 	'age',
 	'race'
 ])
-FaceSet : TypeAlias = Dict[str, List[Face]]
+FaceSet : TypeAlias = 'OrderedDict[str, List[Face]]'
 FaceStore = TypedDict('FaceStore',
 {
 	'static_faces' : FaceSet
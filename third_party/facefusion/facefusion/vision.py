@@ -7,6 +7,7 @@ import numpy
 from cv2.typing import Size
 
 from facefusion.common_helper import is_windows
+from facefusion.face_store import register_static_image
 from facefusion.filesystem import get_file_extension, is_image, is_video
 from facefusion.thread_helper import thread_semaphore
 from facefusion.types import Duration, Fps, Orientation, Resolution, Scale, VisionFrame
@@ -24,7 +25,9 @@ def read_static_images(image_paths : List[str]) -> List[VisionFrame]:
 
 @lru_cache(maxsize = 1024)
 def read_static_image(image_path : str) -> Optional[VisionFrame]:
-	return read_image(image_path)
+	vision_frame = read_image(image_path)
+	register_static_image(image_path, vision_frame)
+	return vision_frame
 
 
 def read_image(image_path : str) -> Optional[VisionFrame]:
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Runs many (source, target, output) swaps in one process, so the processor models load once.
+
+	python swap_batch.py pairs.json results.json headless-run --processors face_swapper ...
+
+pairs.json is a list of {"id", "source", "target", "output"}. Takes the usual headless-run options
+(minus -s/-t/-o); every pair becomes its own job in that --jobs-path, so one failure doesn't stop
+the rest. results.json maps each id to true/false.
+"""
+import json
+import os
+import sys
+
+os.environ['OMP_NUM_THREADS'] = '1'
+
+from facefusion import core, logger, state_manager
+from facefusion.args import apply_args, reduce_step_args
+from facefusion.exit_helper import hard_exit
+from facefusion.jobs import job_manager, job_runner
+from facefusion.program import create_program
+from facefusion.program_helper import validate_args
+
+
+def main() -> None:
+	pairs_path, results_path = sys.argv[1], sys.argv[2]
+	sys.argv = [ sys.argv[0] ] + sys.argv[3:]
+
+	if not core.pre_check():
+		hard_exit(2)
+	program = create_program()
+
+	if not validate_args(program):
+		hard_exit(2)
+	args = vars(program.parse_args())
+	apply_args(args, state_manager.init_item)
+	logger.init(state_manager.get_item('log_level'))
+
+	if not job_manager.init_jobs(state_manager.get_item('jobs_path')):
+		hard_exit(1)
+	with open(pairs_path, 'r', encoding = 'utf-8') as pairs_file:
+		pairs = json.load(pairs_file)
+	results = {}
+
+	for pair in pairs:
+		job_id = 'swap-' + pair.get('id')
+		step_args = reduce_step_args(args)
+		step_args['source_paths'] = [ pair.get('source') ]
+		step_args['target_path'] = pair.get('target')
+		step_args['output_path'] = pair.get('output')
+		results[pair.get('id')] = job_manager.create_job(job_id) and job_manager.add_step(job_id, step_args) and job_manager.submit_job(job_id) and job_runner.run_job(job_id, core.process_step)
+
+	with open(results_path, 'w', encoding = 'utf-8') as results_file:
+		json.dump(results, results_file)
+	hard_exit(0 if all(results.values()) else 1)
+
+
+if __name__ == '__main__':
+	main()
@@ -1,8 +1,17 @@
 from flask import Flask, request, render_template, jsonify
-import os, uuid, pathlib, subprocess, sys
-import datetime
+import os, pathlib, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('SADTALKER_PATH', ROOT + "/third_party/SadTalker")
+os.environ.setdefault('FACEFUSION_PATH', ROOT + "/third_party/facefusion")
+
+from app.jobs import QueueFull, default_job_queue
 
 app = Flask(__name__)
+# Renders run on warm in-process workers (engines stay loaded between jobs); uploads beyond the
+# queue limit get 429 instead of spawning another generate.py.
+jobs = default_job_queue()
 
 @app.route("/", methods=["GET"])
 def index():
@@ -12,25 +21,41 @@ def index():
 def generate():
     if "spec" not in request.files:
         return "Upload a spec.json", 400
-    job_id = datetime.datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
-    workdir = pathlib.Path(f"runs/{job_id}")
-    workdir.mkdir(parents=True, exist_ok=True)
-    spec_fp = workdir/"spec.json"
-    request.files["spec"].save(spec_fp)
+    upload = request.files["spec"]
+    try:
+        job = jobs.submit(upload.save)
+    except QueueFull as e:
+        return jsonify({"error": "queue full", "detail": str(e)}), 429, {"Retry-After": "30"}
+    return jsonify({**job.to_dict(), "status_url": f"/jobs/{job.id}"}), 202
+
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    return jsonify({"jobs": jobs.list(), "counts": jobs.counts()})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify(jobs.metrics())
 
-    out_mp4 = workdir/"out.mp4"
-    # Fire-and-forget (no progress piping in this minimal version)
-    python_executable = sys.executable
-    subprocess.Popen([python_executable, "generate.py", "--spec", str(spec_fp), "--out", str(out_mp4), "--workdir", str(workdir)])
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None: return ("Not found", 404)
+    return jsonify(job.to_dict())
 
-    return jsonify({"job_id": job_id, "out": str(out_mp4)})
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None: return ("Not found", 404)
+    return jsonify(job.to_dict())
 
 @app.route("/outputs/<job_id>", methods=["GET"])
 def outputs(job_id):
-    p = pathlib.Path("runs")/job_id
-    if not p.exists(): return ("Not found", 404)
+    job = jobs.get(job_id)
+    p = pathlib.Path(job.workdir) if job else jobs.root/job_id
+    if not p.is_dir(): return ("Not found", 404)
     items = [str(x) for x in p.glob("*")]
-    return jsonify({"job_id": job_id, "files": items})
+    return jsonify({**(job.to_dict() if job else {"job_id": job_id}), "files": items})
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5000, debug=True)
+    # no reloader: it would start a second process with its own workers and queue
+    app.run(host="127.0.0.1", port=5000, debug=True, use_reloader=False)